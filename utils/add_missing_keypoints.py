@@ -1,7 +1,15 @@
 ## Changes the coordinates of keypoints that have not been predicted during inference
 ## Puts them above the bounding box, which makes it faster to correct in CVAT
+##   python add_missing_keypoints.py predictions.xml predictions_added_keypoints.xml [--groups groups.json] [--workers 4]
 
+import argparse
+import io
+import json
+import os
+import re
 import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 groups = [
     ["nose", "left_eye", "left_ear_tip", "left_ear_base", "head_midpoint"],
@@ -15,34 +23,299 @@ groups = [
     ["front_right_shoulder", "front_right_elbow", "front_right_paw", "front_right_wrist"],
 ]
 
-input_file = "/Users/jonasmucke/Downloads/predictions_250703_100551.xml"
-output_file = "/Users/jonasmucke/Downloads/predictions_side75_added_keypoints.xml"
+GROUP_SPACING_X = 40
+POINT_SPACING_Y = 15
+EMPTY_POINTS = {"0.0,0.0", "0.00,0.00"}
 
-tree = ET.parse(input_file)
-root = tree.getroot()
 
-for image in root.findall('image'):
+def load_groups(path):
+    """
+    Read keypoint groups from a JSON file: a list of label lists,
+    or an object mapping group names to label lists (file order is kept).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    if isinstance(cfg, dict):
+        cfg = list(cfg.values())
+    return [list(g) for g in cfg]
+
+
+def build_lookup(groups):
+    """
+    Map each label to its group index, so every point is classified with one dict lookup.
+    """
+    lookup = {}
+    for group_idx, group in enumerate(groups):
+        for label in group:
+            lookup.setdefault(label, group_idx)
+    return lookup
+
+
+def fix_image(image, lookup, n_groups):
+    """
+    Move the missing keypoints of one <image> above its bounding box, one column
+    per group and one row per missing point. Returns the number of points moved.
+    """
     box = image.find('box[@label="Bounding Box"]')
     if box is None:
-        continue
+        return 0
 
     xtl = float(box.attrib['xtl'])
     ytl = float(box.attrib['ytl'])
 
+    moved = 0
     for skeleton in image.findall('skeleton'):
-        # For each group
-        for group_idx, group in enumerate(groups):
-            group_x = xtl + group_idx * 40
-            group_y = ytl
-            missing = [
-                kp for kp in skeleton.findall('points')
-                if kp.attrib['label'] in group
-                and kp.attrib.get('outside', '0') == '1'
-                and kp.attrib.get('points', '0.0,0.0').replace(" ", "") in ['0.0,0.0', '0.00,0.00']
-            ]
-            for j, kp in enumerate(missing):
-                kp.set('points', f"{group_x:.2f},{group_y - 15*j:.2f}")
-                kp.set('outside', '1')  # keep hidden!
-
-tree.write(output_file, encoding='utf-8', xml_declaration=True)
-print(f"Saved to {output_file}")
+        # next free slot per group, filled in document order
+        slots = [0] * n_groups
+        for kp in skeleton.findall('points'):
+            group_idx = lookup.get(kp.attrib.get('label'))
+            if group_idx is None or kp.attrib.get('outside', '0') != '1':
+                continue
+            if kp.attrib.get('points', '0.0,0.0').replace(" ", "") not in EMPTY_POINTS:
+                continue
+            j = slots[group_idx]
+            slots[group_idx] += 1
+            group_x = xtl + group_idx * GROUP_SPACING_X
+            kp.set('points', f"{group_x:.2f},{ytl - POINT_SPACING_Y * j:.2f}")
+            kp.set('outside', '1')  # keep hidden!
+            moved += 1
+    return moved
+
+
+class _RangeReader:
+    """
+    File-like view of input_file[start:end] framed by `prefix` and `suffix`,
+    so a byte range of image elements can be fed to iterparse as a document.
+    """
+
+    def __init__(self, path, start, end, prefix=b"", suffix=b""):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self._left = end - start
+        self._pending = [prefix, None, suffix]
+
+    def read(self, size=-1):
+        while self._pending:
+            if self._pending[0] is None:
+                data = self._f.read(self._left if size < 0 else min(size, self._left))
+                self._left -= len(data)
+                if data:
+                    return data
+                self._f.close()
+                self._pending.pop(0)
+                continue
+            data = self._pending.pop(0)
+            if data:
+                return data
+        return b""
+
+
+def iter_children(source):
+    """
+    Stream the direct children of the document root with iterparse.
+    First yields (root, None) once the root start tag and its leading text are known,
+    then (root, child) for every complete child, including its tail. A child is
+    yielded only once the next one has finished (its tail is parsed late) and is
+    removed from the root afterwards, so memory stays constant.
+    """
+    root = None
+    prev = None
+    depth = 0
+    announced = False
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if root is None:
+                root = elem
+            elif depth == 2 and not announced:
+                announced = True
+                yield root, None
+        else:
+            depth -= 1
+            if depth == 1:
+                if prev is not None:
+                    yield root, prev
+                    root.remove(prev)
+                prev = elem
+    if root is not None and not announced:
+        yield root, None
+    if prev is not None:
+        yield root, prev
+        root.remove(prev)
+
+
+def _start_tag(elem):
+    attrs = "".join(
+        f' {k}="{v}"' for k, v in
+        ((k, v.replace("&", "&amp;").replace('"', "&quot;").replace("<", "&lt;"))
+         for k, v in elem.attrib.items())
+    )
+    return f"<{elem.tag}{attrs}>"
+
+
+def _find_tag(f, pos, tag=b"<image", block=1 << 20):
+    """
+    Offset of the first `tag` start tag at or after `pos`, or None.
+    """
+    overlap = len(tag)
+    while True:
+        f.seek(pos)
+        data = f.read(block + overlap)
+        i = data.find(tag)
+        while i != -1 and i + overlap < len(data):
+            if data[i + overlap:i + overlap + 1] in (b" ", b">", b"/", b"\n", b"\t", b"\r"):
+                return pos + i
+            i = data.find(tag, i + 1)
+        if len(data) <= overlap:
+            return None
+        pos += block
+
+
+def shard_offsets(input_file, shard_bytes):
+    """
+    Split the image section of the file into byte ranges that each start at an
+    <image> start tag. Shard i is offsets[i]:offsets[i+1]; the last offset is the
+    closing root tag. Returns None if there are no images.
+    """
+    size = os.path.getsize(input_file)
+    with open(input_file, "rb") as f:
+        first = _find_tag(f, 0)
+        if first is None:
+            return None
+        f.seek(max(0, size - 4096))
+        tail = f.read()
+        root_end = size - len(tail) + tail.rfind(b"</")
+        offsets = [first]
+        pos = first + shard_bytes
+        while pos < root_end:
+            nxt = _find_tag(f, pos)
+            if nxt is None or nxt >= root_end:
+                break
+            offsets.append(nxt)
+            pos = nxt + shard_bytes
+        offsets.append(root_end)
+    return offsets
+
+
+def _fix_shard(input_file, start, end, groups):
+    """
+    Worker: iterparse one byte range of <image> elements, fix and serialize them.
+    """
+    lookup = build_lookup(groups)
+    out = []
+    n_images = 0
+    moved = 0
+    source = _RangeReader(input_file, start, end, b"<shard>", b"</shard>")
+    for _, child in iter_children(source):
+        # shards start at a tag, so the wrapper has no leading text to keep
+        if child is None:
+            continue
+        if child.tag == "image":
+            n_images += 1
+            moved += fix_image(child, lookup, len(groups))
+        out.append(ET.tostring(child, encoding="unicode"))
+    return "".join(out), n_images, moved
+
+
+def _write_header(out, input_file, end):
+    """
+    Serialize everything before the first <image> (declaration, root start tag,
+    version, meta) the same way the serial path does.
+    """
+    with open(input_file, "rb") as f:
+        head = f.read(end)
+    # closing the root right after the header makes it a complete document
+    root_tag = re.search(rb"<(?![?!])([^\s>/]+)", head).group(1)
+    source = io.BytesIO(head + b"</" + root_tag + b">")
+    for root, child in iter_children(source):
+        if child is None:
+            out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            out.write(_start_tag(root))
+            out.write(root.text or "")
+        else:
+            out.write(ET.tostring(child, encoding="unicode"))
+    return root_tag.decode()
+
+
+def _add_missing_keypoints_sharded(input_file, out, groups, workers, shard_bytes):
+    offsets = shard_offsets(input_file, shard_bytes)
+    if offsets is None:
+        return None
+    root_tag = _write_header(out, input_file, offsets[0])
+
+    n_images = 0
+    moved = 0
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+
+        def drain(limit):
+            nonlocal n_images, moved
+            while len(pending) > limit:
+                text, n, m = pending.popleft().result()
+                out.write(text)
+                n_images += n
+                moved += m
+
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            pending.append(pool.submit(_fix_shard, input_file, start, end, groups))
+            # bound the number of shards in flight so memory stays flat
+            drain(2 * workers)
+        drain(0)
+    out.write(f"</{root_tag}>")
+    return n_images, moved
+
+
+def add_missing_keypoints(input_file, output_file, groups=groups, workers=1, shard_bytes=8 << 20):
+    """
+    Streaming rewrite of a CVAT predictions XML: each <image> is fixed as soon as it
+    has been parsed and then dropped, so memory does not grow with the file.
+    With workers > 1 the image section is split into byte ranges of about
+    `shard_bytes` (always cut at an <image> tag) that are parsed and fixed in a
+    process pool and written back in order. Returns (images, points moved).
+    """
+    with open(output_file, "w", encoding="utf-8") as out:
+        result = None
+        if workers > 1:
+            result = _add_missing_keypoints_sharded(input_file, out, groups, workers, shard_bytes)
+        if result is None:
+            result = _add_missing_keypoints_serial(input_file, out, groups)
+    n_images, moved = result
+    print(f"Saved to {output_file} ({n_images} images, {moved} keypoints moved)")
+    return n_images, moved
+
+
+def _add_missing_keypoints_serial(input_file, out, groups):
+    lookup = build_lookup(groups)
+    n_images = 0
+    moved = 0
+    root = None
+    for root, child in iter_children(input_file):
+        if child is None:
+            out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            out.write(_start_tag(root))
+            out.write(root.text or "")
+            continue
+        if child.tag == "image":
+            n_images += 1
+            moved += fix_image(child, lookup, len(groups))
+        out.write(ET.tostring(child, encoding="unicode"))
+    if root is not None:
+        out.write(f"</{root.tag}>")
+    return n_images, moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Place undetected keypoints above the bounding box for CVAT correction.")
+    parser.add_argument("input_file", help="CVAT predictions XML")
+    parser.add_argument("output_file", help="where to write the fixed XML")
+    parser.add_argument("--groups", help="JSON file with keypoint groups (default: built-in RatSkeleton groups)")
+    parser.add_argument("--workers", type=int, default=1, help="processes used to fix images (default: 1)")
+    parser.add_argument("--shard-mb", type=float, default=8, help="approximate size of each worker's byte range in MB")
+    args = parser.parse_args(argv)
+
+    kp_groups = load_groups(args.groups) if args.groups else groups
+    add_missing_keypoints(args.input_file, args.output_file, kp_groups, args.workers, int(args.shard_mb * (1 << 20)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+## Canonical annotation set shared by the conversion tools: keypoints as a float64
+## (frames, keypoints, 2) array with a visibility mask, bounding boxes as (frames, 4),
+## filenames/subject IDs as columns. Loads and writes the wide annotations.csv, CVAT XML
+## and DLC CollectedData layouts, and has its own memory-mapped store (.annset folder
+## with .npy arrays + a Parquet frame table, e.g. annotations.csv.annset), so conversions
+## parse text only once.
+##   python annotations.py Rat/top/annotations.csv Rat/top/annotations.xml --meta annotations_meta.xml
+##   python annotations.py Rat/top/annotations.xml Rat/top/annotations.annset
+##   python annotations.py Rat/top/annotations.csv --to-dlc Rat/top --view top --animal rat
+
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from csv_to_xml import BBOX_COLUMNS, DEFAULT_SIZE, DEFAULT_TASK_ID, write_image_batches
+from dlc_project_converter import (collected_data_columns, create_dlc_structure, extract_id,
+                                   read_project_store)
+from xml_to_csv import read_cvat_xml
+
+STORE_SUFFIX = ".annset"
+STORE_VERSION = 2     # 2: float64 coordinates (1 stored float32)
+XML_BATCH_ROWS = 8192
+
+
+def keypoint_columns(keypoints):
+    return [f"{kp}-{axis}" for kp in keypoints for axis in ("x", "y")]
+
+
+def keypoints_in_columns(columns):
+    """
+    Keypoint names in column order, from '<kp>-x' columns (bbox_* excluded).
+    """
+    names = []
+    for col in columns:
+        if col.endswith("-x") and not col.startswith("bbox_") and col[:-2] not in names:
+            names.append(col[:-2])
+    return names
+
+
+def _as_text(a):
+    """
+    float64 array -> strings as pandas writes them to CSV ('' for NaN).
+    """
+    a = np.asarray(a, dtype=np.float64)
+    return np.where(np.isnan(a), "", a.astype(str))
+
+
+class Annotations:
+    """
+    One set of annotated frames.
+
+    filenames  (n,) str
+    keypoints  list of K keypoint names
+    coords     (n, K, 2) float64, NaN where a coordinate is not labeled
+    visible    (n, K) bool, True where both x and y are labeled
+    bbox       (n, 4) float64 as xtl, ytl, xbr, ybr; NaN where there is no box
+    extra      DataFrame of any other per-frame columns (e.g. cluster, tsne1)
+    columns    column order of the source table, reused when writing a table
+    """
+
+    def __init__(self, filenames, keypoints, coords, visible=None, bbox=None, extra=None, columns=None):
+        self.filenames = np.asarray(filenames, dtype=object)
+        self.keypoints = list(keypoints)
+        n, k = len(self.filenames), len(self.keypoints)
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(n, k, 2)
+        self.visible = (np.isfinite(self.coords).all(axis=2) if visible is None
+                        else np.asarray(visible, dtype=bool))
+        self.bbox = (np.full((n, 4), np.nan) if bbox is None
+                     else np.asarray(bbox, dtype=np.float64))
+        self.extra = pd.DataFrame(index=pd.RangeIndex(n)) if extra is None else extra.reset_index(drop=True)
+        self.columns = list(columns) if columns is not None else None
+        self._ids = None
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __repr__(self):
+        return f"Annotations({len(self)} frames, {len(self.keypoints)} keypoints)"
+
+    @property
+    def ids(self):
+        """
+        Subject ID per frame (extract_id of the filename, None if it has none).
+        """
+        if self._ids is None:
+            self._ids = np.array([extract_id(os.path.basename(f)) for f in self.filenames], dtype=object)
+        return self._ids
+
+    @property
+    def has_bbox(self):
+        return np.isfinite(self.bbox).all(axis=1)
+
+    def subset(self, rows):
+        """
+        Annotations of the given row positions or boolean mask.
+        """
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return Annotations(self.filenames[rows], self.keypoints, self.coords[rows], self.visible[rows],
+                           self.bbox[rows], self.extra.iloc[rows], self.columns)
+
+    # --- wide table (annotations.csv) ---
+
+    @classmethod
+    def from_dataframe(cls, df):
+        keypoints = keypoints_in_columns(df.columns)
+        coords = df.reindex(columns=keypoint_columns(keypoints)).to_numpy(dtype=np.float64)
+        bbox = df[BBOX_COLUMNS].to_numpy(dtype=np.float64) if all(c in df.columns for c in BBOX_COLUMNS) else None
+        known = set(["filename"] + keypoint_columns(keypoints) + BBOX_COLUMNS)
+        extra = df[[c for c in df.columns if c not in known]]
+        return cls(df["filename"].astype(str).to_numpy(), keypoints, coords, None, bbox, extra, df.columns)
+
+    def to_dataframe(self):
+        """
+        Wide table in the source column order (filename, <kp>-x/-y, bbox_*, extra),
+        coordinates as stored: a keypoint with only x or y keeps that value.
+        """
+        coords = self.coords.reshape(len(self), -1)
+        data = {"filename": self.filenames}
+        for i, col in enumerate(keypoint_columns(self.keypoints)):
+            data[col] = coords[:, i]
+        if self.has_bbox.any() or (self.columns and BBOX_COLUMNS[0] in self.columns):
+            for i, col in enumerate(BBOX_COLUMNS):
+                data[col] = self.bbox[:, i]
+        for col in self.extra.columns:
+            data[col] = self.extra[col].to_numpy()
+        df = pd.DataFrame(data)
+        if self.columns:
+            ordered = [c for c in self.columns if c in df.columns]
+            df = df[ordered + [c for c in df.columns if c not in ordered]]
+        return df
+
+    @classmethod
+    def from_csv(cls, path):
+        # round_trip: every value parses to the float64 nearest its text, so to_csv gives it back
+        df = pd.read_csv(path, dtype={"filename": str}, float_precision="round_trip")
+        return cls.from_dataframe(df)
+
+    def to_csv(self, path):
+        self.to_dataframe().to_csv(path, index=False)
+
+    # --- binary store ---
+
+    def save(self, path, source=None):
+        """
+        Write the set as a folder: coords/visible/bbox .npy, frames.parquet
+        (filename + extra columns) and meta.json. Each file is replaced atomically.
+        `source` (path, size, mtime_ns of the file the set was read from) is kept in
+        meta.json so load_annotations can tell whether the store is still current.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, arr in (("coords", self.coords), ("visible", self.visible), ("bbox", self.bbox)):
+            tmp = os.path.join(path, f"{name}.tmp.npy")
+            np.save(tmp, np.ascontiguousarray(arr))
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+        frames = pd.concat([pd.DataFrame({"filename": self.filenames.astype(str)}), self.extra], axis=1)
+        tmp = os.path.join(path, "frames.tmp.parquet")
+        pq.write_table(pa.Table.from_pandas(frames, preserve_index=False), tmp)
+        os.replace(tmp, os.path.join(path, "frames.parquet"))
+        meta = {"version": STORE_VERSION, "keypoints": self.keypoints, "columns": self.columns,
+                "source": source}
+        tmp = os.path.join(path, "meta.tmp.json")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Open a store written by save; arrays are memory-mapped unless mmap=False.
+        """
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+                  for name in ("coords", "visible", "bbox")}
+        frames = pq.read_table(os.path.join(path, "frames.parquet")).to_pandas()
+        ann = cls.__new__(cls)
+        ann.filenames = frames["filename"].to_numpy(dtype=object)
+        ann.keypoints = meta["keypoints"]
+        ann.coords, ann.visible, ann.bbox = arrays["coords"], arrays["visible"], arrays["bbox"]
+        ann.extra = frames.drop(columns=["filename"])
+        ann.columns = meta["columns"]
+        ann._ids = None
+        return ann
+
+    # --- CVAT XML ---
+
+    @classmethod
+    def from_cvat_xml(cls, path, columns=None):
+        """
+        Read a CVAT <annotations> export with the streaming importer (xml_to_csv.py):
+        skeleton points (outside="1" -> not labeled) and the 'Bounding Box' box of
+        every <image>. `columns` fixes the keypoint order (e.g. the original CSV header);
+        labels it has no column for raise a ValueError.
+        """
+        df, _ = read_cvat_xml(path, columns)
+        return cls.from_dataframe(df)
+
+    def string_batches(self, rows=XML_BATCH_ROWS):
+        """
+        Record batches of the wide table as text ('' for missing), the input of
+        csv_to_xml.write_image_batches.
+        """
+        coords = np.where(self.visible[..., None], self.coords, np.nan)
+        has_bbox = self.has_bbox.any()
+        for start in range(0, len(self), rows):
+            stop = min(start + rows, len(self))
+            cols = {"filename": pa.array(self.filenames[start:stop].astype(str), pa.string())}
+            for k, kp in enumerate(self.keypoints):
+                cols[f"{kp}-x"] = pa.array(_as_text(coords[start:stop, k, 0]), pa.string())
+                cols[f"{kp}-y"] = pa.array(_as_text(coords[start:stop, k, 1]), pa.string())
+            if has_bbox:
+                for i, name in enumerate(BBOX_COLUMNS):
+                    cols[name] = pa.array(_as_text(self.bbox[start:stop, i]), pa.string())
+            yield pa.record_batch(cols)
+
+    def to_cvat_xml(self, output_xml_path, meta_xml_path, image_sizes=None,
+                    task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE):
+        """
+        Write a CVAT XML export, byte-identical to csv_to_xml's output for the CSV
+        written by to_csv (numbers in their shortest form, e.g. 10.0 for '10.00').
+        """
+        # the CSV exporter lists keypoints sorted by name
+        return write_image_batches(self.string_batches(), sorted(self.keypoints), meta_xml_path,
+                                   output_xml_path, image_sizes, task_id, default_size)
+
+    # --- DeepLabCut ---
+
+    def to_collected_data(self, scorer):
+        """
+        CollectedData table (scorer, bodyparts, coords columns; labeled-data/<ID>/<file>
+        index) of all frames with a subject ID, sorted by ID like create_dlc_structure.
+        """
+        ids = self.ids
+        rows = np.flatnonzero(ids != None)  # noqa: E711 (element-wise)
+        rows = rows[np.argsort(ids[rows].astype(str), kind="stable")]
+        coords = np.where(self.visible[rows, :, None], self.coords[rows], np.nan).reshape(len(rows), -1)
+        index = [os.path.join("labeled-data", sid, fn) for sid, fn in zip(ids[rows], self.filenames[rows])]
+        return pd.DataFrame(coords, index=index, columns=collected_data_columns(scorer, self.keypoints))
+
+    @classmethod
+    def from_collected_data(cls, df):
+        """
+        From a CollectedData table (as read by read_collected_data / read_project_store).
+        """
+        keypoints = list(dict.fromkeys(df.columns.get_level_values("bodyparts")))
+        coords = df.reindex(columns=collected_data_columns(df.columns.get_level_values("scorer")[0], keypoints)).to_numpy(dtype=np.float64)
+        filenames = [os.path.basename(str(p)) for p in df.index]
+        return cls(filenames, keypoints, coords)
+
+    @classmethod
+    def from_dlc_project(cls, project_path):
+        """
+        All subjects of a DLC project: from keypoints_<scorer>.h5 if present, else
+        labeled-data/*/CollectedData_*.h5 (or .csv).
+        """
+        stores = glob.glob(os.path.join(project_path, "keypoints_*.h5"))
+        if stores:
+            return cls.from_collected_data(read_project_store(stores[0]))
+        frames = []
+        for subject in sorted(glob.glob(os.path.join(project_path, "labeled-data", "*"))):
+            h5 = glob.glob(os.path.join(subject, "CollectedData_*.h5"))
+            if h5:
+                frames.append(pd.read_hdf(h5[0]))
+                continue
+            csvs = glob.glob(os.path.join(subject, "CollectedData_*.csv"))
+            if csvs:
+                frames.append(pd.read_csv(csvs[0], header=[0, 1, 2], index_col=0))
+        if not frames:
+            raise FileNotFoundError(f"No CollectedData files under {project_path}/labeled-data")
+        return cls.from_collected_data(pd.concat(frames))
+
+    def to_dlc_project(self, base_folder, scorer, view, animal, **kwargs):
+        """
+        Create a DLC project with create_dlc_structure (kwargs are passed on);
+        bounding boxes are dropped as in read_annotations. Returns the project path.
+        """
+        df = self.to_dataframe()
+        df = df.drop(columns=[c for c in df.columns if c.startswith("bbox_")])
+        return create_dlc_structure(base_folder, df, scorer, view, animal, **kwargs)
+
+
+def store_path_for(path):
+    # keyed on the full file name: annotations.csv and annotations.xml live side by side
+    return path.rstrip(os.sep) + STORE_SUFFIX
+
+
+def _source_signature(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _stored_source(store):
+    try:
+        with open(os.path.join(store, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # stores of an older layout are rebuilt
+    return meta.get("source") if meta.get("version") == STORE_VERSION else None
+
+
+def load_annotations(path, cache=True):
+    """
+    Annotations from a .csv, CVAT .xml, .annset store or DLC project folder.
+    With `cache`, a CSV/XML is parsed once and kept as a <file name>.annset store
+    next to it (annotations.csv.annset), used while the source path, size and
+    mtime match the ones recorded in the store.
+    """
+    if path.rstrip(os.sep).endswith(STORE_SUFFIX):
+        return Annotations.load(path)
+    if os.path.isdir(path):
+        return Annotations.from_dlc_project(path)
+    store = store_path_for(path)
+    source = _source_signature(path)
+    if cache and _stored_source(store) == source:
+        return Annotations.load(store)
+    ann = Annotations.from_cvat_xml(path) if path.endswith(".xml") else Annotations.from_csv(path)
+    if cache:
+        try:
+            ann.save(store, source)
+        except OSError:
+            pass    # e.g. a read-only annotations folder: the store is only an accelerator
+    return ann
+
+
+def save_annotations(ann, path, meta_xml_path=None, **kwargs):
+    """
+    Write to .csv, CVAT .xml (needs meta_xml_path) or an .annset store, by extension.
+    """
+    if path.rstrip(os.sep).endswith(STORE_SUFFIX):
+        return ann.save(path)
+    if path.endswith(".xml"):
+        if not meta_xml_path:
+            raise ValueError("Writing CVAT XML needs the <meta> block file (meta_xml_path)")
+        return ann.to_cvat_xml(path, meta_xml_path, **kwargs)
+    return ann.to_csv(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert annotations between CSV, CVAT XML, .annset and DLC.")
+    parser.add_argument("source", help=".csv, .xml, .annset or DLC project folder")
+    parser.add_argument("dest", nargs="?", help=".csv, .xml or .annset to write")
+    parser.add_argument("--meta", help="<meta> block file for XML output")
+    parser.add_argument("--no-cache", action="store_true", help="do not keep a .annset store next to the source")
+    parser.add_argument("--to-dlc", metavar="BASE", help="create a DLC project in BASE (images from BASE/Images)")
+    parser.add_argument("--scorer", default="jm")
+    parser.add_argument("--view", default="top")
+    parser.add_argument("--animal", default="rat")
+    args = parser.parse_args(argv)
+
+    ann = load_annotations(args.source, cache=not args.no_cache)
+    print(f"Loaded {args.source}: {len(ann)} frames, {len(ann.keypoints)} keypoints, "
+          f"{int(ann.visible.sum())} labeled points, {int(ann.has_bbox.sum())} boxes")
+    if args.dest:
+        save_annotations(ann, args.dest, args.meta)
+        print(f"Written: {args.dest}")
+    if args.to_dlc:
+        project = ann.to_dlc_project(args.to_dlc, args.scorer, args.view, args.animal)
+        print(f"DeepLabCut project created at: {project}")
+    if not args.dest and not args.to_dlc:
+        parser.error("nothing to do: give a destination and/or --to-dlc")
+
+
+if __name__ == "__main__":
+    main()
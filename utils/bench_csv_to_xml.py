@@ -0,0 +1,165 @@
+## Benchmark the CSV -> CVAT XML engines: peak RSS, wall time and frames/s per engine.
+## Each engine runs in its own subprocess so peak RSS is not shared between runs.
+## The "import" engine converts the exported XML back with xml_to_csv.py and checks
+## that the round trip gives the original CSV. A small regression check also converts an
+## export whose keypoint and box labels first appear after the first xml_to_csv chunk.
+##   python bench_csv_to_xml.py --frames 20000 --keypoints 35
+
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import csv_to_xml
+import xml_to_csv
+
+META_BLOCK = """<meta>
+  <task>
+    <name>benchmark</name>
+  </task>
+</meta>
+"""
+
+
+def write_synthetic_csv(path, n_frames, n_keypoints, missing_rate=0.2, seed=0):
+    """
+    Write an annotations.csv in the wide layout with random coordinates and gaps.
+    """
+    rng = random.Random(seed)
+    keypoints = [f"kp{i:02d}" for i in range(n_keypoints)]
+    header = ["filename"]
+    for kp in keypoints:
+        header += [f"{kp}-x", f"{kp}-y"]
+    header += csv_to_xml.BBOX_COLUMNS
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(header)
+        for i in range(n_frames):
+            row = [f"img_{i:07d}.png"]
+            for _ in keypoints:
+                if rng.random() < missing_rate:
+                    row += ["", ""]
+                else:
+                    row += [f"{rng.uniform(0, 1280):.2f}", f"{rng.uniform(0, 720):.2f}"]
+            row += ["10.00", "20.00", "500.00", "400.00"]
+            writer.writerow(row)
+
+
+def check_late_labels(tmp, n_frames=9000, first_row=8500, chunk_rows=1024):
+    """
+    Export with 'tail' on every image, 'nose' and the bounding box only from `first_row`
+    and 'ear' always outside; xml_to_csv and read_cvat_xml with chunks smaller than
+    `first_row` must keep every label. Returns a list of problems (empty if fine).
+    """
+    xml_path = os.path.join(tmp, "late_labels.xml")
+    with open(xml_path, "w", encoding="utf-8") as f:
+        f.write("<annotations>\n")
+        for i in range(n_frames):
+            f.write(f'<image id="{i}" name="img_{i:07d}.png" width="640" height="480">\n'
+                    f'<points label="tail" outside="0" points="{i % 640}.00,1.00"/>\n'
+                    f'<points label="ear" outside="1" points="0.0,0.0"/>\n')
+            if i >= first_row:
+                f.write(f'<points label="nose" outside="0" points="2.00,{i % 480}.00"/>\n'
+                        f'<box label="{xml_to_csv.BBOX_LABEL}" xtl="1.00" ytl="2.00" xbr="3.00" ybr="4.00"/>\n')
+            f.write("</image>\n")
+        f.write("</annotations>\n")
+
+    problems = []
+    expected = ["filename", "tail-x", "tail-y", "ear-x", "ear-y", "nose-x", "nose-y"] + csv_to_xml.BBOX_COLUMNS
+    report = xml_to_csv.xml_to_csv(xml_path, os.path.join(tmp, "late_labels.csv"), chunk_rows=chunk_rows)
+    if report["columns"] != expected:
+        problems.append(f"xml_to_csv columns {report['columns']}")
+    df, _ = xml_to_csv.read_cvat_xml(xml_path, chunk_rows=chunk_rows)
+    for name, frame in (("xml_to_csv", pd.read_csv(os.path.join(tmp, "late_labels.csv"))), ("read_cvat_xml", df)):
+        if list(frame.columns) != expected or len(frame) != n_frames:
+            problems.append(f"{name}: {len(frame)} rows, columns {list(frame.columns)}")
+            continue
+        counts = frame[["tail-x", "ear-x", "nose-x", "bbox_tl-x"]].notna().sum().tolist()
+        if counts != [n_frames, 0, n_frames - first_row, n_frames - first_row]:
+            problems.append(f"{name}: labeled tail/ear/nose/bbox {counts}")
+    return problems
+
+
+def run_engine(engine, csv_path, meta_path, out_path):
+    """
+    Child-process entry: run one engine and print wall time and peak RSS as JSON.
+    """
+    start = time.perf_counter()
+    if engine == "tree":
+        csv_to_xml.create_annotation_from_csv(csv_path, meta_path, out_path)
+    elif engine == "stream":
+        csv_to_xml.write_annotation_stream(csv_path, meta_path, out_path)
+    elif engine == "import":
+        # XML -> CSV: meta_path is the exported XML, csv_path the original (for its header)
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            columns = next(csv.reader(f))
+        xml_to_csv.xml_to_csv(meta_path, out_path, columns)
+    else:
+        csv_to_xml.write_annotation_columnar(csv_path, meta_path, out_path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    print(json.dumps({"engine": engine, "seconds": elapsed, "peak_rss_mb": peak_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CSV -> CVAT XML engines.")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--keypoints", type=int, default=35)
+    parser.add_argument("--engines", nargs="+", default=["tree", "stream", "columnar", "import"])
+    parser.add_argument("--child", nargs=4, metavar=("ENGINE", "CSV", "META", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_engine(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "annotations.csv")
+        meta_path = os.path.join(tmp, "meta.xml")
+        write_synthetic_csv(csv_path, args.frames, args.keypoints)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            f.write(META_BLOCK)
+        print(f"{args.frames} frames x {args.keypoints} keypoints "
+              f"({os.path.getsize(csv_path) / 1e6:.1f} MB CSV)")
+
+        outputs = {}
+        xml_path = os.path.join(tmp, "annotations.xml")
+        if "import" in args.engines:
+            csv_to_xml.write_annotation_columnar(csv_path, meta_path, xml_path)
+        for engine in args.engines:
+            out_path = os.path.join(tmp, f"out_{engine}.{'csv' if engine == 'import' else 'xml'}")
+            source = xml_path if engine == "import" else meta_path
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", engine, csv_path, source, out_path],
+                capture_output=True, text=True, check=True,
+            )
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            if engine != "import":
+                outputs[engine] = out_path
+            print(f"{engine:>8}: {result['seconds']:7.2f} s  peak RSS {result['peak_rss_mb']:8.1f} MB  "
+                  f"{args.frames / result['seconds']:9.0f} frames/s")
+
+        # Sanity check: every engine must produce the same document
+        contents = {engine: open(path, "rb").read() for engine, path in outputs.items()}
+        if len(set(contents.values())) > 1:
+            print("WARNING: engine outputs differ")
+        if "import" in args.engines:
+            with open(csv_path, "rb") as a, open(os.path.join(tmp, "out_import.csv"), "rb") as b:
+                if a.read() != b.read():
+                    print("WARNING: XML -> CSV round trip differs from the original CSV")
+        for problem in check_late_labels(tmp):
+            print(f"WARNING: late labels: {problem}")
+
+
+if __name__ == "__main__":
+    main()
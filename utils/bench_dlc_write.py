@@ -0,0 +1,101 @@
+## Benchmark the CollectedData writers of create_dlc_structure: keypoint export time and
+## HDF5 size of the original per-subject groupby loop ("baseline") and of each backend.
+##   python bench_dlc_write.py --frames 50000 --subjects 40 --bodyparts 35
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dlc_project_converter import create_dlc_structure, extract_id
+
+
+def synthetic_annotations(n_frames, n_subjects, n_bodyparts, missing_rate=0.2, seed=0):
+    """
+    Annotations table in the wide layout with filenames that extract_id maps to n_subjects IDs.
+    """
+    rng = np.random.default_rng(seed)
+    data = {"filename": [f"img_R{i % n_subjects}_2024_06_01_cam_F{i:07d}.png" for i in range(n_frames)]}
+    coords = rng.uniform(0, 1280, size=(n_frames, n_bodyparts, 2)).round(2)
+    coords[rng.random((n_frames, n_bodyparts)) < missing_rate] = np.nan
+    for k in range(n_bodyparts):
+        data[f"bp{k:02d}-x"] = coords[:, k, 0]
+        data[f"bp{k:02d}-y"] = coords[:, k, 1]
+    return pd.DataFrame(data)
+
+
+def baseline_keypoints(ld, annotations_df, scorer):
+    """
+    The keypoint export loop of create_dlc_structure before frames_by_subject and
+    write_collected_data (one groupby/reindex/to_csv/to_hdf table per subject),
+    minus the image copies. Returns its seconds.
+    """
+    t0 = time.perf_counter()
+    bodyparts = []
+    for col in annotations_df.columns:
+        if col.endswith('-x') and col[:-2] not in bodyparts:
+            bodyparts.append(col[:-2])
+    for sid, group in annotations_df.groupby('ID'):
+        subfld = os.path.join(ld, sid)
+        os.makedirs(subfld, exist_ok=True)
+        grp = group.set_index('filename', drop=True)
+        ordered_cols = []
+        for bp in bodyparts:
+            ordered_cols.append(f"{bp}-x")
+            ordered_cols.append(f"{bp}-y")
+        df_out = grp.reindex(columns=ordered_cols)
+        df_out.columns = pd.MultiIndex.from_product(
+            [[scorer], bodyparts, ['x', 'y']],
+            names=['scorer', 'bodyparts', 'coords']
+        )
+        df_out.index = [os.path.join('labeled-data', sid, fn) for fn in df_out.index]
+        df_out.to_csv(os.path.join(subfld, f"CollectedData_{scorer}.csv"), index=True)
+        df_out.to_hdf(os.path.join(subfld, f"CollectedData_{scorer}.h5"), key='collected_data', mode='w', format='table')
+    return time.perf_counter() - t0
+
+
+def run_baseline(df):
+    with tempfile.TemporaryDirectory() as tmp:
+        ld = os.path.join(tmp, "labeled-data")
+        df = df.copy()
+        df["ID"] = df["filename"].apply(extract_id)
+        seconds = baseline_keypoints(ld, df, "jm")
+        h5_bytes = sum(os.path.getsize(p) for p in glob.glob(os.path.join(ld, "*", "*.h5")))
+    return seconds, h5_bytes
+
+
+def run(df, backend, project_store):
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = {}
+        project = create_dlc_structure(tmp, df.copy(), "jm", "top", "rat",
+                                       stats=stats, backend=backend, project_store=project_store)
+        h5_bytes = sum(os.path.getsize(p) for p in glob.glob(os.path.join(project, "labeled-data", "*", "*.h5")))
+        store = glob.glob(os.path.join(project, "keypoints_*.h5"))
+        store_bytes = os.path.getsize(store[0]) if store else 0
+    return stats["seconds"]["keypoints"], h5_bytes, store_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DLC CollectedData output backends.")
+    parser.add_argument("--frames", type=int, default=50000)
+    parser.add_argument("--subjects", type=int, default=40)
+    parser.add_argument("--bodyparts", type=int, default=35)
+    args = parser.parse_args()
+
+    df = synthetic_annotations(args.frames, args.subjects, args.bodyparts)
+    print(f"{args.frames} frames, {args.subjects} subjects, {args.bodyparts} bodyparts")
+    seconds, h5_bytes = run_baseline(df)
+    print(f"{'baseline':>22}: {seconds:7.2f} s  CollectedData .h5 {h5_bytes / 1e6:7.2f} MB")
+    for backend, project_store in [("table", False), ("fixed", False), ("fixed", True)]:
+        seconds, h5_bytes, store_bytes = run(df, backend, project_store)
+        label = backend + (" + project store" if project_store else "")
+        extra = f"  store {store_bytes / 1e6:7.2f} MB" if project_store else ""
+        print(f"{label:>22}: {seconds:7.2f} s  CollectedData .h5 {h5_bytes / 1e6:7.2f} MB{extra}")
+
+
+if __name__ == "__main__":
+    main()
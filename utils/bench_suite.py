@@ -0,0 +1,314 @@
+## End-to-end benchmark of the data-prep tools on a synthetic rat-skeleton dataset
+## (synthetic_data.py): CSV -> CVAT export, DLC project creation, bodypart filtering,
+## resizing, pose features / clustering and the train/val/test split. Every stage runs in
+## its own subprocess and records wall time, CPU time (including worker processes) and
+## peak RSS; results are written as JSON and can be compared with an earlier run.
+##   python bench_suite.py --frames 100000 --out bench_100k.json
+##   python bench_suite.py --frames 100000 --out bench_new.json --baseline bench_100k.json
+##   python bench_suite.py --data /tmp/synth --stages csv_to_xml dlc_create filter_bodyparts
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import synthetic_data
+
+# stages in run order; filter_bodyparts works on dlc_create's project, cluster/split on features' output
+STAGES = ["csv_to_xml", "dlc_create", "filter_bodyparts", "resize", "features", "cluster", "split"]
+REQUIRES = {"filter_bodyparts": "dlc_create", "cluster": "features", "split": "cluster"}
+META_BLOCK = "<meta>\n  <task>\n    <name>benchmark</name>\n  </task>\n</meta>\n"
+TOLERANCE = 0.10
+MIN_DELTA = 0.1         # seconds; smaller slowdowns are noise, not regressions
+RESIZE_FRAMES = 500     # the resize stage decodes full frames, so it runs on a subset
+
+
+def _splitt_path():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "splitt")
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def stage_csv_to_xml(data, work, workers):
+    import csv_to_xml
+    meta = os.path.join(work, "meta.xml")
+    with open(meta, "w", encoding="utf-8") as f:
+        f.write(META_BLOCK)
+    csv_to_xml.write_annotation_columnar(os.path.join(data, "annotations.csv"), meta,
+                                         os.path.join(work, "annotations.xml"))
+    return _frames(data)
+
+
+def stage_dlc_create(data, work, workers):
+    from dlc_project_converter import create_dlc_structure, read_annotations
+    df = read_annotations(os.path.join(data, "annotations.csv"))
+    create_dlc_structure(work, df, "bench", "top", "rat", image_strategy="hardlink", workers=workers or 8)
+    return len(df)
+
+
+def stage_filter_bodyparts(data, work, workers):
+    import filter_bodyparts
+    project = glob.glob(os.path.join(work, "toprat-bench-*"))[0]
+    filter_bodyparts.main(project, filter_bodyparts.KEEP_BPS, workers)
+    return _frames(data)
+
+
+def stage_resize(data, work, workers):
+    from resize_pipeline import resize_dataset
+    report = resize_dataset(os.path.join(work, "resize_source"), os.path.join(data, "annotations.csv"),
+                            os.path.join(work, "resized"), os.path.join(work, "annotations_resized.csv"),
+                            only_from=None, workers=workers, keep_strategy="hardlink")
+    return report["resized"]
+
+
+def stage_features(data, work, workers):
+    _splitt_path()
+    import pandas as pd
+    from pose_features import pose_features
+    df = pd.read_csv(os.path.join(data, "annotations.csv"))
+    _, X = pose_features(df)
+    mean = np.nanmean(X, axis=0)
+    X = np.where(np.isnan(X), mean, X)
+    std = X.std(axis=0)
+    X = (X - X.mean(axis=0)) / np.where(std == 0, 1.0, std)
+    np.save(os.path.join(work, "features.npy"), X)
+    return len(X)
+
+
+def stage_cluster(data, work, workers):
+    _splitt_path()
+    from clustering import fit_final
+    X = np.load(os.path.join(work, "features.npy"))
+    labels = fit_final(X, 10, mode="minibatch").labels_
+    np.save(os.path.join(work, "clusters.npy"), labels)
+    return len(X)
+
+
+def stage_split(data, work, workers):
+    import pandas as pd
+    from split_dataset import make_split, write_manifests
+    df = pd.read_csv(os.path.join(data, "annotations.csv"))
+    df["cluster"] = np.load(os.path.join(work, "clusters.npy"))
+    write_manifests(df, make_split(df, "cluster"), os.path.join(work, "split_cluster"))
+    write_manifests(df, make_split(df, "subject"), os.path.join(work, "split_subject"))
+    return len(df)
+
+
+def _frames(data):
+    with open(os.path.join(data, "annotations.csv"), "rb") as f:
+        return sum(1 for _ in f) - 1
+
+
+def _usage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = max(own.ru_maxrss, children.ru_maxrss)
+    return cpu, peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_stage(stage, data, work, workers):
+    """
+    Child-process entry: run one stage and print its measurements as JSON.
+    """
+    cpu0, _ = _usage()
+    start = time.perf_counter()
+    items = globals()[f"stage_{stage}"](data, work, workers)
+    seconds = time.perf_counter() - start
+    cpu1, peak_mb = _usage()
+    print(json.dumps({"seconds": seconds, "cpu_seconds": cpu1 - cpu0, "peak_rss_mb": peak_mb,
+                      "items": items, "items_per_second": items / seconds if seconds else 0.0}))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _resize_source(data, folder, n_images):
+    """
+    Hardlink the first n_images frames of the dataset into `folder` (resize stage input).
+    """
+    from image_staging import stage_images
+    import pandas as pd
+    names = pd.read_csv(os.path.join(data, "annotations.csv"), usecols=["filename"], nrows=n_images)["filename"]
+    os.makedirs(folder, exist_ok=True)
+    stage_images([(os.path.join(data, "Images", f), os.path.join(folder, f)) for f in names], "hardlink")
+
+
+def run_suite(data, stages, work, workers=None, repeat=1, resize_frames=RESIZE_FRAMES):
+    """
+    Run `stages` (each in a subprocess, `repeat` times, fastest run reported) on the
+    dataset folder `data` with outputs under `work`. Returns {stage: result}.
+    """
+    results = {}
+    if "resize" in stages:
+        _resize_source(data, os.path.join(work, "run", "resize_source"), resize_frames)
+    for stage in stages:
+        runs = []
+        for _ in range(repeat):
+            stage_work = os.path.join(work, "run")
+            if stage == "dlc_create":
+                # a fresh project each time (filter_bodyparts then works on the last one)
+                for old in glob.glob(os.path.join(stage_work, "toprat-bench-*")):
+                    shutil.rmtree(old)
+            elif stage == "filter_bodyparts":
+                # filtering is idempotent: every run starts from the project dlc_create wrote
+                for project in glob.glob(os.path.join(work, "pristine", "toprat-bench-*")):
+                    target = os.path.join(stage_work, os.path.basename(project))
+                    shutil.rmtree(target, ignore_errors=True)
+                    shutil.copytree(project, target, copy_function=os.link)
+            elif stage == "resize":
+                shutil.rmtree(os.path.join(stage_work, "resized"), ignore_errors=True)
+                from image_index import index_path_for
+                index = index_path_for(os.path.join(stage_work, "resize_source"))
+                if os.path.exists(index):
+                    os.remove(index)
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", stage, data, stage_work]
+            if workers:
+                cmd += ["--workers", str(workers)]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                runs.append({"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"})
+                break
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        if stage == "dlc_create" and "filter_bodyparts" in stages:
+            shutil.rmtree(os.path.join(work, "pristine"), ignore_errors=True)
+            for project in glob.glob(os.path.join(work, "run", "toprat-bench-*")):
+                shutil.copytree(project, os.path.join(work, "pristine", os.path.basename(project)),
+                                copy_function=os.link)
+        ok = [r for r in runs if "error" not in r]
+        results[stage] = dict(min(ok, key=lambda r: r["seconds"]) if ok else runs[-1], runs=runs)
+        r = results[stage]
+        line = r.get("error") or (f"{r['seconds']:8.2f} s  cpu {r['cpu_seconds']:8.2f} s  "
+                                  f"peak RSS {r['peak_rss_mb']:8.1f} MB  {r['items_per_second']:10.0f} items/s")
+        print(f"{stage:>16}: {line}", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE, meta=None):
+    """
+    Print seconds and peak RSS relative to a baseline result file; returns the stages
+    that got slower (by more than MIN_DELTA seconds) or bigger by more than `tolerance`.
+    """
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('date')}):")
+    if meta is not None and meta.get("frames") != baseline["meta"].get("frames"):
+        print(f"  warning: baseline has {baseline['meta'].get('frames')} frames, this run {meta.get('frames')}")
+    for stage, r in results.items():
+        old = baseline["stages"].get(stage)
+        if old is None or "error" in old or "error" in r:
+            continue
+        t = r["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        m = r["peak_rss_mb"] / old["peak_rss_mb"] if old["peak_rss_mb"] else float("inf")
+        flag = ""
+        if (t > 1 + tolerance and r["seconds"] - old["seconds"] > MIN_DELTA) or m > 1 + tolerance:
+            regressions.append(stage)
+            flag = "  REGRESSION"
+        print(f"{stage:>16}: time x{t:5.2f}  peak RSS x{m:5.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data-prep pipeline on synthetic data.")
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--subjects", type=int, default=40)
+    parser.add_argument("--images", choices=synthetic_data.IMAGE_MODES, default="link",
+                        help="dummy frames: one hardlinked frame ('link') or one drawn per row ('render')")
+    parser.add_argument("--image-size", type=synthetic_data._parse_size, default=(1920, 1080),
+                        help="size of the generated frames (the resize stage scales them to 1280x720)")
+    parser.add_argument("--data", help="existing synthetic dataset folder (annotations.csv + Images/) to reuse")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--resize-frames", type=int, default=RESIZE_FRAMES, help="frames the resize stage processes")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the fastest is reported")
+    parser.add_argument("--workers", type=int, help="processes/threads for the stages that use a pool")
+    parser.add_argument("--out", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative slowdown counted as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work folder")
+    parser.add_argument("--child", nargs=3, metavar=("STAGE", "DATA", "WORK"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_stage(*args.child, args.workers)
+        return 0
+
+    needed = set(args.stages)
+    for stage in args.stages:
+        while stage in REQUIRES:
+            stage = REQUIRES[stage]
+            needed.add(stage)
+    stages = [s for s in STAGES if s in needed]
+
+    work = tempfile.mkdtemp(prefix="bench_suite_")
+    # image indexes of the stages (inherited by the child processes) stay in the work folder
+    os.environ["POSE_CACHE_DIR"] = os.path.join(work, "cache")
+    results = {}
+    try:
+        data = args.data
+        generated = None
+        if data is None:
+            data = os.path.join(work, "data")
+            generated = synthetic_data.make_dataset(data, args.frames, args.subjects, args.images, args.image_size,
+                                                    args.workers)
+            print(f"Synthetic data: {generated['frames']} frames, {generated['subjects']} subjects, "
+                  f"{generated['image_count']} images ({sum(generated['seconds'].values()):.1f} s)")
+        run_dir = os.path.join(work, "run")
+        os.makedirs(run_dir, exist_ok=True)
+        # create_dlc_structure and resize read <base>/Images
+        os.symlink(os.path.abspath(os.path.join(data, "Images")), os.path.join(run_dir, "Images"))
+
+        results = run_suite(data, stages, work, args.workers, args.repeat, args.resize_frames)
+        n_frames = _frames(data)
+        output = {
+            "meta": {
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "workers": args.workers,
+                "frames": n_frames,
+                "subjects": generated["subjects"] if generated else None,
+                "images": args.images if generated else "reused",
+                "image_size": list(args.image_size),
+                "resize_frames": args.resize_frames,
+                "data": None if generated else os.path.abspath(data),
+            },
+            "stages": results,
+        }
+        tmp = args.out + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+        os.replace(tmp, args.out)
+        print(f"Results written to {args.out}")
+    finally:
+        if args.keep:
+            print(f"Work folder kept: {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    failed = [s for s, r in results.items() if "error" in r]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance, output["meta"])
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
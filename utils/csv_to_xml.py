@@ -1,11 +1,123 @@
+import argparse
 import csv
+import io
+import os
 import xml.etree.ElementTree as ET
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+import instrument
+from image_index import lookup_sizes
+
+BBOX_COLUMNS = ["bbox_tl-x", "bbox_tl-y", "bbox_br-x", "bbox_br-y"]
+INDENT = "  "
+DEFAULT_SIZE = (1280, 720)
+DEFAULT_TASK_ID = "2"
+
+
 def load_meta_block(meta_path):
     with open(meta_path, "r", encoding="utf-8") as f:
         return f.read()
 
-def create_annotation_from_csv(csv_path, meta_xml_path, output_xml_path):
+
+def keypoints_from_fieldnames(fieldnames):
+    """
+    Keypoint names (without -x/-y suffix) in sorted order, bbox columns excluded.
+    """
+    bbox_fields = {"bbox_tl", "bbox_br"}
+    return sorted(set(
+        col[:-2] for col in fieldnames
+        if col.endswith("-x") and col[:-2] not in bbox_fields
+    ))
+
+
+def _sizes_dict(image_sizes):
+    """
+    filename -> (width, height) strings from a load_image_sizes DataFrame, or None.
+    """
+    if image_sizes is None:
+        return None
+    return dict(zip(image_sizes["filename"].astype(str),
+                    zip(image_sizes["width"].astype("int64").astype(str),
+                        image_sizes["height"].astype("int64").astype(str))))
+
+
+def row_size(row, sizes=None, default_size=DEFAULT_SIZE):
+    """
+    (width, height) strings of one CSV row: from its width/height columns if the CSV
+    has them, else looked up by filename in `sizes` (see _sizes_dict), else
+    `default_size`. Same rules as _size_columns.
+    """
+    if "width" in row and "height" in row:
+        return row["width"] or str(default_size[0]), row["height"] or str(default_size[1])
+    if sizes is not None and row["filename"] in sizes:
+        return sizes[row["filename"]]
+    return str(default_size[0]), str(default_size[1])
+
+
+def build_image_element(img_id, row, keypoints, sizes=None, task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE):
+    """
+    Build the <image> element (bounding box + skeleton) for one CSV row.
+    """
+    width, height = row_size(row, sizes, default_size)
+    image = ET.Element("image", {
+        "id": str(img_id),
+        "name": row["filename"],
+        "subset": "default",
+        "task_id": task_id,
+        "width": width,
+        "height": height
+    })
+
+    # Add bounding box if available
+    if all(k in row for k in BBOX_COLUMNS):
+        if row["bbox_tl-x"] and row["bbox_tl-y"] and row["bbox_br-x"] and row["bbox_br-y"]:
+            ET.SubElement(image, "box", {
+                "label": "Bounding Box",
+                "source": "file",
+                "occluded": "0",
+                "xtl": row["bbox_tl-x"],
+                "ytl": row["bbox_tl-y"],
+                "xbr": row["bbox_br-x"],
+                "ybr": row["bbox_br-y"],
+                "z_order": "0"
+            })
+
+    # Add skeleton with points
+    skeleton = ET.SubElement(image, "skeleton", {
+        "label": "RatSkeleton",
+        "source": "file",
+        "z_order": "0"
+    })
+
+    for kp in keypoints:
+        x = row.get(f"{kp}-x", "")
+        y = row.get(f"{kp}-y", "")
+        outside = "1" if not x or not y else "0"
+        points_str = f"{x},{y}" if x and y else "0.0,0.0"
+        ET.SubElement(skeleton, "points", {
+            "label": kp,
+            "source": "file",
+            "outside": outside,
+            "occluded": "0",
+            "points": points_str
+        })
+    return image
+
+
+@instrument.instrumented("csv_to_xml.tree")
+def create_annotation_from_csv(csv_path, meta_xml_path, output_xml_path, image_sizes=None,
+                               task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE):
+    """
+    Build the whole CVAT document as one ElementTree and write it at the end.
+    Memory grows with the number of rows; see write_annotation_stream for large files.
+    `image_sizes`, `task_id` and `default_size` as in write_annotation_columnar.
+    """
+    sizes = _sizes_dict(image_sizes)
     # Load meta section as a string
     meta_content = load_meta_block(meta_xml_path)
 
@@ -21,69 +133,335 @@ def create_annotation_from_csv(csv_path, meta_xml_path, output_xml_path):
     annotations.append(meta_element)
 
     # Read CSV
-    with open(csv_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        bbox_fields = {"bbox_tl", "bbox_br"}
-        keypoints = sorted(set(
-            col[:-2] for col in reader.fieldnames
-            if col.endswith("-x") and col[:-2] not in bbox_fields
-        ))
-        rows = list(reader)
-
-
-    for img_id, row in enumerate(rows):
-        image = ET.SubElement(annotations, "image", {
-            "id": str(img_id),
-            "name": row["filename"],
-            "subset": "default",
-            "task_id": "2",
-            "width": "1280",
-            "height": "720"
-        })
+    with instrument.stage("csv_to_xml.read_csv") as rec:
+        with open(csv_path, newline='', encoding='utf-8') as csvfile:
+            reader = csv.DictReader(csvfile)
+            keypoints = keypoints_from_fieldnames(reader.fieldnames)
+            rows = list(reader)
+        rec.add(items=len(rows))
 
-        # Add bounding box if available
-        if all(k in row for k in ["bbox_tl-x", "bbox_tl-y", "bbox_br-x", "bbox_br-y"]):
-            if row["bbox_tl-x"] and row["bbox_tl-y"] and row["bbox_br-x"] and row["bbox_br-y"]:
-                ET.SubElement(image, "box", {
-                    "label": "Bounding Box",
-                    "source": "file",
-                    "occluded": "0",
-                    "xtl": row["bbox_tl-x"],
-                    "ytl": row["bbox_tl-y"],
-                    "xbr": row["bbox_br-x"],
-                    "ybr": row["bbox_br-y"],
-                    "z_order": "0"
-                })
-
-        # Add skeleton with points
-        skeleton = ET.SubElement(image, "skeleton", {
-            "label": "RatSkeleton",
-            "source": "file",
-            "z_order": "0"
-        })
+    with instrument.stage("csv_to_xml.build_xml", items=len(rows)):
+        for img_id, row in enumerate(rows):
+            annotations.append(build_image_element(img_id, row, keypoints, sizes, task_id, default_size))
 
-        for kp in keypoints:
+    # Write XML to file
+    with instrument.stage("csv_to_xml.write_xml", items=len(rows)):
+        tree = ET.ElementTree(annotations)
+        ET.indent(tree, space=INDENT, level=0)
+        tree.write(output_xml_path, encoding="utf-8", xml_declaration=True)
+    print(f"CVAT XML written to: {output_xml_path}")
+
+
+def _escape_attr(value):
+    """
+    Escape an attribute value the same way ElementTree serializes it.
+    """
+    if any(c in value for c in '&<>"\n\r\t'):
+        value = (value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+                 .replace('"', "&quot;").replace("\r", "&#13;").replace("\n", "&#10;")
+                 .replace("\t", "&#09;"))
+    return value
+
+
+def _write_child(out, element):
+    """
+    Serialize a direct child of <annotations>, indented as ET.indent would do it.
+    """
+    ET.indent(element, space=INDENT, level=1)
+    element.tail = None
+    out.write(INDENT)
+    out.write(ET.tostring(element, encoding="unicode"))
+
+
+def format_image(img_id, row, point_labels, sizes=None, task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE):
+    """
+    Text of the <image> element for one CSV row, indented at level 1.
+    Equivalent to serializing build_image_element, without creating Element objects.
+    `point_labels` is a list of (keypoint, escaped label) pairs.
+    """
+    width, height = row_size(row, sizes, default_size)
+    parts = [
+        f'{INDENT}<image id="{img_id}" name="{_escape_attr(row["filename"])}" subset="default" '
+        f'task_id="{_escape_attr(task_id)}" width="{_escape_attr(width)}" height="{_escape_attr(height)}">\n'
+    ]
+    if all(row.get(k) for k in BBOX_COLUMNS):
+        xtl, ytl, xbr, ybr = (_escape_attr(row[k]) for k in BBOX_COLUMNS)
+        parts.append(
+            f'{INDENT * 2}<box label="Bounding Box" source="file" occluded="0" '
+            f'xtl="{xtl}" ytl="{ytl}" xbr="{xbr}" ybr="{ybr}" z_order="0" />\n'
+        )
+    if point_labels:
+        parts.append(f'{INDENT * 2}<skeleton label="RatSkeleton" source="file" z_order="0">\n')
+        for kp, label in point_labels:
             x = row.get(f"{kp}-x", "")
             y = row.get(f"{kp}-y", "")
-            outside = "1" if not x or not y else "0"
-            points_str = f"{x},{y}" if x and y else "0.0,0.0"
-            ET.SubElement(skeleton, "points", {
-                "label": kp,
-                "source": "file",
-                "outside": outside,
-                "occluded": "0",
-                "points": points_str
-            })
+            if x and y:
+                outside, points_str = "0", f"{_escape_attr(x)},{_escape_attr(y)}"
+            else:
+                outside, points_str = "1", "0.0,0.0"
+            parts.append(
+                f'{INDENT * 3}<points label="{label}" source="file" outside="{outside}" '
+                f'occluded="0" points="{points_str}" />\n'
+            )
+        parts.append(f"{INDENT * 2}</skeleton>\n")
+    else:
+        parts.append(f'{INDENT * 2}<skeleton label="RatSkeleton" source="file" z_order="0" />\n')
+    parts.append(f"{INDENT}</image>")
+    return "".join(parts)
 
-    # Write XML to file
-    tree = ET.ElementTree(annotations)
-    ET.indent(tree, space="  ", level=0)
-    tree.write(output_xml_path, encoding="utf-8", xml_declaration=True)
-    print(f"CVAT XML written to: {output_xml_path}")
 
-# Example usage
-csv_path = "/Users/jonasmucke/Desktop/pose_estimation/Rat/side2194/annotations.csv"
-meta_xml_path = "/Users/jonasmucke/Desktop/merged_output/annotations_meta.xml"  # this file should contain only the <meta>...</meta> block
-output_xml_path = "/Users/jonasmucke/Desktop/pose_estimation/Rat/side2194/annotations.xml"
+@instrument.instrumented("csv_to_xml.stream")
+def write_annotation_stream(csv_path, meta_xml_path, output_xml_path, image_sizes=None,
+                            task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE):
+    """
+    Streaming variant of create_annotation_from_csv: reads one CSV row at a time
+    and writes its <image> element text immediately, so memory stays constant.
+    Produces byte-identical output to the tree-building path.
+    Returns the number of images written.
+    """
+    sizes = _sizes_dict(image_sizes)
+    meta_element = ET.fromstring(load_meta_block(meta_xml_path))
+    version = ET.Element("version")
+    version.text = "1.1"
+
+    n_images = 0
+    with open(csv_path, newline='', encoding='utf-8') as csvfile, \
+            open(output_xml_path, "w", encoding="utf-8") as out:
+        reader = csv.DictReader(csvfile)
+        keypoints = keypoints_from_fieldnames(reader.fieldnames)
+        point_labels = [(kp, _escape_attr(kp)) for kp in keypoints]
+
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n<annotations>")
+        for child in (version, meta_element):
+            out.write("\n")
+            _write_child(out, child)
+        for img_id, row in enumerate(reader):
+            out.write("\n")
+            out.write(format_image(img_id, row, point_labels, sizes, task_id, default_size))
+            n_images += 1
+        out.write("\n</annotations>")
+
+    print(f"CVAT XML written to: {output_xml_path} ({n_images} images)")
+    return n_images
+
+
+def load_image_sizes(path):
+    """
+    Load a filename -> (width, height) table: from an image folder (via its
+    image index, see image_index.py), an image index Parquet file, or a CSV
+    with columns filename, width, height.
+    """
+    if os.path.isdir(path) or path.endswith(".parquet"):
+        df = lookup_sizes(path)
+    else:
+        df = pd.read_csv(path, usecols=["filename", "width", "height"])
+    return df.drop_duplicates("filename", keep="last").reset_index(drop=True)
+
+
+_XML_SPECIAL = r'[&<>"\r\n\t]'
+_XML_ESCAPES = [("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"),
+                ("\r", "&#13;"), ("\n", "&#10;"), ("\t", "&#09;")]
+
+
+def _escape_column(arr):
+    """
+    Vectorized _escape_attr; only rewrites the column when it contains special characters.
+    """
+    if len(arr) and pc.any(pc.match_substring_regex(arr, _XML_SPECIAL)).as_py():
+        for char, entity in _XML_ESCAPES:
+            arr = pc.replace_substring(arr, char, entity)
+    return arr
+
+
+def _join(*parts):
+    # element-wise string concatenation of arrays and scalars
+    return pc.binary_join_element_wise(*parts, "")
+
+
+def _size_columns(batch, filenames, image_sizes, default_size):
+    """
+    Per-row width/height strings: from width/height columns in the CSV if present,
+    else looked up by filename in `image_sizes`, else `default_size`.
+    """
+    names = batch.schema.names
+    if "width" in names and "height" in names:
+        width, height = batch.column("width"), batch.column("height")
+        width = pc.if_else(pc.equal(width, ""), str(default_size[0]), width)
+        height = pc.if_else(pc.equal(height, ""), str(default_size[1]), height)
+        return width, height
+    if image_sizes is not None:
+        idx = pc.index_in(filenames, value_set=image_sizes["filename"])
+        width = pc.take(image_sizes["width"], idx).fill_null(str(default_size[0]))
+        height = pc.take(image_sizes["height"], idx).fill_null(str(default_size[1]))
+        return width, height
+    return pa.scalar(str(default_size[0])), pa.scalar(str(default_size[1]))
+
+
+def _string_array_bytes(arr):
+    """
+    Concatenated UTF-8 bytes of a string array, taken straight from its value buffer.
+    """
+    if isinstance(arr, pa.ChunkedArray):
+        return b"".join(_string_array_bytes(chunk) for chunk in arr.chunks)
+    if len(arr) == 0:
+        return b""
+    offsets = np.frombuffer(arr.buffers()[1], dtype=np.int32)
+    start, end = offsets[arr.offset], offsets[arr.offset + len(arr)]
+    return memoryview(arr.buffers()[2])[start:end]
+
+
+def format_image_batch(batch, first_id, keypoints, image_sizes=None,
+                       task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE):
+    """
+    Text of every <image> element of a record batch (all columns as strings),
+    computed column-wise: one string per row, same layout as format_image but
+    with the preceding newline included.
+    """
+    n = batch.num_rows
+    names = batch.schema.names
+    ids = pa.array(np.arange(first_id, first_id + n)).cast(pa.string())
+    filenames = batch.column("filename")
+    width, height = _size_columns(batch, filenames, image_sizes, default_size)
+
+    head = _join(
+        f'\n{INDENT}<image id="', ids, '" name="', _escape_column(filenames),
+        f'" subset="default" task_id="{_escape_attr(task_id)}" width="', width,
+        '" height="', height, '">\n',
+    )
+
+    parts = [head]
+    if all(k in names for k in BBOX_COLUMNS):
+        coords = [_escape_column(batch.column(k)) for k in BBOX_COLUMNS]
+        has_box = pc.greater(pc.utf8_length(coords[0]), 0)
+        for c in coords[1:]:
+            has_box = pc.and_(has_box, pc.greater(pc.utf8_length(c), 0))
+        box = _join(
+            f'{INDENT * 2}<box label="Bounding Box" source="file" occluded="0" xtl="', coords[0],
+            '" ytl="', coords[1], '" xbr="', coords[2], '" ybr="', coords[3], '" z_order="0" />\n',
+        )
+        parts.append(pc.if_else(has_box, box, ""))
+
+    if keypoints:
+        parts.append(f'{INDENT * 2}<skeleton label="RatSkeleton" source="file" z_order="0">\n')
+        empty = pa.array([""] * n, pa.string())
+        for kp in keypoints:
+            x = _escape_column(batch.column(f"{kp}-x")) if f"{kp}-x" in names else empty
+            y = _escape_column(batch.column(f"{kp}-y")) if f"{kp}-y" in names else empty
+            visible = pc.and_(pc.greater(pc.utf8_length(x), 0), pc.greater(pc.utf8_length(y), 0))
+            outside = pc.if_else(visible, "0", "1")
+            points_str = pc.if_else(visible, _join(x, ",", y), "0.0,0.0")
+            parts.append(_join(
+                f'{INDENT * 3}<points label="{_escape_attr(kp)}" source="file" outside="', outside,
+                '" occluded="0" points="', points_str, '" />\n',
+            ))
+        parts.append(f"{INDENT * 2}</skeleton>\n")
+    else:
+        parts.append(f'{INDENT * 2}<skeleton label="RatSkeleton" source="file" z_order="0" />\n')
+    parts.append(f"{INDENT}</image>")
+    return _join(*parts)
+
+
+def _sizes_table(image_sizes):
+    if image_sizes is None:
+        return None
+    return pa.record_batch({
+        "filename": pa.array(image_sizes["filename"].astype(str), pa.string()),
+        "width": pa.array(image_sizes["width"].astype("int64").astype(str), pa.string()),
+        "height": pa.array(image_sizes["height"].astype("int64").astype(str), pa.string()),
+    })
+
+
+def write_image_batches(batches, keypoints, meta_xml_path, output_xml_path, image_sizes=None,
+                        task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE):
+    """
+    Write a CVAT document from record batches of string columns (filename, <kp>-x/-y,
+    bbox_*, optionally width/height; "" for missing values), one join per batch.
+    Shared by write_annotation_columnar and annotations.Annotations.to_cvat_xml.
+    Returns the number of images written.
+    """
+    sizes_table = _sizes_table(image_sizes)
+    meta_element = ET.fromstring(load_meta_block(meta_xml_path))
+    version = ET.Element("version")
+    version.text = "1.1"
+
+    n_images = 0
+    with open(output_xml_path, "wb") as out:
+        header = io.StringIO()
+        header.write("<?xml version='1.0' encoding='utf-8'?>\n<annotations>")
+        for child in (version, meta_element):
+            header.write("\n")
+            _write_child(header, child)
+        out.write(header.getvalue().encode("utf-8"))
+        for batch in batches:
+            if batch.num_rows == 0:
+                continue
+            images = format_image_batch(batch, n_images, keypoints, sizes_table, task_id, default_size)
+            out.write(_string_array_bytes(images))
+            n_images += batch.num_rows
+        out.write(b"\n</annotations>")
+    return n_images
+
+
+@instrument.instrumented("csv_to_xml.columnar")
+def write_annotation_columnar(csv_path, meta_xml_path, output_xml_path, image_sizes=None,
+                              task_id=DEFAULT_TASK_ID, default_size=DEFAULT_SIZE,
+                              block_size=1 << 20):
+    """
+    Columnar CSV -> CVAT engine: reads the CSV in record batches of `block_size` bytes
+    with pyarrow (every column as text, so coordinates are written verbatim),
+    computes outside flags and points strings for whole columns and writes each
+    batch with a single join. Memory is bounded by the batch size.
+
+    Width/height come from `width`/`height` columns when present, otherwise from
+    `image_sizes` (DataFrame with filename, width, height, see load_image_sizes),
+    otherwise `default_size`. Returns the number of images written.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        fieldnames = next(csv.reader(csvfile), [])
+    keypoints = keypoints_from_fieldnames(fieldnames)
+
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in fieldnames},
+            strings_can_be_null=False,
+        ),
+    )
+    n_images = write_image_batches(reader, keypoints, meta_xml_path, output_xml_path,
+                                   image_sizes, task_id, default_size)
+    print(f"CVAT XML written to: {output_xml_path} ({n_images} images)")
+    return n_images
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert annotations.csv to a CVAT XML export.")
+    parser.add_argument("csv_path", help="annotations.csv in the wide <kp>-x/<kp>-y layout")
+    parser.add_argument("meta_xml_path", help="file containing only the <meta>...</meta> block")
+    parser.add_argument("output_xml_path", help="where to write the CVAT XML")
+    parser.add_argument("--engine", choices=["columnar", "stream", "tree"], default="columnar",
+                        help="columnar: vectorized batches (default); stream: row by row, "
+                             "constant memory; tree: build the full ElementTree")
+    parser.add_argument("--sizes", help="image folder, image index Parquet or CSV with filename,width,height")
+    parser.add_argument("--task-id", default=DEFAULT_TASK_ID, help="CVAT task_id attribute")
+    instrument.add_argument(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instrument.from_args(args)
+    image_sizes = load_image_sizes(args.sizes) if args.sizes else None
+    engine = {
+        "tree": create_annotation_from_csv,
+        "stream": write_annotation_stream,
+        "columnar": write_annotation_columnar,
+    }[args.engine]
+    engine(args.csv_path, args.meta_xml_path, args.output_xml_path,
+           image_sizes=image_sizes, task_id=args.task_id)
+
 
-create_annotation_from_csv(csv_path, meta_xml_path, output_xml_path)
+if __name__ == "__main__":
+    # e.g. python csv_to_xml.py Rat/side2194/annotations.csv merged_output/annotations_meta.xml Rat/side2194/annotations.xml
+    main()
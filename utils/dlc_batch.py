@@ -0,0 +1,179 @@
+## Headless DeepLabCut project conversion for many annotation folders at once.
+##   python dlc_batch.py Rat/side2194 Rat/side950 --view side --animal rat --scorer jm
+##   python dlc_batch.py --manifest nightly.csv --processes 4 --images hardlink --json summary.json
+##   python dlc_batch.py Rat/side2194 --view side --animal rat --update --dry-run
+## A manifest is a CSV (or JSON list of objects) with columns folder, view, animal
+## and optionally scorer, images.
+
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import instrument
+from dlc_project_converter import (OUTPUT_BACKENDS, create_dlc_structure, find_project, format_update_report,
+                                   read_annotations, update_dlc_structure)
+from image_staging import SKIP_MODES, STRATEGIES
+
+
+def convert_folder(folder, view, animal, scorer="jm", images="copy", workers=8, skip="size_mtime",
+                   backend="table", project_store=False, update=False, dry_run=False):
+    """
+    Convert one annotation folder (containing annotations.csv and Images/) into a
+    DLC project. With `update`, the folder's latest project for view/animal/scorer is
+    updated incrementally instead (a new one is created if there is none); `dry_run`
+    only reports what the update would change.
+    Returns a summary dict; errors are reported in it instead of raised.
+    """
+    summary = {"folder": folder, "view": view, "animal": animal, "scorer": scorer, "ok": False}
+    start = time.perf_counter()
+    try:
+        csv_path = os.path.join(folder, "annotations.csv")
+        t0 = time.perf_counter()
+        df = read_annotations(csv_path)
+        read_seconds = time.perf_counter() - t0
+        stats = {}
+        project = find_project(folder, view, animal, scorer) if update else None
+        if project:
+            report = update_dlc_structure(project, df, image_strategy=images, workers=workers, skip=skip,
+                                          backend=backend, project_store=project_store, dry_run=dry_run,
+                                          stats=stats)
+            summary["update"] = format_update_report(report)
+        elif dry_run:
+            raise FileNotFoundError(f"No {view}{animal}-{scorer}-* project in {folder} to update")
+        else:
+            create_dlc_structure(folder, df, scorer, view, animal,
+                                 image_strategy=images, workers=workers, skip=skip, stats=stats,
+                                 backend=backend, project_store=project_store)
+        stats["seconds"] = {"read": read_seconds, **stats["seconds"]}
+        images_report = stats.pop("images")
+        summary.update(stats)
+        summary.update({
+            "ok": True,
+            "images_staged": images_report["staged"],
+            "images_skipped": images_report["skipped"],
+            "images_missing": images_report["missing"],
+            "images_failed": images_report["failed"],
+            "images_linked_bytes": images_report["linked_bytes"],
+        })
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+        summary["traceback"] = traceback.format_exc()
+    summary["total_seconds"] = time.perf_counter() - start
+    return summary
+
+
+def load_manifest(path):
+    """
+    Read conversion jobs from a CSV or JSON manifest into a list of dicts.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            jobs = json.load(f)
+    else:
+        jobs = pd.read_csv(path, dtype=str).fillna("").to_dict("records")
+    for job in jobs:
+        missing = {"folder", "view", "animal"} - {k for k, v in job.items() if v}
+        if missing:
+            raise ValueError(f"Manifest entry {job} is missing {sorted(missing)}")
+    return jobs
+
+
+def run_batch(jobs, processes=None, workers=8, skip="size_mtime", backend="table", project_store=False,
+              update=False, dry_run=False):
+    """
+    Convert every job (dict with folder, view, animal, optional scorer/images) in
+    a process pool. Returns the summaries in job order.
+    """
+    processes = processes or min(len(jobs), os.cpu_count() or 1)
+    summaries = [None] * len(jobs)
+    with ProcessPoolExecutor(max(1, processes)) as pool:
+        futures = {
+            pool.submit(
+                convert_folder,
+                job["folder"], job["view"], job["animal"],
+                job.get("scorer") or "jm", job.get("images") or "copy", workers, skip,
+                backend, project_store, update, dry_run,
+            ): i
+            for i, job in enumerate(jobs)
+        }
+        for fut in as_completed(futures):
+            i = futures[fut]
+            summaries[i] = fut.result()
+            s = summaries[i]
+            status = "ok" if s["ok"] else f"FAILED ({s['error']})"
+            print(f"[{sum(x is not None for x in summaries)}/{len(jobs)}] {s['folder']}: {status}", flush=True)
+    return summaries
+
+
+def format_summary(summaries):
+    """
+    Plain-text table of run_batch results.
+    """
+    stages = ["read", "config", "keypoints", "images"]
+    header = f"{'folder':40} {'frames':>7} {'subj':>5} {'MB':>8} " + " ".join(f"{s:>9}" for s in stages) + f" {'total':>8}"
+    lines = [header, "-" * len(header)]
+    for s in summaries:
+        if not s["ok"]:
+            lines.append(f"{s['folder'][-40:]:40} FAILED: {s['error']}")
+            continue
+        secs = " ".join(f"{s['seconds'].get(st, 0):9.2f}" for st in stages)
+        lines.append(
+            f"{s['folder'][-40:]:40} {s['frames']:7d} {s['subjects']:5d} {s['bytes_written'] / 1e6:8.1f} "
+            f"{secs} {s['total_seconds']:8.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build DeepLabCut projects for many annotation folders without the GUI.")
+    parser.add_argument("folders", nargs="*", help="annotation folders (each with annotations.csv and Images/)")
+    parser.add_argument("--manifest", help="CSV/JSON with folder, view, animal[, scorer, images] per job")
+    parser.add_argument("--view", choices=["top", "side", "bottom"], help="view for folders given on the command line")
+    parser.add_argument("--animal", choices=["rat", "mouse"], help="animal for folders given on the command line")
+    parser.add_argument("--scorer", default="jm")
+    parser.add_argument("--images", choices=STRATEGIES, default="copy", help="image staging strategy")
+    parser.add_argument("--skip", choices=SKIP_MODES, default="size_mtime", help="how to detect unchanged images")
+    parser.add_argument("--backend", choices=OUTPUT_BACKENDS, default="table", help="CollectedData HDF5 format")
+    parser.add_argument("--project-store", action="store_true", help="also write keypoints_<scorer>.h5 with all subjects")
+    parser.add_argument("--update", action="store_true", help="update the latest existing project incrementally")
+    parser.add_argument("--dry-run", action="store_true", help="with --update: only report what would change")
+    parser.add_argument("--processes", type=int, help="projects built concurrently (default: one per CPU)")
+    parser.add_argument("--workers", type=int, default=8, help="image staging threads per project")
+    parser.add_argument("--json", help="write the structured summary to this file")
+    instrument.add_argument(parser)
+    args = parser.parse_args(argv)
+    instrument.from_args(args)
+
+    jobs = load_manifest(args.manifest) if args.manifest else []
+    for job in jobs:
+        job["scorer"] = job.get("scorer") or args.scorer
+        job["images"] = job.get("images") or args.images
+    if args.folders:
+        if not (args.view and args.animal):
+            parser.error("--view and --animal are required for folders given on the command line")
+        jobs += [{"folder": f, "view": args.view, "animal": args.animal, "scorer": args.scorer, "images": args.images}
+                 for f in args.folders]
+    if not jobs:
+        parser.error("no folders or manifest given")
+
+    if args.dry_run and not args.update:
+        parser.error("--dry-run needs --update")
+    summaries = run_batch(jobs, args.processes, args.workers, args.skip, args.backend, args.project_store,
+                          args.update, args.dry_run)
+    for s in summaries:
+        if s.get("update"):
+            print(s["update"])
+    print(format_summary(summaries))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+    return 0 if all(s["ok"] for s in summaries) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
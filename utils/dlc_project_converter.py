@@ -1,12 +1,18 @@
 import os
 import datetime
+import shutil
+import time
+import numpy as np
 import pandas as pd
 import h5py
-import shutil
-import FreeSimpleGUI as sg
+
+import instrument
+from image_staging import STRATEGIES, format_report, stage_images
 
 # Constants
 KEYPOINT_SUFFIX = ["-x", "-y"]
+H5_KEY = 'collected_data'
+OUTPUT_BACKENDS = ['table', 'fixed']
 
 
 def extract_id(filename):
@@ -19,6 +25,7 @@ def extract_id(filename):
     return None
 
 
+@instrument.instrumented('dlc.read_annotations')
 def read_annotations(csv_path):
     """
     Read annotations CSV and drop only bounding-box columns.
@@ -92,11 +99,131 @@ def write_config(project_path, task, scorer, date_str, bodyparts, subject_ids):
         f.write("move2corner: true\n")
 
 
-def create_dlc_structure(base_folder, annotations_df, scorer, view, animal):
+def collected_data_columns(scorer, bodyparts):
+    """
+    DLC column header: (scorer, bodypart, x/y) for each bodypart.
+    """
+    return pd.MultiIndex.from_product(
+        [[scorer], bodyparts, ['x', 'y']],
+        names=['scorer', 'bodyparts', 'coords']
+    )
+
+
+def bodyparts_from_columns(columns):
+    """
+    Bodypart names from the '<bp>-x' columns, in original order.
+    """
+    bodyparts = []
+    for col in columns:
+        if col.endswith('-x'):
+            bp = col[:-2]
+            if bp not in bodyparts:
+                bodyparts.append(bp)
+    return bodyparts
+
+
+def frames_by_subject(annotations_df, scorer, bodyparts, ids=None):
+    """
+    Reorder columns once (x then y for each bodypart in original sequence) and sort
+    the rows with a subject ID by subject, so each subject is a contiguous slice.
+    Returns (coords_df with CollectedData columns, filenames, subject per row, offsets):
+    rows offsets[i]:offsets[i+1] belong to one subject.
+    """
+    ids = annotations_df['ID'] if ids is None else ids
+    ordered_cols = []
+    for bp in bodyparts:
+        ordered_cols.append(f"{bp}-x")
+        ordered_cols.append(f"{bp}-y")
+    has_id = ids.notna().to_numpy()
+    labeled = annotations_df[has_id]
+    order = np.argsort(ids[has_id].to_numpy(dtype=str), kind='stable')
+    coords_df = labeled.reindex(columns=ordered_cols).iloc[order]
+    coords_df.columns = collected_data_columns(scorer, bodyparts)
+    filenames = labeled['filename'].to_numpy()[order]
+    sorted_ids = ids[has_id].to_numpy()[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(order) else np.array([], int)
+    offsets = np.r_[starts, len(order)]
+    return coords_df, filenames, sorted_ids, offsets
+
+
+def write_collected_data(df_out, subfld, scorer, backend='table'):
+    """
+    Save CollectedData_<scorer>.csv and .h5 for one subject; returns bytes written.
+    backend 'table' writes the HDF5 in pandas table format (appendable, slow to write),
+    'fixed' in pandas fixed format (much faster and smaller, still read by pd.read_hdf / DLC).
+    """
+    if backend not in OUTPUT_BACKENDS:
+        raise ValueError(f"Unknown output backend '{backend}', expected one of {OUTPUT_BACKENDS}")
+    csv_path = os.path.join(subfld, f"CollectedData_{scorer}.csv")
+    df_out.to_csv(csv_path, index=True)
+    h5_path = os.path.join(subfld, f"CollectedData_{scorer}.h5")
+    df_out.to_hdf(h5_path, key=H5_KEY, mode='w', format=backend)
+    return os.path.getsize(csv_path) + os.path.getsize(h5_path)
+
+
+def write_project_store(path, scorer, bodyparts, subject_ids, offsets, filenames, coords):
+    """
+    Write all subjects' keypoints into one HDF5 file with h5py:
+    coords (frames, bodyparts, 2) float32, chunked and gzip-compressed, filenames,
+    subjects and subject_offsets (rows offsets[i]:offsets[i+1] belong to subjects[i]).
+    """
+    coords = np.asarray(coords, dtype=np.float32).reshape(len(filenames), len(bodyparts), 2)
+    str_dt = h5py.string_dtype()
+    with h5py.File(path, 'w') as f:
+        f.attrs['scorer'] = scorer
+        f.create_dataset('bodyparts', data=np.array(bodyparts, dtype=object), dtype=str_dt)
+        f.create_dataset(
+            'coords', data=coords,
+            chunks=(max(1, min(len(coords), 4096)), len(bodyparts), 2) if coords.size else None,
+            compression='gzip' if coords.size else None, shuffle=bool(coords.size),
+        )
+        f.create_dataset('filenames', data=np.array(filenames, dtype=object), dtype=str_dt)
+        f.create_dataset('subjects', data=np.array(subject_ids, dtype=object), dtype=str_dt)
+        f.create_dataset('subject_offsets', data=np.asarray(offsets, dtype=np.int64))
+
+
+def read_project_store(path, subject=None):
+    """
+    Load a keypoints_<scorer>.h5 store (all subjects, or one) as a DataFrame in the
+    CollectedData layout, reading only the rows of the requested subject.
+    """
+    with h5py.File(path, 'r') as f:
+        scorer = f.attrs['scorer']
+        bodyparts = [b.decode() if isinstance(b, bytes) else b for b in f['bodyparts'][()]]
+        subjects = [s.decode() if isinstance(s, bytes) else s for s in f['subjects'][()]]
+        offsets = f['subject_offsets'][()]
+        if subject is None:
+            a, b = 0, int(offsets[-1])
+        else:
+            i = subjects.index(subject)
+            a, b = int(offsets[i]), int(offsets[i + 1])
+        coords = f['coords'][a:b]
+        filenames = [n.decode() if isinstance(n, bytes) else n for n in f['filenames'][a:b]]
+        row_subjects = np.repeat(subjects, np.diff(offsets))[a:b]
+    index = [os.path.join('labeled-data', sid, fn) for sid, fn in zip(row_subjects, filenames)]
+    return pd.DataFrame(coords.reshape(len(index), -1), index=index,
+                        columns=collected_data_columns(scorer, bodyparts))
+
+
+@instrument.instrumented('dlc.create_dlc_structure')
+def create_dlc_structure(base_folder, annotations_df, scorer, view, animal,
+                         image_strategy='copy', workers=8, skip='size_mtime', stats=None,
+                         backend='table', project_store=False):
     """
     Build DeepLabCut project: write config and export per-subject keypoint files
     preserving original column order and alignment.
+    Images are staged with `image_strategy` (copy, hardlink, reflink, symlink) in a
+    thread pool after all subjects are written; unchanged images are skipped
+    (`skip`: size_mtime, hash or none, see image_staging.stage_images).
+    `backend` selects the HDF5 layout of the CollectedData files (see
+    write_collected_data); `project_store` also writes keypoints_<scorer>.h5
+    with all subjects (see write_project_store).
+    If `stats` is a dict it is filled with frames, subjects, bytes written,
+    the image staging report and seconds per stage.
     """
+    stats = {} if stats is None else stats
+    stage_times = stats.setdefault('seconds', {})
+    t0 = time.perf_counter()
     date_str = datetime.datetime.now().strftime('%Y-%m-%d')
     project_name = f"{view}{animal}-{scorer}-{date_str}"
     project_path = os.path.join(base_folder, project_name)
@@ -106,13 +233,7 @@ def create_dlc_structure(base_folder, annotations_df, scorer, view, animal):
     os.makedirs(vid_dir, exist_ok=True)
 
     # Determine bodyparts in original order
-    bp_list = []
-    for col in annotations_df.columns:
-        if col.endswith('-x'):
-            bp = col[:-2]
-            if bp not in bp_list:
-                bp_list.append(bp)
-    bodyparts = bp_list
+    bodyparts = bodyparts_from_columns(annotations_df.columns)
     task = f"{view}{animal}"
 
     # Prepare subject IDs
@@ -121,46 +242,326 @@ def create_dlc_structure(base_folder, annotations_df, scorer, view, animal):
 
     # Write config with correct bodyparts order
     write_config(project_path, task, scorer, date_str, bodyparts, subject_ids)
+    bytes_written = os.path.getsize(os.path.join(project_path, 'config.yaml'))
+    t1 = time.perf_counter()
+    stage_times['config'] = t1 - t0
 
-    # Export data for each subject
-    for sid, group in annotations_df.groupby('ID'):
-        subfld = os.path.join(ld, sid)
-        os.makedirs(subfld, exist_ok=True)
-        # Copy images into subject folder
-        for fname in group['filename']:
-            src_img = os.path.join(base_folder, 'Images', fname)
-            dst_img = os.path.join(subfld, fname)
-            if os.path.exists(src_img):
-                shutil.copy(src_img, dst_img)
-        # Index by filename to preserve original column alignment
-        grp = group.set_index('filename', drop=True)
-        # Build ordered columns list: x then y for each bodypart in original sequence
-        ordered_cols = []
-        for bp in bodyparts:
-            ordered_cols.append(f"{bp}-x")
-            ordered_cols.append(f"{bp}-y")
-        # Slice DataFrame directly
-        df_out = grp.reindex(columns=ordered_cols)
-        # Create MultiIndex header
-        mi = pd.MultiIndex.from_product(
-            [[scorer], bodyparts, ['x', 'y']],
-            names=['scorer', 'bodyparts', 'coords']
-        )
-        df_out.columns = mi
-        # Set index to relative paths
-        df_out.index = [os.path.join('labeled-data', sid, fn) for fn in df_out.index]
-        # Save CSV
-        csv_path = os.path.join(subfld, f"CollectedData_{scorer}.csv")
-        df_out.to_csv(csv_path, index=True)
-        # Save H5
-        h5_path = os.path.join(subfld, f"CollectedData_{scorer}.h5")
-        df_out.to_hdf(h5_path, key='collected_data', mode='w', format='table')
-
-    sg.popup(f"DeepLabCut project created at: {project_path}")
+    with instrument.stage('dlc.keypoints', items=len(annotations_df)) as rec:
+        # Export data for each subject in one pass (see frames_by_subject)
+        coords_df, filenames, sorted_ids, offsets = frames_by_subject(annotations_df, scorer, bodyparts)
+
+        image_jobs = []
+        for i, (a, b) in enumerate(zip(offsets[:-1], offsets[1:])):
+            sid = sorted_ids[a]
+            subfld = os.path.join(ld, sid)
+            os.makedirs(subfld, exist_ok=True)
+            # Queue images for the subject folder
+            for fname in filenames[a:b]:
+                image_jobs.append((os.path.join(base_folder, 'Images', fname), os.path.join(subfld, fname)))
+            df_out = coords_df.iloc[a:b]
+            # Set index to relative paths
+            df_out.index = [os.path.join('labeled-data', sid, fn) for fn in filenames[a:b]]
+            bytes_written += write_collected_data(df_out, subfld, scorer, backend)
+
+        if project_store:
+            store_path = os.path.join(project_path, f"keypoints_{scorer}.h5")
+            write_project_store(store_path, scorer, bodyparts, sorted_ids[offsets[:-1]],
+                                offsets, filenames, coords_df.to_numpy(dtype=np.float32))
+            bytes_written += os.path.getsize(store_path)
+        rec.add(bytes_written=bytes_written)
+    t2 = time.perf_counter()
+    stage_times['keypoints'] = t2 - t1
+
+    # Stage all images at once so the copies run in parallel
+    manifest = os.path.join(project_path, '.image_manifest.json') if skip == 'hash' else None
+    with instrument.stage('dlc.images', items=len(image_jobs), strategy=image_strategy) as rec:
+        report = stage_images(image_jobs, image_strategy, workers, skip, manifest)
+        rec.add(bytes_written=report['bytes'])
+    stage_times['images'] = time.perf_counter() - t2
+
+    stats.update({
+        'project_path': project_path,
+        'frames': len(annotations_df),
+        'subjects': len(subject_ids),
+        'bytes_written': bytes_written + report['bytes'],
+        'images': report,
+        'image_strategy': image_strategy,
+    })
     return project_path
 
 
+def _config_block(lines, key):
+    """
+    (start, end) line range of a top-level `key:` block in config.yaml: the key line
+    and the indented / '- ' lines that follow it. (None, None) if the key is missing.
+    """
+    for i, line in enumerate(lines):
+        if line.rstrip() == f"{key}:":
+            j = i + 1
+            while j < len(lines) and (lines[j].startswith((' ', '-')) or not lines[j].strip()):
+                j += 1
+            # keep the blank separator line(s) after the block
+            while j > i + 1 and not lines[j - 1].strip():
+                j -= 1
+            return i, j
+    return None, None
+
+
+def read_config(project_path):
+    """
+    The fields of config.yaml the incremental update needs: scorer, project_path,
+    bodyparts and video_sets ({video path: its lines}, so crop settings are kept).
+    """
+    with open(os.path.join(project_path, 'config.yaml'), 'r') as f:
+        lines = f.read().splitlines()
+    cfg = {'lines': lines, 'bodyparts': [], 'video_sets': {}}
+    for line in lines:
+        for key in ('scorer', 'project_path'):
+            if line.startswith(f"{key}:"):
+                cfg[key] = line.split(':', 1)[1].strip()
+    a, b = _config_block(lines, 'bodyparts')
+    if a is not None:
+        cfg['bodyparts'] = [l.strip()[2:].strip() for l in lines[a + 1:b] if l.strip().startswith('- ')]
+    a, b = _config_block(lines, 'video_sets')
+    if a is not None:
+        current = None
+        for line in lines[a + 1:b]:
+            if line.startswith('  ') and not line.startswith('   '):
+                current = line.strip()
+                current = current[:-1] if current.endswith(':') else current.rsplit(': ', 1)[0]
+                cfg['video_sets'][current] = [line]
+            elif current is not None and line.strip():
+                cfg['video_sets'][current].append(line)
+    return cfg
+
+
+def update_config(project_path, bodyparts, subject_ids, dry_run=False):
+    """
+    Update the bodyparts and video_sets blocks of config.yaml in place; all other lines
+    (skeleton, training settings, edits made in DLC) stay as they are. Videos of
+    remaining subjects keep their entries. Returns the changes.
+    """
+    cfg = read_config(project_path)
+    lines = cfg['lines']
+    base = cfg.get('project_path') or project_path
+    by_subject = {os.path.splitext(os.path.basename(v))[0]: v for v in cfg['video_sets']}
+    videos = []
+    for sid in subject_ids:
+        if sid in by_subject:
+            videos += cfg['video_sets'][by_subject[sid]]
+        else:
+            videos.append(f"  {os.path.join(base, 'videos', f'{sid}.mkv')}: null")
+    changes = {
+        'bodyparts_before': cfg['bodyparts'],
+        'bodyparts_after': list(bodyparts),
+        'videos_added': sorted(set(subject_ids) - set(by_subject)),
+        'videos_removed': sorted(set(by_subject) - set(subject_ids)),
+    }
+    changes['changed'] = bool(changes['bodyparts_before'] != changes['bodyparts_after']
+                              or changes['videos_added'] or changes['videos_removed'])
+    if not changes['changed'] or dry_run:
+        return changes
+    for key, block in (('video_sets', videos), ('bodyparts', [f"- {bp}" for bp in bodyparts])):
+        a, b = _config_block(lines, key)
+        if a is None:
+            lines += ['', f"{key}:"] + block
+        else:
+            lines[a + 1:b] = block
+    cfg_path = os.path.join(project_path, 'config.yaml')
+    with open(cfg_path + '.tmp', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(cfg_path + '.tmp', cfg_path)
+    return changes
+
+
+def read_collected_data(subfld, scorer):
+    """
+    Stored CollectedData_<scorer> of one subject (.h5, else .csv), or None.
+    """
+    h5_path = os.path.join(subfld, f"CollectedData_{scorer}.h5")
+    if os.path.isfile(h5_path):
+        return pd.read_hdf(h5_path)
+    csv_path = os.path.join(subfld, f"CollectedData_{scorer}.csv")
+    if os.path.isfile(csv_path):
+        return pd.read_csv(csv_path, header=[0, 1, 2], index_col=0)
+    return None
+
+
+def _row_keys(values):
+    """
+    One hashable key per row from the float32 bytes of its coordinates (NaNs unified).
+    """
+    values = np.array(values, dtype=np.float32)
+    values[np.isnan(values)] = np.nan
+    values = np.ascontiguousarray(values)
+    return values.view(np.dtype((np.void, values.dtype.itemsize * values.shape[1]))).ravel()
+
+
+def diff_subject(old, new):
+    """
+    Compare a stored CollectedData frame with the new one of the same subject by
+    filename and coordinate bytes. Returns counts of added, removed and modified
+    frames and whether the file has to be rewritten.
+    """
+    new_names = [os.path.basename(p) for p in new.index]
+    if old is None:
+        return {'status': 'added', 'added': new_names, 'removed': [], 'modified': 0, 'rewrite': True}
+    old_names = [os.path.basename(str(p)) for p in old.index]
+    added = sorted(set(new_names) - set(old_names))
+    removed = sorted(set(old_names) - set(new_names))
+    same_layout = list(old.columns) == list(new.columns)
+    modified = 0
+    if same_layout:
+        old_keys = dict(zip(old_names, _row_keys(old.to_numpy())))
+        modified = sum(1 for name, key in zip(new_names, _row_keys(new.to_numpy()))
+                       if name in old_keys and old_keys[name] != key)
+    else:
+        modified = len(set(new_names) & set(old_names))
+    rewrite = bool(added or removed or modified or not same_layout or old_names != new_names)
+    return {'status': 'changed' if rewrite else 'unchanged', 'added': added, 'removed': removed,
+            'modified': modified, 'rewrite': rewrite}
+
+
+@instrument.instrumented('dlc.update_dlc_structure')
+def update_dlc_structure(project_path, annotations_df, image_strategy='copy', workers=8, skip='size_mtime',
+                         backend='table', project_store=False, dry_run=False, stats=None):
+    """
+    Bring an existing DLC project up to date with `annotations_df` instead of building
+    a new one: only subjects whose frames (by filename) or coordinates (by float32
+    bytes) differ from the stored CollectedData are rewritten, only images of added
+    frames are staged and those of removed frames deleted, subjects no longer in the
+    annotations are removed, and bodyparts/video_sets are updated in config.yaml in
+    place. A keypoints_<scorer>.h5 store is rewritten if present (or `project_store`).
+    With `dry_run` nothing is written; the report says what would change.
+    Returns the report (see format_update_report); `stats` is filled like
+    create_dlc_structure does.
+    """
+    stats = {} if stats is None else stats
+    stage_times = stats.setdefault('seconds', {})
+    t0 = time.perf_counter()
+    scorer = read_config(project_path).get('scorer')
+    if not scorer:
+        raise ValueError(f"No scorer in {os.path.join(project_path, 'config.yaml')}")
+    ld = os.path.join(project_path, 'labeled-data')
+    base_folder = os.path.dirname(os.path.abspath(project_path))
+
+    bodyparts = bodyparts_from_columns(annotations_df.columns)
+    ids = annotations_df['filename'].apply(extract_id)
+    subject_ids = sorted(ids.dropna().unique())
+    config = update_config(project_path, bodyparts, subject_ids, dry_run)
+    t1 = time.perf_counter()
+    stage_times['config'] = t1 - t0
+
+    coords_df, filenames, sorted_ids, offsets = frames_by_subject(annotations_df, scorer, bodyparts, ids)
+    existing = sorted(e.name for e in os.scandir(ld) if e.is_dir()) if os.path.isdir(ld) else []
+    subjects = {}
+    image_jobs, image_removals = [], []
+    bytes_written = 0
+    for a, b in zip(offsets[:-1], offsets[1:]):
+        sid = sorted_ids[a]
+        subfld = os.path.join(ld, sid)
+        df_out = coords_df.iloc[a:b]
+        df_out.index = [os.path.join('labeled-data', sid, fn) for fn in filenames[a:b]]
+        diff = diff_subject(read_collected_data(subfld, scorer), df_out)
+        subjects[sid] = diff
+        if not diff['rewrite']:
+            continue
+        image_jobs += [(os.path.join(base_folder, 'Images', fn), os.path.join(subfld, fn)) for fn in diff['added']]
+        image_removals += [os.path.join(subfld, fn) for fn in diff['removed']]
+        if not dry_run:
+            os.makedirs(subfld, exist_ok=True)
+            bytes_written += write_collected_data(df_out, subfld, scorer, backend)
+    for sid in existing:
+        if sid not in subjects:
+            subjects[sid] = {'status': 'removed', 'added': [], 'removed': [], 'modified': 0, 'rewrite': True}
+            if not dry_run:
+                shutil.rmtree(os.path.join(ld, sid))
+
+    changed = any(d['rewrite'] for d in subjects.values())
+    store_path = os.path.join(project_path, f"keypoints_{scorer}.h5")
+    store = (project_store or os.path.isfile(store_path)) and (changed or not os.path.isfile(store_path))
+    if store and not dry_run:
+        write_project_store(store_path, scorer, bodyparts, sorted_ids[offsets[:-1]],
+                            offsets, filenames, coords_df.to_numpy(dtype=np.float32))
+        bytes_written += os.path.getsize(store_path)
+    t2 = time.perf_counter()
+    stage_times['keypoints'] = t2 - t1
+
+    if dry_run:
+        images = {'staged': 0, 'skipped': 0, 'missing': 0, 'failed': 0, 'bytes': 0, 'linked_bytes': 0,
+                  'errors': [], 'seconds': 0.0}
+    else:
+        for path in image_removals:
+            if os.path.lexists(path):
+                os.remove(path)
+        manifest = os.path.join(project_path, '.image_manifest.json') if skip == 'hash' else None
+        images = stage_images(image_jobs, image_strategy, workers, skip, manifest)
+    stage_times['images'] = time.perf_counter() - t2
+
+    report = {
+        'project_path': project_path,
+        'dry_run': dry_run,
+        'config': config,
+        'subjects': subjects,
+        'project_store': bool(store),
+        'images_to_add': len(image_jobs),
+        'images_to_remove': len(image_removals),
+    }
+    stats.update({
+        'project_path': project_path,
+        'frames': len(annotations_df),
+        'subjects': len(subject_ids),
+        'subjects_rewritten': sum(d['status'] in ('added', 'changed') for d in subjects.values()),
+        'subjects_removed': sum(d['status'] == 'removed' for d in subjects.values()),
+        'bytes_written': bytes_written + images['bytes'],
+        'images': images,
+        'image_strategy': image_strategy,
+    })
+    return report
+
+
+def format_update_report(report):
+    """
+    Plain-text summary of an update_dlc_structure report.
+    """
+    subjects = report['subjects']
+    counts = {s: sum(d['status'] == s for d in subjects.values()) for s in ('added', 'changed', 'removed', 'unchanged')}
+    lines = [
+        f"{'Dry run: would update' if report['dry_run'] else 'Updated'} {report['project_path']}",
+        f"Subjects: {counts['added']} added, {counts['changed']} changed, "
+        f"{counts['removed']} removed, {counts['unchanged']} unchanged",
+    ]
+    for sid, d in sorted(subjects.items()):
+        if d['status'] == 'changed':
+            lines.append(f"  {sid}: +{len(d['added'])} frames, -{len(d['removed'])} frames, {d['modified']} modified")
+        elif d['status'] in ('added', 'removed'):
+            lines.append(f"  {sid}: subject {d['status']}")
+    cfg = report['config']
+    if cfg['bodyparts_before'] != cfg['bodyparts_after']:
+        added = [bp for bp in cfg['bodyparts_after'] if bp not in cfg['bodyparts_before']]
+        removed = [bp for bp in cfg['bodyparts_before'] if bp not in cfg['bodyparts_after']]
+        lines.append(f"Bodyparts: +{added} -{removed}" + (" (reordered)" if not added and not removed else ""))
+    if cfg['videos_added'] or cfg['videos_removed']:
+        lines.append(f"video_sets: +{len(cfg['videos_added'])} -{len(cfg['videos_removed'])}")
+    lines.append(f"Images: {report['images_to_add']} to add, {report['images_to_remove']} to remove")
+    if report['project_store']:
+        lines.append("Project store: rewritten")
+    return "\n".join(lines)
+
+
+def find_project(base_folder, view, animal, scorer):
+    """
+    Most recent project folder <view><animal>-<scorer>-<date> in base_folder, or None.
+    """
+    prefix = f"{view}{animal}-{scorer}-"
+    projects = sorted(e.name for e in os.scandir(base_folder)
+                      if e.is_dir() and e.name.startswith(prefix)) if os.path.isdir(base_folder) else []
+    return os.path.join(base_folder, projects[-1]) if projects else None
+
+
 def build_gui():
+    # imported here so headless use (dlc_batch.py) does not need a display or the GUI toolkit
+    import FreeSimpleGUI as sg
     try: sg.theme('DarkBlue')
     except: sg.ChangeLookAndFeel('Dark')
     layout = [
@@ -168,12 +569,14 @@ def build_gui():
         [sg.Text('Scorer:'), sg.Input('jm', key='-S-')],
         [sg.Text('View:'), sg.Combo(['top','side','bottom'], default_value='top', key='-V-')],
         [sg.Text('Animal:'), sg.Combo(['rat','mouse'], default_value='mouse', key='-A-')],
-        [sg.Button('Analyze Keypoints'), sg.Button('Create DLC'), sg.Button('Exit')]
+        [sg.Text('Images:'), sg.Combo(STRATEGIES, default_value='copy', key='-I-')],
+        [sg.Button('Analyze Keypoints'), sg.Button('Create DLC'), sg.Button('Update DLC'), sg.Button('Exit')]
     ]
     return sg.Window('DLC Converter', layout)
 
 
 def main():
+    import FreeSimpleGUI as sg
     window = build_gui()
     while True:
         event, vals = window.read()
@@ -185,30 +588,43 @@ def main():
             if not os.path.isfile(csvp):
                 sg.popup_error('Select folder with annotations.csv')
                 continue
-            raw = pd.read_csv(csvp)
-            parts = []
-            for col in raw.columns:
-                if col.endswith('-x'):
-                    bp = col[:-2]
-                    if bp not in parts:
-                        parts.append(bp)
-            labeled = [p for p in parts if raw[f"{p}-x"].notna().any()]
-            missing = [p for p in parts if p not in labeled]
-            msg = f"Labeled ({len(labeled)}): " + ", ".join(labeled)
-            msg += f"\nMissing ({len(missing)}): " + ", ".join(missing)
-            sg.popup_scrolled(msg, title='Keypoints')
+            # one vectorized pass, cached next to the CSV until it changes
+            from keypoint_report import analyze_file, format_keypoints
+            sg.popup_scrolled(format_keypoints(analyze_file(csvp)), title='Keypoints')
         elif event == 'Create DLC':
             if not os.path.isfile(csvp):
                 sg.popup_error('annotations.csv missing')
                 continue
             df_ann = read_annotations(csvp)
-            create_dlc_structure(
+            stats = {}
+            project_path = create_dlc_structure(
                 base,
                 df_ann,
                 vals['-S-'],
                 vals['-V-'],
-                vals['-A-']
+                vals['-A-'],
+                image_strategy=vals['-I-'],
+                stats=stats,
             )
+            sg.popup(f"DeepLabCut project created at: {project_path}\n\n"
+                     f"{format_report(stats['images'], stats['image_strategy'])}")
+        elif event == 'Update DLC':
+            if not os.path.isfile(csvp):
+                sg.popup_error('annotations.csv missing')
+                continue
+            project_path = find_project(base, vals['-V-'], vals['-A-'], vals['-S-'])
+            if project_path is None:
+                sg.popup_error('No existing project for this view/animal/scorer, use Create DLC')
+                continue
+            df_ann = read_annotations(csvp)
+            preview = update_dlc_structure(project_path, df_ann, dry_run=True)
+            if sg.popup_yes_no(format_update_report(preview) + "\n\nApply these changes?",
+                               title='Update DLC') != 'Yes':
+                continue
+            stats = {}
+            report = update_dlc_structure(project_path, df_ann, image_strategy=vals['-I-'], stats=stats)
+            sg.popup(f"{format_update_report(report)}\n\n"
+                     f"{format_report(stats['images'], stats['image_strategy'])}")
     window.close()
 
 if __name__ == '__main__':
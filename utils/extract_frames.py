@@ -0,0 +1,255 @@
+## Extract frames for labeling straight from the subject videos (videos/<subject_id>.mkv):
+## each video is decoded as a stream with cv2 (one frame in memory at a time), candidates
+## every `stride` frames are compared with the frames kept so far on a tiny grayscale
+## thumbnail, and only frames that differ enough are resized to the target size and
+## written. Videos are processed in parallel worker processes.
+## Frame files are named <prefix>_<subject_id>_F<frame>.png, so extract_id() gives the
+## subject back (e.g. R12_20240924_M60_2_V01_F0789.png -> 20240924_M60_2_V01).
+##   python extract_frames.py Rat/top/videos Rat/top/Images --prefix R12 --stride 5 --max-frames 300
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from dlc_project_converter import extract_id
+
+TARGET_SIZE = (1280, 720)
+VIDEO_EXTENSIONS = (".mkv", ".mp4", ".avi", ".mov")
+THUMB_SIZE = (32, 18)          # diversity feature: grayscale thumbnail, 576 values
+THRESHOLD = 0.1                # minimum cosine distance to every remembered kept frame
+MEMORY = 256                   # kept frames the candidate is compared with (most recent)
+FRAME_LIST = "extracted_frames.csv"
+
+
+def _init_worker():
+    import cv2
+    # one OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def subject_from_video(path):
+    """
+    (prefix, subject_id) from a video file name: <subject_id>.mkv, or a name that
+    extract_id already parses (e.g. R12_20240924_M60_2_V01.mkv -> 'R12', '20240924_M60_2_V01').
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parts = stem.split("_")
+    if len(parts) == 4:
+        return None, stem
+    if len(parts) >= 5:
+        return parts[0], extract_id(stem)
+    raise ValueError(f"Cannot derive a subject ID (4 underscore-separated parts) from {path!r}")
+
+
+def frame_filename(prefix, subject_id, frame_index, ext=".png"):
+    """
+    <prefix>_<subject_id>_F<frame>.png; checked to parse back with extract_id.
+    """
+    name = f"{prefix}_{subject_id}_F{frame_index:04d}{ext}"
+    if extract_id(name) != subject_id:
+        raise ValueError(f"Subject ID {subject_id!r} does not round-trip through extract_id ({name!r})")
+    return name
+
+
+def frame_feature(frame, size=THUMB_SIZE):
+    """
+    Zero-mean, unit-norm grayscale thumbnail of a BGR frame (float32 vector), so the
+    dot product of two features is their correlation.
+    """
+    import cv2
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    small -= small.mean()
+    norm = np.linalg.norm(small)
+    return small / norm if norm > 0 else small
+
+
+class DiversitySampler:
+    """
+    Keeps a frame when its feature is at least `threshold` away (1 - correlation) from
+    all of the last `memory` kept features. The kept features live in a preallocated
+    ring buffer, so each decision is one (memory x features) matrix-vector product.
+    """
+
+    def __init__(self, threshold=THRESHOLD, memory=MEMORY, n_features=THUMB_SIZE[0] * THUMB_SIZE[1]):
+        self.threshold = threshold
+        self.features = np.zeros((memory, n_features), dtype=np.float32)
+        self.count = 0
+
+    def distance(self, feature):
+        n = min(self.count, len(self.features))
+        if n == 0:
+            return 2.0
+        return float(1.0 - (self.features[:n] @ feature).max())
+
+    def offer(self, feature):
+        """
+        (keep, distance) for a candidate; kept features are remembered.
+        """
+        d = self.distance(feature)
+        if d < self.threshold:
+            return False, d
+        self.features[self.count % len(self.features)] = feature
+        self.count += 1
+        return True, d
+
+
+def _signature(video_path, params):
+    st = os.stat(video_path)
+    return {"size": st.st_size, "mtime": st.st_mtime_ns, **params}
+
+
+def _state_path(output_folder, subject_id):
+    return os.path.join(output_folder, f".extract_{subject_id}.json")
+
+
+def extract_video(video_path, output_folder, prefix=None, target_size=TARGET_SIZE, stride=5,
+                  threshold=THRESHOLD, max_frames=None, min_gap=0, ext=".png"):
+    """
+    Stream one video and write its diverse frames to output_folder. Every `stride`-th
+    frame is a candidate (frames in between are only grabbed, not converted); a
+    candidate is kept if the DiversitySampler accepts it and it is at least `min_gap`
+    frames after the previous kept one, until `max_frames` are kept. Kept frames are
+    resized to target_size and written atomically.
+    A finished video is skipped on the next run while the video and parameters are
+    unchanged. Returns a report with the kept frames.
+    """
+    import cv2
+    file_prefix, subject_id = subject_from_video(video_path)
+    prefix = prefix or file_prefix or "img"
+    params = {"prefix": prefix, "size": list(target_size), "stride": stride, "threshold": threshold,
+              "max_frames": max_frames, "min_gap": min_gap, "ext": ext}
+    state_path = _state_path(output_folder, subject_id)
+    signature = _signature(video_path, params)
+    if os.path.isfile(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("signature") == signature:
+            return dict(state["report"], resumed=True)
+
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise OSError(f"Cannot open video {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    sampler = DiversitySampler(threshold)
+    frames, index, last_kept = [], -1, None
+    try:
+        while max_frames is None or len(frames) < max_frames:
+            if not cap.grab():
+                break
+            index += 1
+            if index % stride or (last_kept is not None and index - last_kept < min_gap):
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                break
+            keep, dist = sampler.offer(frame_feature(frame))
+            if not keep:
+                continue
+            if (frame.shape[1], frame.shape[0]) != tuple(target_size):
+                frame = cv2.resize(frame, tuple(target_size), interpolation=cv2.INTER_AREA)
+            name = frame_filename(prefix, subject_id, index, ext)
+            tmp = os.path.join(output_folder, f".tmp_{name}")
+            if not cv2.imwrite(tmp, frame):
+                raise OSError(f"Could not write {tmp}")
+            os.replace(tmp, os.path.join(output_folder, name))
+            frames.append({"filename": name, "subject": subject_id, "frame": index,
+                           "time_s": index / fps if fps else None, "distance": min(dist, 1.0)})
+            last_kept = index
+    finally:
+        cap.release()
+
+    seconds = time.perf_counter() - start
+    report = {
+        "video": video_path,
+        "subject": subject_id,
+        "frames_read": index + 1,
+        "candidates": (index // stride) + 1 if index >= 0 else 0,
+        "kept": len(frames),
+        "seconds": seconds,
+        "fps_decoded": (index + 1) / seconds if seconds else 0.0,
+        "frames": frames,
+        "resumed": False,
+    }
+    with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "report": report}, f)
+    os.replace(state_path + ".tmp", state_path)
+    return report
+
+
+def find_videos(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(p for p in glob.glob(os.path.join(path, "*")) if p.lower().endswith(VIDEO_EXTENSIONS))
+
+
+def extract_frames(videos, output_folder, workers=None, **kwargs):
+    """
+    extract_video for every video in a process pool; writes the list of all kept
+    frames (filename, subject, frame, time_s, distance) to output_folder/extracted_frames.csv.
+    Returns the per-video reports in input order (failures have an 'error').
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    reports = [None] * len(videos)
+    workers = max(1, min(len(videos), workers or os.cpu_count() or 1))
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(extract_video, v, output_folder, **kwargs): i for i, v in enumerate(videos)}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                reports[i] = fut.result()
+            except Exception as e:
+                reports[i] = {"video": videos[i], "error": f"{type(e).__name__}: {e}", "kept": 0, "frames": []}
+            r = reports[i]
+            status = r.get("error") or f"{r['kept']} frames kept of {r['frames_read']}" + (" (unchanged)" if r["resumed"] else "")
+            print(f"[{sum(x is not None for x in reports)}/{len(videos)}] {os.path.basename(videos[i])}: {status}", flush=True)
+    rows = [f for r in reports for f in r["frames"]]
+    pd.DataFrame(rows, columns=["filename", "subject", "frame", "time_s", "distance"]).to_csv(
+        os.path.join(output_folder, FRAME_LIST), index=False)
+    return reports
+
+
+def _parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract diverse frames from subject videos for labeling.")
+    parser.add_argument("videos", nargs="+", help="video files or folders of videos (<subject_id>.mkv)")
+    parser.add_argument("output_folder", help="folder for the frame images (e.g. Rat/top/Images)")
+    parser.add_argument("--prefix", help="file name prefix (default: from the video name, else 'img')")
+    parser.add_argument("--size", type=_parse_size, default=TARGET_SIZE, help="output WIDTHxHEIGHT (default 1280x720)")
+    parser.add_argument("--stride", type=int, default=5, help="consider every Nth frame")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="minimum 1 - correlation to all recently kept frames (0 keeps every candidate)")
+    parser.add_argument("--min-gap", type=int, default=0, help="minimum frames between kept frames")
+    parser.add_argument("--max-frames", type=int, help="at most this many frames per video")
+    parser.add_argument("--ext", default=".png", choices=[".png", ".jpg"])
+    parser.add_argument("--workers", type=int, help="videos decoded in parallel (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    videos = [v for path in args.videos for v in find_videos(path)]
+    if not videos:
+        parser.error("no videos found")
+    reports = extract_frames(videos, args.output_folder, args.workers, prefix=args.prefix,
+                             target_size=args.size, stride=args.stride, threshold=args.threshold,
+                             max_frames=args.max_frames, min_gap=args.min_gap, ext=args.ext)
+    ok = [r for r in reports if "error" not in r]
+    print(f"\n{sum(r['kept'] for r in ok)} frames from {len(ok)} videos written to {args.output_folder} "
+          f"({sum(r['frames_read'] for r in ok)} frames decoded); list in {FRAME_LIST}")
+    failed = [r for r in reports if "error" in r]
+    for r in failed:
+        print(f"FAILED {r['video']}: {r['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
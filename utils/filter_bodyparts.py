@@ -1,8 +1,15 @@
-import os
+import argparse
+import csv
 import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 
-# 1) List of bodyparts to KEEP
+import instrument
+
+# 1) Default list of bodyparts to KEEP (override with --keep / --keep-file)
 KEEP_BPS = [
     "nose",
     "left_ear_base",
@@ -20,56 +27,147 @@ KEEP_BPS = [
     "head_midpoint",
 ]
 
-def filter_keypoints(df: pd.DataFrame) -> pd.DataFrame:
+H5_KEY = "collected_data"
+
+
+def filter_keypoints(df: pd.DataFrame, keep=KEEP_BPS) -> pd.DataFrame:
     """
     Given a dataframe with a 3‐level column index (scorer, bodypart, coord),
-    returns a new df keeping only columns whose bodypart is in KEEP_BPS.
+    returns a new df keeping only columns whose bodypart is in `keep`.
     """
-    cols = [col for col in df.columns if col[1] in KEEP_BPS]
+    keep = set(keep)
+    cols = [col for col in df.columns if col[1] in keep]
     return df.loc[:, cols]
 
-def process_subject_folder(subject_folder: str):
+
+def load_keep_list(path: str) -> list:
+    """
+    Read bodyparts to keep from a JSON list or a text file with one name per line
+    (blank lines and # comments ignored).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        return list(json.loads(text))
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+
+
+def read_header(csv_path: str):
+    """
+    The 3 header rows (scorer/bodyparts/coords) of a CollectedData CSV.
+    Returns (level names, list of column tuples), without reading any data rows.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        rows = [next(reader) for _ in range(3)]
+    names = [row[0] for row in rows]
+    columns = list(zip(*(row[1:] for row in rows)))
+    return names, columns
+
+
+def read_projected_csv(csv_path: str, keep) -> pd.DataFrame:
+    """
+    Load a CollectedData CSV with only the columns of the bodyparts in `keep`
+    (plus the index column): dropped columns are never parsed.
+    Returns None when every column is kept, i.e. there is nothing to filter.
+    """
+    names, columns = read_header(csv_path)
+    keep = set(keep)
+    kept = [i for i, col in enumerate(columns) if col[1] in keep]
+    if len(kept) == len(columns):
+        return None
+    df = pd.read_csv(csv_path, skiprows=3, header=None, index_col=0,
+                     usecols=[0] + [i + 1 for i in kept])
+    df.columns = pd.MultiIndex.from_tuples([columns[i] for i in kept], names=names)
+    df.index.name = None
+    return df
+
+
+def _atomic_write(path: str, write):
+    """
+    Call write(tmp_path), then rename over `path`, so readers never see a partial file.
+    The temp file is hidden (.<name>.tmp-<pid>), so a leftover of a killed run never
+    matches the CollectedData_*.csv/.h5 globs.
+    """
+    folder, name = os.path.split(path)
+    tmp = os.path.join(folder, f".{name}.tmp-{os.getpid()}")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _h5_layout(h5_path: str):
+    """
+    Key and format ('table' or 'fixed') of an existing CollectedData .h5.
+    """
+    with pd.HDFStore(h5_path, mode="r") as store:
+        keys = store.keys()
+        key = H5_KEY if f"/{H5_KEY}" in keys or not keys else keys[0].lstrip("/")
+        storer = store.get_storer(key) if keys else None
+        return key, "table" if storer is not None and storer.is_table else "fixed"
+
+
+def process_subject_folder(subject_folder: str, keep=KEEP_BPS):
     """
     In `subject_folder`, finds CollectedData_*.csv and .h5, filters them,
-    and writes them back.
-    """
-    # find all CSVs
-    csv_paths = glob.glob(os.path.join(subject_folder, "CollectedData_*.csv"))
-    for csv_path in csv_paths:
-        # derive scorer from filename if you like; not needed here
-        # load CSV (3 header rows: scorer/bodyparts/coords, index is first column)
-        df = pd.read_csv(csv_path, header=[0,1,2], index_col=0)
-        df_filt = filter_keypoints(df)
-        # overwrite CSV
-        df_filt.to_csv(csv_path)
-
-        # HDF5 sidecar
-        h5_path = csv_path[:-4] + ".h5"
-        if os.path.isfile(h5_path):
-            # use same key name as you wrote originally
-            df_h5 = pd.read_hdf(h5_path, key="collected_data")
-            df_h5_filt = filter_keypoints(df_h5)
-            # overwrite H5
-            df_h5_filt.to_hdf(h5_path, key="collected_data", mode="w", format="table")
-
-def main(project_folder: str):
+    and writes them back atomically (temp file + rename). The .h5 sidecar is
+    rebuilt from the projected CSV and keeps its key and format; it is written
+    before the CSV, so an interrupted run is simply redone on the next run.
+    Returns the number of files rewritten.
+    """
+    rewritten = 0
+    with instrument.stage("filter_bodyparts.subject", subject=os.path.basename(subject_folder)) as rec:
+        for csv_path in glob.glob(os.path.join(subject_folder, "CollectedData_*.csv")):
+            df_filt = read_projected_csv(csv_path, keep)
+            if df_filt is None:
+                continue
+            rec.add(items=len(df_filt))
+
+            # HDF5 sidecar
+            h5_path = csv_path[:-4] + ".h5"
+            if os.path.isfile(h5_path):
+                key, fmt = _h5_layout(h5_path)
+                _atomic_write(h5_path, lambda tmp: df_filt.to_hdf(tmp, key=key, mode="w", format=fmt))
+                rewritten += 1
+
+            _atomic_write(csv_path, lambda tmp: df_filt.to_csv(tmp))
+            rewritten += 1
+        rec.add(files=rewritten)
+    return rewritten
+
+
+@instrument.instrumented("filter_bodyparts.project")
+def main(project_folder: str, keep=KEEP_BPS, workers=None):
     """
     project_folder should be the root of your DLC project,
-    i.e. the parent of `labeled-data/`.
+    i.e. the parent of `labeled-data/`. Subject folders are filtered in a process pool.
     """
     ld = os.path.join(project_folder, "labeled-data")
     if not os.path.isdir(ld):
         raise RuntimeError(f"No labeled-data/ under {project_folder}")
     # each subfolder is a subject ID
-    for subject in os.listdir(ld):
-        subj_folder = os.path.join(ld, subject)
-        if os.path.isdir(subj_folder):
-            print("Processing", subj_folder)
-            process_subject_folder(subj_folder)
+    subjects = [os.path.join(ld, s) for s in sorted(os.listdir(ld)) if os.path.isdir(os.path.join(ld, s))]
+    with ProcessPoolExecutor(workers) as pool:
+        for subj_folder, n in zip(subjects, pool.map(process_subject_folder, subjects, [keep] * len(subjects))):
+            print("Processed", subj_folder, f"({n} files rewritten)" if n else "(already filtered)")
+
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python filter_bodyparts.py /path/to/project_folder")
-        sys.exit(1)
-    main(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Keep only selected bodyparts in a DLC project's CollectedData files.")
+    parser.add_argument("project_folder", help="DLC project root (parent of labeled-data/)")
+    parser.add_argument("--keep", help="comma-separated bodyparts to keep (default: KEEP_BPS)")
+    parser.add_argument("--keep-file", help="JSON list or text file (one bodypart per line) of bodyparts to keep")
+    parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    instrument.add_argument(parser)
+    args = parser.parse_args()
+    instrument.from_args(args)
+    if args.keep_file:
+        keep_bps = load_keep_list(args.keep_file)
+    elif args.keep:
+        keep_bps = [bp.strip() for bp in args.keep.split(",") if bp.strip()]
+    else:
+        keep_bps = KEEP_BPS
+    main(args.project_folder, keep_bps, args.workers)
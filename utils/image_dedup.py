@@ -0,0 +1,251 @@
+## Near-duplicate frames: a 64-bit perceptual hash (dHash) per image, computed in a process
+## pool and kept in a Parquet index next to the images (only new/modified files are hashed
+## again). Near-duplicates are found with multi-index hashing: the hash is cut into
+## max_distance + 1 blocks, so any two hashes within that Hamming distance share a block
+## exactly; only frames sharing a block are compared, with vectorized XOR + popcount.
+## Groups of near-duplicates can be dropped (one frame kept) or kept together in one split.
+##   python image_dedup.py Rat/top/Images --max-distance 4 --groups Rat/top/duplicate_groups.csv
+##   python image_dedup.py Rat/top/Images --annotations Rat/top/annotations.csv --drop Rat/top/annotations_dedup.csv
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from image_index import list_images
+
+HASH_INDEX_NAME = ".image_hashes.parquet"
+HASH_SIZE = 8                  # dHash grid: 8x8 differences -> 64 bits
+MAX_DISTANCE = 4               # Hamming distance (of 64 bits) counted as near-duplicate
+SCHEMA = pa.schema([
+    ("filename", pa.string()),
+    ("hash", pa.uint64()),
+    ("ok", pa.bool_()),
+    ("size", pa.int64()),
+    ("mtime", pa.int64()),  # st_mtime_ns
+])
+
+
+def dhash(path, hash_size=HASH_SIZE):
+    """
+    Difference hash: grayscale (hash_size+1) x hash_size thumbnail, one bit per
+    horizontally adjacent pixel pair (left brighter than right). None if unreadable.
+    """
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (hash_size * 8, hash_size * 8))   # JPEG: decode at reduced scale
+            small = np.asarray(img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR),
+                               dtype=np.int16)
+    except Exception:
+        return None
+    bits = (small[:, :-1] > small[:, 1:]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _hash_job(path):
+    return dhash(path)
+
+
+def load_hashes(index_path):
+    if os.path.isfile(index_path):
+        return pq.read_table(index_path).to_pandas()
+    return SCHEMA.empty_table().to_pandas()
+
+
+def save_hashes(index_path, df):
+    tmp = index_path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False), tmp)
+    os.replace(tmp, index_path)
+
+
+def update_hashes(folder, index_path=None, workers=None, recursive=False):
+    """
+    Bring the hash index of `folder` up to date like image_index.update_index: files
+    whose size and mtime match are kept, new or modified files are hashed in a process
+    pool, deleted files are dropped. Saved as <folder>/.image_hashes.parquet.
+    Returns (index DataFrame, files hashed); unreadable files have ok=False.
+    """
+    index_path = index_path or os.path.join(folder, HASH_INDEX_NAME)
+    old = load_hashes(index_path)
+    files = list_images(folder, recursive)
+
+    stored = dict(zip(old["filename"], zip(old["size"], old["mtime"])))
+    todo = sorted(name for name, st in files.items() if stored.get(name) != (st.st_size, st.st_mtime_ns))
+    hashes = []
+    if todo:
+        paths = [os.path.join(folder, name) for name in todo]
+        if workers == 1 or len(todo) < 64:
+            hashes = [dhash(p) for p in paths]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                hashes = list(pool.map(_hash_job, paths, chunksize=64))
+
+    fresh = pd.DataFrame({
+        "filename": todo,
+        "hash": np.array([h or 0 for h in hashes], dtype=np.uint64),
+        "ok": np.array([h is not None for h in hashes], dtype=bool),
+        "size": [files[name].st_size for name in todo],
+        "mtime": [files[name].st_mtime_ns for name in todo],
+    })
+    keep = old[old["filename"].isin(files.keys()) & ~old["filename"].isin(todo)]
+    index = pd.concat([keep, fresh], ignore_index=True) if len(keep) else fresh
+    index = index.sort_values("filename", ignore_index=True).astype(
+        {"hash": "uint64", "ok": "bool", "size": "int64", "mtime": "int64"})
+
+    if todo or len(keep) != len(old) or not os.path.isfile(index_path):
+        save_hashes(index_path, index)
+    return index, len(todo)
+
+
+def _blocks(n_blocks, bits=64):
+    """
+    (shift, mask) of n_blocks contiguous bit ranges covering the hash.
+    """
+    edges = np.linspace(0, bits, n_blocks + 1).astype(int)
+    return [(int(a), (1 << int(b - a)) - 1) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def near_duplicate_pairs(hashes, max_distance=MAX_DISTANCE):
+    """
+    All pairs (i, j), i < j, of hashes within `max_distance` bits, as two int64 arrays
+    plus their distances. Identical hashes are collapsed first; candidates come from
+    exact matches on one of max_distance + 1 hash blocks (pigeonhole), and are checked
+    with XOR + popcount in one vectorized step.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    uniq, inverse = np.unique(hashes, return_inverse=True)
+    cand = []
+    for shift, mask in _blocks(max_distance + 1):
+        keys = (uniq >> np.uint64(shift)) & np.uint64(mask)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+            a, b = np.triu_indices(size, k=1)
+            members = order[start:start + size]
+            cand.append(np.stack([members[a], members[b]], axis=1))
+    if cand:
+        pairs = np.unique(np.sort(np.concatenate(cand), axis=1), axis=0)
+        dist = np.bitwise_count(uniq[pairs[:, 0]] ^ uniq[pairs[:, 1]]).astype(np.int64)
+        pairs, dist = pairs[dist <= max_distance], dist[dist <= max_distance]
+    else:
+        pairs, dist = np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # expand unique-hash pairs to image pairs; identical hashes are pairs at distance 0
+    by_hash = np.argsort(inverse, kind="stable")
+    members = np.split(by_hash, np.cumsum(np.bincount(inverse, minlength=len(uniq)))[:-1])
+    out_i, out_j, out_d = [], [], []
+    for u in np.flatnonzero(np.bincount(inverse, minlength=len(uniq)) > 1):
+        a, b = np.triu_indices(len(members[u]), k=1)
+        out_i.append(members[u][a])
+        out_j.append(members[u][b])
+        out_d.append(np.zeros(len(a), dtype=np.int64))
+    for (u, v), d in zip(pairs, dist):
+        mu, mv = members[u], members[v]
+        out_i.append(np.repeat(mu, len(mv)))
+        out_j.append(np.tile(mv, len(mu)))
+        out_d.append(np.full(len(mu) * len(mv), d, dtype=np.int64))
+    if not out_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    i, j = np.concatenate(out_i), np.concatenate(out_j)
+    return np.minimum(i, j), np.maximum(i, j), np.concatenate(out_d)
+
+
+def duplicate_groups(hashes, max_distance=MAX_DISTANCE):
+    """
+    Group label per hash: connected components of the near-duplicate graph (labels are
+    the smallest member index, so frames without duplicates are their own group).
+    """
+    n = len(hashes)
+    labels = np.arange(n)
+    i, j, _ = near_duplicate_pairs(hashes, max_distance)
+    # min-label propagation until every pair agrees
+    while len(i):
+        low = np.minimum(labels[i], labels[j])
+        before = labels.copy()
+        np.minimum.at(labels, i, low)
+        np.minimum.at(labels, j, low)
+        labels = labels[labels]   # pointer jumping
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+
+def group_table(index, max_distance=MAX_DISTANCE):
+    """
+    filename, group (name of the group's first file) and group_size for every readable
+    image of a hash index.
+    """
+    ok = index[index["ok"]].reset_index(drop=True)
+    labels = duplicate_groups(ok["hash"].to_numpy(), max_distance)
+    names = ok["filename"].to_numpy()
+    groups = pd.DataFrame({"filename": names, "group": names[labels]})
+    groups["group_size"] = groups.groupby("group")["filename"].transform("size")
+    return groups
+
+
+def groups_for(filenames, groups):
+    """
+    Group name per filename (basename lookup); files without a hash are their own group.
+    """
+    lookup = dict(zip(groups["filename"].map(os.path.basename), groups["group"]))
+    return np.array([lookup.get(os.path.basename(f), f) for f in filenames], dtype=object)
+
+
+def drop_duplicates(df, groups, score=None):
+    """
+    One row per near-duplicate group of df (matched on 'filename'): the row with the
+    highest `score` (e.g. labeled keypoints per row), ties broken by file order.
+    """
+    group = groups_for(df["filename"], groups)
+    score = np.zeros(len(df)) if score is None else np.asarray(score, dtype=float)
+    order = np.lexsort((np.arange(len(df)), -score))
+    _, first = np.unique(group[order], return_index=True)
+    keep = np.sort(order[first])
+    return df.iloc[keep].reset_index(drop=True)
+
+
+def labeled_points(df):
+    """
+    Labeled keypoints per row of a wide annotations table (bbox columns excluded).
+    """
+    x_cols = [c for c in df.columns if c.endswith("-x") and not c.startswith("bbox_")]
+    return df[x_cols].notna().sum(axis=1).to_numpy()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find near-duplicate frames with perceptual hashes.")
+    parser.add_argument("folder", help="image folder")
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE, help="Hamming distance (of 64 bits)")
+    parser.add_argument("--workers", type=int, help="hashing processes (default: one per CPU)")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--groups", help="write filename,group,group_size for every image to this CSV")
+    parser.add_argument("--annotations", help="annotations CSV to deduplicate (with --drop)")
+    parser.add_argument("--drop", metavar="OUT_CSV", help="write the annotations with one frame per group")
+    args = parser.parse_args(argv)
+
+    index, hashed = update_hashes(args.folder, workers=args.workers, recursive=args.recursive)
+    groups = group_table(index, args.max_distance)
+    dup = groups[groups["group_size"] > 1]
+    print(f"{len(index)} images indexed ({hashed} hashed, {int((~index['ok']).sum())} unreadable)")
+    print(f"{dup['group'].nunique()} near-duplicate groups with {len(dup)} images "
+          f"({len(dup) - dup['group'].nunique()} redundant) at distance <= {args.max_distance}")
+    if args.groups:
+        groups.to_csv(args.groups, index=False)
+    if args.drop:
+        if not args.annotations:
+            parser.error("--drop needs --annotations")
+        df = pd.read_csv(args.annotations)
+        out = drop_duplicates(df, groups, labeled_points(df))
+        out.to_csv(args.drop, index=False)
+        print(f"Annotations: {len(df)} -> {len(out)} rows written to {args.drop}")
+
+
+if __name__ == "__main__":
+    main()
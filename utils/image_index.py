@@ -0,0 +1,198 @@
+## Image size index: reads width/height from JPEG/PNG headers (no pixel decoding)
+## in a thread pool and keeps the result in a Parquet file in the user cache
+## (~/.cache/pose_estimation, or $POSE_CACHE_DIR), so image folders are only read.
+## Re-scans only touch new or modified files.
+##   python image_index.py Rat/bottom950/resized_images --expect 1280x720
+
+import argparse
+import hashlib
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+INDEX_NAME = ".image_index.parquet"    # index kept inside the image folder by earlier versions
+CACHE_ENV = "POSE_CACHE_DIR"
+
+SCHEMA = pa.schema([
+    ("filename", pa.string()),
+    ("width", pa.int32()),
+    ("height", pa.int32()),
+    ("format", pa.string()),
+    ("size", pa.int64()),
+    ("mtime", pa.int64()),  # st_mtime_ns
+])
+
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = f.read(1)
+        while marker == b"\xff":  # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        m = marker[0]
+        if m in (0x01, 0xD8) or 0xD0 <= m <= 0xD7:
+            continue
+        if m in (0xD9, 0xDA):  # end of image / start of scan before any frame header
+            return None
+        (length,) = struct.unpack(">H", f.read(2))
+        if m in _SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def read_image_size(path):
+    """
+    (width, height, format) from the file header: PNG IHDR or JPEG SOF segment,
+    falling back to PIL (which also only reads the header) for anything else.
+    Returns None for unreadable files.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+                width, height = struct.unpack(">II", head[16:24])
+                return width, height, "PNG"
+            if head[:2] == b"\xff\xd8":
+                size = _jpeg_size(f)
+                if size is not None:
+                    return size[0], size[1], "JPEG"
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size[0], img.size[1], img.format
+    except Exception:
+        return None
+
+
+def list_images(folder, recursive=False):
+    """
+    {relative filename: os.stat_result} of image files in `folder`.
+    """
+    found = {}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(folder, rel_dir)) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir():
+                    if recursive and not entry.name.startswith("."):
+                        stack.append(rel)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    found[rel] = entry.stat()
+    return found
+
+
+def cache_dir():
+    return os.environ.get(CACHE_ENV) or os.path.join(os.path.expanduser("~"), ".cache", "pose_estimation")
+
+
+def index_path_for(folder, recursive=False):
+    """
+    Default index file of an image folder: in the cache dir, keyed on the folder's
+    absolute path (and `recursive`, which changes the listed files).
+    """
+    folder = os.path.abspath(folder)
+    key = hashlib.sha1(f"{folder}|{recursive}".encode()).hexdigest()[:16]
+    return os.path.join(cache_dir(), "image_index", f"{os.path.basename(folder)}-{key}.parquet")
+
+
+def load_index(index_path):
+    if os.path.isfile(index_path):
+        return pq.read_table(index_path).to_pandas()
+    return SCHEMA.empty_table().to_pandas()
+
+
+def save_index(index_path, df):
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp = index_path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False), tmp)
+    os.replace(tmp, index_path)
+
+
+def update_index(folder, index_path=None, workers=16, recursive=False):
+    """
+    Bring the index of `folder` up to date: files whose size and mtime match the
+    stored entry are kept, new or modified files have their headers read in a
+    thread pool, deleted files are dropped. The index is saved as Parquet
+    (default index_path_for(folder), outside the folder). Returns (index DataFrame,
+    files scanned). Unreadable files are stored with width/height 0.
+    """
+    index_path = index_path or index_path_for(folder, recursive)
+    old = load_index(index_path)
+    files = list_images(folder, recursive)
+
+    stored = dict(zip(old["filename"], zip(old["size"], old["mtime"])))
+    todo = [name for name, st in files.items() if stored.get(name) != (st.st_size, st.st_mtime_ns)]
+
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        sizes = list(pool.map(lambda name: read_image_size(os.path.join(folder, name)), todo))
+
+    fresh = pd.DataFrame({
+        "filename": todo,
+        "width": [s[0] if s else 0 for s in sizes],
+        "height": [s[1] if s else 0 for s in sizes],
+        "format": [s[2] if s else None for s in sizes],
+        "size": [files[name].st_size for name in todo],
+        "mtime": [files[name].st_mtime_ns for name in todo],
+    })
+    keep = old[old["filename"].isin(files.keys()) & ~old["filename"].isin(todo)]
+    index = pd.concat([keep, fresh], ignore_index=True) if len(keep) else fresh
+    index = index.sort_values("filename", ignore_index=True).astype(
+        {"width": "int32", "height": "int32", "size": "int64", "mtime": "int64"})
+
+    if todo or len(keep) != len(old) or not os.path.isfile(index_path):
+        save_index(index_path, index)
+    return index, len(todo)
+
+
+def lookup_sizes(path, workers=16):
+    """
+    filename/width/height table for a folder of images (index refreshed first)
+    or for an existing index Parquet file. Unreadable images are left out.
+    """
+    if os.path.isdir(path):
+        index, _ = update_index(path, workers=workers)
+    else:
+        index = pq.read_table(path, columns=["filename", "width", "height"]).to_pandas()
+    return index.loc[index["width"] > 0, ["filename", "width", "height"]].reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build/refresh the image size index of a folder and report off-size images.")
+    parser.add_argument("folder", help="image folder")
+    parser.add_argument("--index", help=f"index file (default: under {CACHE_ENV} or ~/.cache/pose_estimation)")
+    parser.add_argument("--expect", default="1280x720", help="expected WIDTHxHEIGHT to report against")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--recursive", action="store_true")
+    args = parser.parse_args(argv)
+
+    index, scanned = update_index(args.folder, args.index, args.workers, args.recursive)
+    width, height = (int(v) for v in args.expect.lower().split("x"))
+    unreadable = index[index["width"] == 0]
+    off = index[(index["width"] > 0) & ((index["width"] != width) | (index["height"] != height))]
+    for row in unreadable.itertuples():
+        print(f"Skipping file {row.filename}: unreadable")
+    for row in off.itertuples():
+        print(f"{row.filename}: ({row.width}, {row.height})")
+    print(f"\n{len(index)} images indexed ({scanned} scanned)")
+    print(f"Total images not {width}x{height}: {len(off)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+## Stage-level instrumentation for the data-prep tools: `with stage("name") as rec:` (or the
+## @instrumented decorator) records wall time, CPU time (own + finished child processes),
+## peak RSS, bytes read/written and item counts per stage as one JSON line.
+## Off unless POSE_PROFILE=<file.jsonl> is set (or a tool's --profile flag sets it); when off,
+## stage() returns a shared no-op object, so instrumented code pays one global check.
+## Worker processes inherit the variable and append their own records to the same file.
+##   POSE_PROFILE=profile.jsonl python resize_pipeline.py ...
+##   python instrument.py profile.jsonl --chrome trace.json   (summary; trace for chrome://tracing / Perfetto)
+
+import argparse
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+ENV_VAR = "POSE_PROFILE"
+
+_path = os.environ.get(ENV_VAR) or None
+_local = threading.local()
+_can_reset_peak = None   # /proc/self/clear_refs "5" resets VmHWM (Linux); probed on first use
+_open_lock = threading.Lock()
+_open_stages = set()     # open Stage objects of all threads (the VmHWM reset is process-wide)
+
+
+def enable(path):
+    """
+    Record stages of this process and of processes started from it to `path` (JSON lines).
+    """
+    global _path
+    _path = os.path.abspath(path)
+    os.environ[ENV_VAR] = _path
+
+
+def disable():
+    global _path
+    _path = None
+    os.environ.pop(ENV_VAR, None)
+
+
+def enabled():
+    return _path is not None
+
+
+def _io_counters():
+    """
+    (bytes read, bytes written) through read/write calls so far (Linux /proc/self/io),
+    or (None, None).
+    """
+    try:
+        with open("/proc/self/io", "rb") as f:
+            fields = dict(line.split(b":") for line in f.read().splitlines())
+        return int(fields[b"rchar"]), int(fields[b"wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _peak_rss():
+    """
+    Peak RSS in bytes since the last reset (VmHWM), else of the whole process (ru_maxrss).
+    """
+    if _can_reset_peak:
+        try:
+            with open("/proc/self/status", "rb") as f:
+                for line in f:
+                    if line.startswith(b"VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _reset_peak():
+    global _can_reset_peak
+    if _can_reset_peak is False:
+        return
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        _can_reset_peak = True
+    except OSError:
+        _can_reset_peak = False
+
+
+def _children_cpu():
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def _write(record):
+    line = (json.dumps(record, default=str) + "\n").encode()
+    # one O_APPEND write per record, so records of parallel processes do not interleave
+    fd = os.open(_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+class _NullStage:
+    """
+    Returned by stage() while instrumentation is off: every method is a no-op.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+    def set(self, **fields):
+        pass
+
+
+_NULL = _NullStage()
+
+
+class Stage:
+    """
+    One measured stage; use through stage(). add() accumulates counters (items,
+    bytes_written, ...), set() attaches other fields to the record.
+    The peak RSS is reset only while no other thread has a stage open; a stage that
+    overlaps one of another thread is recorded with peak_scope "process".
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = dict(fields)
+        self.counts = {}
+        self.peak = 0
+        self.shared = False
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        if self.parent is not None:
+            # the reset below would hide the parent's peak so far
+            self.parent.peak = max(self.parent.peak, _peak_rss())
+        self.depth = len(stack)
+        stack.append(self)
+        self.tid = threading.get_ident()
+        with _open_lock:
+            overlapping = [s for s in _open_stages if s.tid != self.tid]
+            if overlapping:
+                for s in _open_stages:
+                    s.shared = True
+                self.shared = True
+            _open_stages.add(self)
+            if not overlapping:
+                _reset_peak()
+        self.io = _io_counters()
+        self.children_cpu = _children_cpu()
+        self.start = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        children_cpu = _children_cpu() - self.children_cpu
+        read, written = _io_counters()
+        self.peak = max(self.peak, _peak_rss())
+        _local.stack.pop()
+        with _open_lock:
+            _open_stages.discard(self)
+        if self.parent is not None:
+            self.parent.peak = max(self.parent.peak, self.peak)
+        record = {
+            "name": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "depth": self.depth,
+            "pid": os.getpid(),
+            "tid": self.tid,
+            "start": self.start,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "children_cpu_s": children_cpu,
+            "peak_rss_mb": self.peak / (1 << 20),
+            "peak_scope": "stage" if _can_reset_peak and not self.shared else "process",
+            "read_bytes": read - self.io[0] if read is not None else None,
+            "written_bytes": written - self.io[1] if written is not None else None,
+            **self.counts,
+            **self.fields,
+        }
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        if _path is not None:
+            _write(record)
+        return False
+
+
+def stage(name, **fields):
+    """
+    Context manager measuring one stage; `fields` are stored with the record.
+    A no-op unless instrumentation is enabled.
+    """
+    if _path is None:
+        return _NULL
+    return Stage(name, fields)
+
+
+def instrumented(name=None):
+    """
+    Decorator: run the function inside stage(name or module.function).
+    """
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _path is None:
+                return func(*args, **kwargs)
+            with Stage(label, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def add_argument(parser):
+    """
+    Add the --profile flag of the command-line tools.
+    """
+    parser.add_argument("--profile", metavar="JSONL",
+                        help=f"record stage timings/memory to this JSON lines file (same as {ENV_VAR}=...)")
+
+
+def from_args(args):
+    if getattr(args, "profile", None):
+        enable(args.profile)
+
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def chrome_trace(records):
+    """
+    Chrome trace-event document (complete 'X' events, microseconds) of the records;
+    loads in chrome://tracing and ui.perfetto.dev.
+    """
+    events = []
+    for r in records:
+        args = {k: v for k, v in r.items() if k not in ("name", "pid", "tid", "start", "wall_s", "parent", "depth")}
+        events.append({"name": r["name"], "cat": r["name"].split(".")[0], "ph": "X",
+                       "ts": r["start"] * 1e6, "dur": r["wall_s"] * 1e6,
+                       "pid": r["pid"], "tid": r["tid"], "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_chrome_trace(records, path):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(records), f)
+    os.replace(tmp, path)
+
+
+def summary(records):
+    """
+    One row per stage name: calls, total wall/CPU seconds, largest peak RSS and the
+    summed counters, in order of first appearance.
+    """
+    import pandas as pd
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    df["cpu_total_s"] = df["cpu_s"] + df["children_cpu_s"]
+    counters = [c for c in ("items", "read_bytes", "written_bytes") if c in df.columns]
+    agg = {"calls": ("name", "size"), "wall_s": ("wall_s", "sum"), "cpu_s": ("cpu_total_s", "sum"),
+           "peak_rss_mb": ("peak_rss_mb", "max"), **{c: (c, "sum") for c in counters}}
+    order = list(dict.fromkeys(df["name"]))
+    return df.groupby("name").agg(**agg).reindex(order)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a stage profile and convert it to a Chrome trace.")
+    parser.add_argument("profile", help="JSON lines file written with POSE_PROFILE / --profile")
+    parser.add_argument("--chrome", metavar="TRACE_JSON", help="write a Chrome trace-event file")
+    args = parser.parse_args(argv)
+
+    records = read_records(args.profile)
+    print(summary(records).round(3).to_string())
+    if args.chrome:
+        write_chrome_trace(records, args.chrome)
+        print(f"Chrome trace written to {args.chrome} ({len(records)} stages)")
+
+
+if __name__ == "__main__":
+    main()
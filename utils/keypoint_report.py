@@ -0,0 +1,307 @@
+## Keypoint coverage and annotation-quality report for many annotation folders at once
+## (Rat/Mouse x top/side/bottom). Each annotations.csv is analyzed in one vectorized pass
+## over its (frames, keypoints, 2) array: labeled fractions per keypoint and per subject,
+## empty columns, half-labeled points, out-of-frame coordinates and bbox/keypoint
+## inconsistencies. Files are analyzed in a process pool; results are cached next to
+## each CSV (<name>.report.json) and reused while the CSV is unchanged.
+##   python keypoint_report.py Rat Mouse --workers 4
+##   python keypoint_report.py Rat/top --keypoints --out report/
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from annotations import Annotations, keypoint_columns
+from csv_to_xml import BBOX_COLUMNS, DEFAULT_SIZE
+from image_index import INDEX_NAME, index_path_for, load_index
+
+REPORT_VERSION = 1
+ANNOTATIONS_NAME = "annotations.csv"
+VIEWS = ("top", "side", "bottom")
+IMAGE_FOLDERS = ("Images", "images")
+BBOX_MARGIN = 0.1   # keypoints this far (fraction of the box size) outside the box count as inconsistent
+
+
+def find_datasets(roots):
+    """
+    Every folder under `roots` holding an annotations.csv, as dicts with folder, csv,
+    animal (top folder name, e.g. Rat) and view (top/side/bottom from the folder name,
+    so side2194 is 'side').
+    """
+    datasets = []
+    for root in roots:
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            if ANNOTATIONS_NAME not in files:
+                continue
+            parts = os.path.normpath(os.path.relpath(folder, os.path.dirname(os.path.abspath(root)))).split(os.sep)
+            view = next((v for p in reversed(parts) for v in VIEWS if p.lower().startswith(v)), "")
+            datasets.append({"folder": folder, "csv": os.path.join(folder, ANNOTATIONS_NAME),
+                             "animal": parts[0], "view": view})
+    return datasets
+
+
+def _size_index_path(folder):
+    for name in IMAGE_FOLDERS:
+        # the cached index of image_index.update_index, or one kept in the folder
+        for path in (index_path_for(os.path.join(folder, name)), os.path.join(folder, name, INDEX_NAME)):
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def frame_sizes(ann, index_path=None, default_size=DEFAULT_SIZE):
+    """
+    (n, 2) width/height per frame: width/height columns if the CSV has them, else an
+    existing image index (image_index.py; never built here), else default_size.
+    """
+    sizes = np.tile(np.asarray(default_size, dtype=np.float64), (len(ann), 1))
+    if {"width", "height"}.issubset(ann.extra.columns):
+        wh = ann.extra[["width", "height"]].to_numpy(dtype=np.float64)
+        return np.where(np.isfinite(wh), wh, sizes)
+    if index_path:
+        index = load_index(index_path).drop_duplicates("filename", keep="last").set_index("filename")
+        names = [os.path.basename(f) for f in ann.filenames]
+        wh = index.reindex(names)[["width", "height"]].to_numpy(dtype=np.float64)
+        return np.where(np.isfinite(wh), wh, sizes)
+    return sizes
+
+
+def analyze(ann, sizes, bbox_margin=BBOX_MARGIN):
+    """
+    Coverage and quality numbers of one annotation set. Returns a JSON-able dict with
+    'summary' (one row), 'keypoints' and 'subjects' (lists of rows), 'empty_columns'.
+    """
+    n, k = len(ann), len(ann.keypoints)
+    coords = ann.coords
+    finite = np.isfinite(coords)                       # (n, k, 2)
+    labeled = finite.all(axis=2)                       # (n, k)
+    half = finite.any(axis=2) & ~labeled
+    outside = labeled & ((coords < 0).any(axis=2) | (coords[..., 0] > sizes[:, None, 0])
+                         | (coords[..., 1] > sizes[:, None, 1]))
+
+    bbox = ann.bbox
+    has_box = np.isfinite(bbox).all(axis=1)
+    bad_box = has_box & ((bbox[:, 2] <= bbox[:, 0]) | (bbox[:, 3] <= bbox[:, 1]))
+    mx = (bbox[:, 2] - bbox[:, 0]) * bbox_margin
+    my = (bbox[:, 3] - bbox[:, 1]) * bbox_margin
+    with np.errstate(invalid="ignore"):
+        off_box = labeled & has_box[:, None] & (
+            (coords[..., 0] < (bbox[:, 0] - mx)[:, None]) | (coords[..., 0] > (bbox[:, 2] + mx)[:, None])
+            | (coords[..., 1] < (bbox[:, 1] - my)[:, None]) | (coords[..., 1] > (bbox[:, 3] + my)[:, None]))
+    any_kp = labeled.any(axis=1)
+
+    per_kp = labeled.sum(axis=0)
+    keypoints = [{
+        "keypoint": kp,
+        "labeled": int(per_kp[j]),
+        "labeled_fraction": float(per_kp[j] / n) if n else 0.0,
+        "half_labeled": int(half[:, j].sum()),
+        "out_of_frame": int(outside[:, j].sum()),
+        "outside_bbox": int(off_box[:, j].sum()),
+    } for j, kp in enumerate(ann.keypoints)]
+
+    subjects = []
+    ids = np.array([i if i is not None else "" for i in ann.ids], dtype=object)
+    if n:
+        uniq, inverse = np.unique(ids.astype(str), return_inverse=True)
+        frames = np.bincount(inverse, minlength=len(uniq))
+        points = np.bincount(inverse, weights=labeled.sum(axis=1), minlength=len(uniq))
+        kp_seen = np.zeros((len(uniq), k), dtype=bool)
+        np.logical_or.at(kp_seen, inverse, labeled)
+        subjects = [{
+            "subject": sid,
+            "frames": int(frames[s]),
+            "labeled_fraction": float(points[s] / (frames[s] * k)) if k else 0.0,
+            "keypoints_never_labeled": int(k - kp_seen[s].sum()),
+        } for s, sid in enumerate(uniq)]
+
+    empty = dict(zip(keypoint_columns(ann.keypoints), ~finite.any(axis=0).ravel()))
+    empty.update(zip(BBOX_COLUMNS, ~np.isfinite(bbox).any(axis=0)))
+    empty.update(ann.extra.isna().all().items())
+    order = ann.columns or list(empty)
+    empty_columns = [c for c in order if empty.get(c)]
+    summary = {
+        "frames": n,
+        "keypoints": k,
+        "subjects": len({s["subject"] for s in subjects if s["subject"]}),
+        "frames_without_id": int((ids == "").sum()),
+        "labeled_fraction": float(labeled.mean()) if labeled.size else 0.0,
+        "empty_keypoints": int((per_kp == 0).sum()),
+        "frames_without_keypoints": int((~any_kp).sum()),
+        "half_labeled": int(half.sum()),
+        "out_of_frame": int(outside.sum()),
+        "frames_without_bbox": int((any_kp & ~has_box).sum()),
+        "bbox_without_keypoints": int((has_box & ~any_kp).sum()),
+        "invalid_bbox": int(bad_box.sum()),
+        "outside_bbox": int(off_box.sum()),
+    }
+    return {"summary": summary, "keypoints": keypoints, "subjects": subjects, "empty_columns": empty_columns}
+
+
+def cache_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".report.json"
+
+
+def _signature(csv_path, index_path, bbox_margin):
+    st = os.stat(csv_path)
+    sig = {"version": REPORT_VERSION, "mtime": st.st_mtime_ns, "size": st.st_size, "bbox_margin": bbox_margin}
+    if index_path:
+        sig["index_mtime"] = os.stat(index_path).st_mtime_ns
+    return sig
+
+
+def cached_result(csv_path, bbox_margin=BBOX_MARGIN):
+    """
+    The cached analyze_file() result of csv_path if it is still valid, else None.
+    """
+    index_path = _size_index_path(os.path.dirname(os.path.abspath(csv_path)))
+    cache = cache_path_for(csv_path)
+    if not os.path.isfile(cache):
+        return None
+    try:
+        with open(cache, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stored.get("signature") != _signature(csv_path, index_path, bbox_margin):
+        return None
+    return dict(stored["result"], cached=True)
+
+
+def analyze_file(csv_path, bbox_margin=BBOX_MARGIN, use_cache=True):
+    """
+    analyze() of one annotations CSV, served from its <name>.report.json cache while
+    the CSV (and the image index used for sizes) has the same mtime and size.
+    The result has 'cached' set to whether it came from the cache.
+    """
+    if use_cache:
+        result = cached_result(csv_path, bbox_margin)
+        if result is not None:
+            return result
+    index_path = _size_index_path(os.path.dirname(os.path.abspath(csv_path)))
+    sig = _signature(csv_path, index_path, bbox_margin)
+    cache = cache_path_for(csv_path)
+    ann = Annotations.from_csv(csv_path)
+    result = analyze(ann, frame_sizes(ann, index_path), bbox_margin)
+    if use_cache:
+        try:
+            with open(cache + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"signature": sig, "result": result}, f)
+            os.replace(cache + ".tmp", cache)
+        except OSError:
+            pass   # read-only dataset: just do not cache
+    return dict(result, cached=False)
+
+
+def _analyze_job(args):
+    csv_path, bbox_margin, use_cache = args
+    try:
+        return analyze_file(csv_path, bbox_margin, use_cache)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def build_report(datasets, workers=None, bbox_margin=BBOX_MARGIN, use_cache=True):
+    """
+    Analyze every dataset (see find_datasets) and return three DataFrames tagged with
+    animal/view/folder: 'summary' (one row per file), 'keypoints' and 'subjects'.
+    Cached files are read directly; the rest run in a process pool.
+    """
+    results = [None] * len(datasets)
+    todo = []
+    for i, ds in enumerate(datasets):
+        results[i] = cached_result(ds["csv"], bbox_margin) if use_cache else None
+        if results[i] is None:
+            todo.append(i)
+    if todo:
+        jobs = [(datasets[i]["csv"], bbox_margin, use_cache) for i in todo]
+        workers = min(len(todo), workers or os.cpu_count() or 1)
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                done = list(pool.map(_analyze_job, jobs))
+        else:
+            done = [_analyze_job(job) for job in jobs]
+        for i, result in zip(todo, done):
+            results[i] = result
+
+    summary, keypoints, subjects = [], [], []
+    for ds, result in zip(datasets, results):
+        tag = {"animal": ds["animal"], "view": ds["view"], "folder": ds["folder"]}
+        if "error" in result:
+            summary.append({**tag, "error": result["error"]})
+            continue
+        summary.append({**tag, **result["summary"], "empty_columns": len(result["empty_columns"]),
+                        "cached": result["cached"]})
+        keypoints += [{**tag, "frames": result["summary"]["frames"], **row} for row in result["keypoints"]]
+        subjects += [{**tag, **row} for row in result["subjects"]]
+    return {"summary": pd.DataFrame(summary), "keypoints": pd.DataFrame(keypoints),
+            "subjects": pd.DataFrame(subjects)}
+
+
+def view_table(keypoints):
+    """
+    Labeled fraction per keypoint (rows) and animal/view (columns), pooled over the
+    folders of each view.
+    """
+    if keypoints.empty:
+        return pd.DataFrame()
+    grouped = keypoints.groupby(["keypoint", "animal", "view"], sort=False)[["labeled", "frames"]].sum()
+    return (grouped["labeled"] / grouped["frames"].where(grouped["frames"] > 0)).unstack(["animal", "view"])
+
+
+def format_keypoints(result):
+    """
+    Labeled / missing keypoint lists of one analyze() result (the GUI's popup text).
+    """
+    labeled = [r["keypoint"] for r in result["keypoints"] if r["labeled"]]
+    missing = [r["keypoint"] for r in result["keypoints"] if not r["labeled"]]
+    s = result["summary"]
+    lines = [
+        f"Labeled ({len(labeled)}): " + ", ".join(labeled),
+        f"Missing ({len(missing)}): " + ", ".join(missing),
+        "",
+        f"{s['frames']} frames, {s['subjects']} subjects, {s['labeled_fraction']:.1%} of points labeled",
+        f"Out of frame: {s['out_of_frame']}, half labeled: {s['half_labeled']}, "
+        f"outside bbox: {s['outside_bbox']}, frames without bbox: {s['frames_without_bbox']}, "
+        f"invalid bbox: {s['invalid_bbox']}",
+    ]
+    lines += [f"{r['keypoint']}: {r['labeled_fraction']:.1%}" for r in result["keypoints"]]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keypoint coverage and annotation-quality report.")
+    parser.add_argument("roots", nargs="+", help="folders searched for annotations.csv (e.g. Rat Mouse)")
+    parser.add_argument("--workers", type=int, help="processes for uncached files (default: one per CPU)")
+    parser.add_argument("--bbox-margin", type=float, default=BBOX_MARGIN)
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not write .report.json caches")
+    parser.add_argument("--keypoints", action="store_true", help="also print labeled fractions per keypoint and view")
+    parser.add_argument("--subjects", action="store_true", help="also print the per-subject table")
+    parser.add_argument("--out", help="write summary/keypoints/subjects CSVs into this folder")
+    args = parser.parse_args(argv)
+
+    datasets = find_datasets(args.roots)
+    if not datasets:
+        parser.error(f"no {ANNOTATIONS_NAME} found under {args.roots}")
+    report = build_report(datasets, args.workers, args.bbox_margin, not args.no_cache)
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+        print(report["summary"].drop(columns=["folder"]).to_string(index=False))
+        if args.keypoints:
+            print()
+            print(view_table(report["keypoints"]).round(3).to_string())
+        if args.subjects:
+            print()
+            print(report["subjects"].to_string(index=False))
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        for name, df in report.items():
+            df.to_csv(os.path.join(args.out, f"keypoint_report_{name}.csv"), index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+## Resize a folder of frames to the target size and rescale annotations.csv to match.
+## Image sizes come from the header-only image index; only the 1920x1200 frames (any size
+## with --all-sizes) are decoded and resized (in a process pool), all others are
+## copied/linked byte-for-byte.
+## Outputs are written atomically, so an interrupted run resumes where it stopped.
+##   python resize_pipeline.py Rat/top950/images Rat/top950/annotations.csv \
+##       Rat/top950/resized_images Rat/top950/annotations_rescaled.csv --size 1280x720
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from image_index import update_index
+from image_staging import STRATEGIES, stage_images
+
+TARGET_SIZE = (1280, 720)
+SOURCE_SIZE = (1920, 1200)     # only frames of this size are resized unless only_from=None
+
+
+def _init_worker():
+    import cv2
+    # one OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def resize_one(job):
+    """
+    Decode, resize and encode one image; the result is renamed into place only
+    once complete. Returns (filename, ok).
+    """
+    import cv2
+    src, dst, size = job
+    img = cv2.imread(src, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return src, False
+    resized = cv2.resize(img, size)
+    base, ext = os.path.splitext(dst)
+    tmp = f"{base}.tmp{ext}"
+    if not cv2.imwrite(tmp, resized):
+        return src, False
+    os.replace(tmp, dst)
+    return src, True
+
+
+def plan_images(index, image_folder, output_folder, target_size, only_from=None):
+    """
+    Split indexed images into resize jobs and byte-for-byte jobs.
+    Images already at the target size (or not matching `only_from`, if given)
+    are kept as they are. Resize jobs whose output is newer than the source are
+    treated as done (resume).
+    """
+    tw, th = target_size
+    readable = index[index["width"] > 0]
+    needs_resize = (readable["width"] != tw) | (readable["height"] != th)
+    if only_from is not None:
+        needs_resize &= (readable["width"] == only_from[0]) & (readable["height"] == only_from[1])
+
+    resize_jobs, done, keep_pairs = [], [], []
+    for name, mtime, resize in zip(readable["filename"], readable["mtime"], needs_resize):
+        src = os.path.join(image_folder, name)
+        dst = os.path.join(output_folder, name)
+        if not resize:
+            keep_pairs.append((src, dst))
+        elif os.path.exists(dst) and os.stat(dst).st_mtime_ns >= mtime:
+            done.append(name)
+        else:
+            resize_jobs.append((src, dst, (tw, th)))
+    return resize_jobs, done, keep_pairs, readable.loc[needs_resize.to_numpy(), "filename"].tolist()
+
+
+def rescale_annotations(df, index, resized, target_size):
+    """
+    Scale every x (`*-x`) and y (`*-y`, including bbox_*) column of the rows whose
+    image was resized, by target/original size of that image, in one vectorized step.
+    """
+    tw, th = target_size
+    sizes = index.set_index("filename")[["width", "height"]]
+    is_resized = df["filename"].isin(set(resized)).to_numpy()
+    orig = sizes.reindex(df["filename"]).to_numpy(dtype=float)
+    scale_x = np.where(is_resized, tw / np.where(is_resized, orig[:, 0], 1.0), 1.0)
+    scale_y = np.where(is_resized, th / np.where(is_resized, orig[:, 1], 1.0), 1.0)
+
+    x_cols = [c for c in df.columns if c.endswith("-x")]
+    y_cols = [c for c in df.columns if c.endswith("-y")]
+    out = df.copy()
+    out[x_cols] = df[x_cols].mul(scale_x, axis=0)
+    out[y_cols] = df[y_cols].mul(scale_y, axis=0)
+    return out
+
+
+@instrument.instrumented("resize.resize_dataset")
+def resize_dataset(image_folder, annotation_file, output_image_folder, output_annotation_file,
+                   target_size=TARGET_SIZE, only_from=SOURCE_SIZE, workers=None, keep_strategy="copy"):
+    """
+    Resize the images of size `only_from` (1920x1200 frames by default; None: every
+    image not at `target_size`) in a process pool, stage the others unchanged with `keep_strategy`, and write the
+    annotations rescaled per image from its actual original size. Returns a report dict.
+    """
+    os.makedirs(output_image_folder, exist_ok=True)
+    start = time.perf_counter()
+
+    with instrument.stage("resize.index") as rec:
+        index, scanned = update_index(image_folder)
+        rec.add(items=len(index), scanned=scanned)
+        resize_jobs, done, keep_pairs, resized = plan_images(
+            index, image_folder, output_image_folder, target_size, only_from)
+
+    failed = []
+    with instrument.stage("resize.images", items=len(resize_jobs)):
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            for src, ok in pool.map(resize_one, resize_jobs, chunksize=16):
+                if not ok:
+                    failed.append(os.path.basename(src))
+    with instrument.stage("resize.stage_unchanged", items=len(keep_pairs), strategy=keep_strategy) as rec:
+        staged = stage_images(keep_pairs, keep_strategy)
+        rec.add(bytes_written=staged["bytes"])
+
+    with instrument.stage("resize.annotations") as rec:
+        df = pd.read_csv(annotation_file)
+        ok_resized = set(resized) - set(failed)
+        df_scaled = rescale_annotations(df, index, ok_resized, target_size)
+        df_scaled.to_csv(output_annotation_file, index=False)
+        rec.add(items=len(df))
+
+    seconds = time.perf_counter() - start
+    n_images = len(resize_jobs) + len(done) + len(keep_pairs)
+    return {
+        "resized": len(resize_jobs) - len(failed),
+        "resumed": len(done),
+        "unchanged": len(keep_pairs),
+        "unchanged_staged": staged["staged"],
+        "failed": failed,
+        "unreadable": int((index["width"] == 0).sum()),
+        "rows_rescaled": int(df["filename"].isin(ok_resized).sum()),
+        "rows_without_image": int((~df["filename"].isin(index["filename"])).sum()),
+        "seconds": seconds,
+        "images_per_second": len(resize_jobs) / seconds if seconds else 0.0,
+        "total_images": n_images,
+    }
+
+
+def _parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resize frames and rescale their annotations.")
+    parser.add_argument("image_folder")
+    parser.add_argument("annotation_file")
+    parser.add_argument("output_image_folder")
+    parser.add_argument("output_annotation_file")
+    parser.add_argument("--size", type=_parse_size, default=TARGET_SIZE, help="target WIDTHxHEIGHT (default 1280x720)")
+    parser.add_argument("--only-from", type=_parse_size, default=SOURCE_SIZE,
+                        help="only resize images of this WIDTHxHEIGHT (default 1920x1200)")
+    parser.add_argument("--all-sizes", action="store_true",
+                        help="resize every image not at the target size, whatever its size")
+    parser.add_argument("--workers", type=int, help="resize processes (default: one per CPU)")
+    parser.add_argument("--keep", choices=STRATEGIES, default="copy", help="how to place images that need no resize")
+    instrument.add_argument(parser)
+    args = parser.parse_args(argv)
+    instrument.from_args(args)
+
+    report = resize_dataset(args.image_folder, args.annotation_file, args.output_image_folder,
+                            args.output_annotation_file, args.size, None if args.all_sizes else args.only_from,
+                            args.workers, args.keep)
+    print(f"\nDone! Resized {report['resized']} images ({report['images_per_second']:.1f} images/s), "
+          f"{report['resumed']} already done, {report['unchanged']} kept unchanged.")
+    if report["failed"]:
+        print(f"Failed to resize {len(report['failed'])}: {', '.join(report['failed'][:10])}")
+    print(f"Rescaled {report['rows_rescaled']} annotation rows "
+          f"({report['rows_without_image']} rows have no image in {args.image_folder})")
+    print(f"Saved resized images to: {args.output_image_folder}")
+    print(f"Saved updated annotations to: {args.output_annotation_file}")
+
+
+if __name__ == "__main__":
+    main()
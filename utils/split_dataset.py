@@ -0,0 +1,215 @@
+## Train/val/test splits of an annotations table in one vectorized pass:
+##   random, stratified by cluster label, or grouped by subject (extract_id), so all
+##   frames of one animal end up in the same split.
+## Writes split manifests (<split>_annotations.csv + split_manifest.csv); image folders
+## are only materialized on request, by default as hardlinks (no extra disk).
+##   python split_dataset.py Rat/top/annotations_with_clusters.csv --by cluster --out Rat/top
+##   python split_dataset.py Rat/top/annotations.csv --by subject --materialize hardlink --images Rat/top/images
+##   python split_dataset.py Rat/top/annotations.csv --by random --dedup Rat/top/images --dedup-action group
+
+import argparse
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from dlc_project_converter import extract_id
+from image_staging import STRATEGIES, format_report, stage_images
+
+SPLITS = ("train", "val", "test")
+RATIOS = (0.8, 0.1, 0.1)
+SPLIT_BY = ["random", "cluster", "subject"]
+MANIFEST_NAME = "split_manifest.csv"
+
+
+def _check_ratios(ratios):
+    if len(ratios) != len(SPLITS) or abs(sum(ratios) - 1.0) > 1e-6:
+        raise ValueError(f"Need {len(SPLITS)} ratios summing to 1, got {ratios}")
+    return np.cumsum(ratios)
+
+
+def stratified_split(strata, ratios=RATIOS, seed=42):
+    """
+    Split index (0=train, 1=val, 2=test) per row: every stratum is shuffled and cut
+    at round(size * cumulative ratio), so each split keeps the stratum proportions.
+    """
+    cum = _check_ratios(ratios)
+    rng = np.random.default_rng(seed)
+    _, inverse, counts = np.unique(np.asarray(strata), return_inverse=True, return_counts=True)
+    n = len(inverse)
+    # random rank of each row within its stratum
+    order = rng.permutation(n)
+    order = order[np.argsort(inverse[order], kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, counts)
+    bounds = np.round(counts[:, None] * cum[None, :-1])   # (n_strata, n_splits - 1)
+    return (rank[:, None] >= bounds[inverse]).sum(axis=1).astype(np.int8)
+
+
+def grouped_split(groups, ratios=RATIOS, seed=42):
+    """
+    Split index per row with whole groups (e.g. subject IDs) assigned to one split:
+    groups are shuffled and a group goes to the split its cumulative frame share
+    (at its midpoint) falls into. With few groups a split can get none; that is
+    warned about, with the achieved ratios.
+    """
+    cum = _check_ratios(ratios)
+    rng = np.random.default_rng(seed)
+    _, inverse, counts = np.unique(np.asarray(groups), return_inverse=True, return_counts=True)
+    order = rng.permutation(len(counts))
+    mid = (np.cumsum(counts[order]) - counts[order] / 2) / counts.sum()
+    group_split = np.empty(len(counts), dtype=np.int8)
+    group_split[order] = np.searchsorted(cum[:-1], mid, side="right")
+    empty = [name for i, name in enumerate(SPLITS) if ratios[i] > 0 and not (group_split == i).any()]
+    if empty:
+        achieved = np.bincount(group_split, weights=counts, minlength=len(SPLITS)) / counts.sum()
+        warnings.warn(f"{len(counts)} groups are too few for ratios {_format_ratios(ratios)}: "
+                      f"{', '.join(empty)} got no group (achieved {_format_ratios(achieved)})", stacklevel=2)
+    return group_split[inverse]
+
+
+def _format_ratios(ratios):
+    return "/".join(f"{r:.2f}" for r in ratios)
+
+
+def subject_ids(filenames):
+    """
+    extract_id for every filename; frames without a parsable ID form their own group.
+    """
+    ids = [extract_id(os.path.basename(f)) for f in filenames]
+    return np.array([i if i is not None else f"__{f}" for i, f in zip(ids, filenames)])
+
+
+@instrument.instrumented("split.make_split")
+def make_split(df, by="cluster", ratios=RATIOS, seed=42, cluster_col="cluster", groups=None):
+    """
+    Categorical Series (train/val/test) aligned with df. With `groups` (one label per
+    row, e.g. near-duplicate groups from image_dedup) every row takes the split of its
+    group's first row, so near-duplicates never end up on both sides.
+    """
+    if by == "cluster":
+        codes = stratified_split(df[cluster_col].to_numpy(), ratios, seed)
+    elif by == "subject":
+        codes = grouped_split(subject_ids(df["filename"].tolist()), ratios, seed)
+    elif by == "random":
+        codes = stratified_split(np.zeros(len(df), dtype=np.int8), ratios, seed)
+    else:
+        raise ValueError(f"Unknown split mode {by!r}, expected one of {SPLIT_BY}")
+    if groups is not None:
+        _, first, inverse = np.unique(np.asarray(groups), return_index=True, return_inverse=True)
+        codes = codes[first][inverse]
+    return pd.Series(pd.Categorical.from_codes(codes, SPLITS), index=df.index, name="split")
+
+
+@instrument.instrumented("split.write_manifests")
+def write_manifests(df, split, out_dir, prefix=""):
+    """
+    <out_dir>/<prefix><split>_annotations.csv per split plus <prefix>split_manifest.csv
+    (filename, split). Returns {split: csv path}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name in SPLITS:
+        path = os.path.join(out_dir, f"{prefix}{name}_annotations.csv")
+        df[(split == name).to_numpy()].reset_index(drop=True).to_csv(path, index=False)
+        paths[name] = path
+    pd.DataFrame({"filename": df["filename"].to_numpy(), "split": split.to_numpy()}).to_csv(
+        os.path.join(out_dir, prefix + MANIFEST_NAME), index=False)
+    return paths
+
+
+def read_manifest(path):
+    return pd.read_csv(path, dtype={"filename": str, "split": str})
+
+
+@instrument.instrumented("split.materialize")
+def materialize(filenames, split, image_folder, out_dir, strategy="hardlink", workers=8, prune=False):
+    """
+    Create <out_dir>/<split>/ folders holding the split's images, placed with an
+    image_staging strategy (hardlink/symlink/reflink use no extra disk; copy runs in
+    parallel). Unchanged files from a previous run are skipped. Other files in a split
+    folder (e.g. left over from an earlier split) are counted as 'stale' and only
+    deleted with `prune`.
+    Returns {split: report}.
+    """
+    filenames = np.asarray(filenames)
+    split = np.asarray(split)
+    reports = {}
+    for name in SPLITS:
+        dest = os.path.join(out_dir, name)
+        os.makedirs(dest, exist_ok=True)
+        pairs = [(os.path.join(image_folder, f), os.path.join(dest, os.path.basename(f)))
+                 for f in filenames[split == name]]
+        wanted = {os.path.basename(dst) for _, dst in pairs}
+        stale = [e.path for e in os.scandir(dest) if e.name not in wanted and not e.is_dir()]
+        if prune:
+            for path in stale:
+                os.remove(path)
+        reports[name] = stage_images(pairs, strategy, workers)
+        reports[name]["stale"] = len(stale)
+        reports[name]["removed"] = len(stale) if prune else 0
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute train/val/test splits and write split manifests.")
+    parser.add_argument("annotations", help="annotations CSV with a 'filename' column")
+    parser.add_argument("--by", choices=SPLIT_BY, default="cluster", help="stratify by cluster, group by subject, or random")
+    parser.add_argument("--cluster-col", default="cluster")
+    parser.add_argument("--ratios", type=float, nargs=3, default=RATIOS, metavar=("TRAIN", "VAL", "TEST"))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="output folder (default: next to the annotations)")
+    parser.add_argument("--prefix", default="", help="prefix for the manifest file names")
+    parser.add_argument("--materialize", choices=STRATEGIES, help="also create train/val/test image folders with this strategy")
+    parser.add_argument("--images", help="image folder (required with --materialize)")
+    parser.add_argument("--prune", action="store_true",
+                        help="with --materialize, delete files in the split folders that are not in the split")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--dedup", metavar="IMAGES", help="image folder to find near-duplicate frames in (image_dedup)")
+    parser.add_argument("--dedup-action", choices=["group", "drop"], default="group",
+                        help="keep near-duplicates in the same split, or keep one frame per group")
+    parser.add_argument("--max-distance", type=int, default=4, help="near-duplicate Hamming distance (of 64 bits)")
+    instrument.add_argument(parser)
+    args = parser.parse_args(argv)
+    instrument.from_args(args)
+
+    with instrument.stage("split.read_annotations") as rec:
+        df = pd.read_csv(args.annotations)
+        rec.add(items=len(df))
+    out_dir = args.out or os.path.dirname(os.path.abspath(args.annotations))
+    groups = None
+    if args.dedup:
+        from image_dedup import drop_duplicates, group_table, groups_for, labeled_points, update_hashes
+        table = group_table(update_hashes(args.dedup)[0], args.max_distance)
+        if args.dedup_action == "drop":
+            n = len(df)
+            df = drop_duplicates(df, table, labeled_points(df))
+            print(f"Near-duplicates: dropped {n - len(df)} of {n} frames")
+        else:
+            groups = groups_for(df["filename"], table)
+            print(f"Near-duplicates: {len(df) - len(set(groups))} frames share a split with a near-duplicate")
+    split = make_split(df, args.by, tuple(args.ratios), args.seed, args.cluster_col, groups)
+    paths = write_manifests(df, split, out_dir, args.prefix)
+    counts = split.value_counts().reindex(SPLITS)
+    for name, ratio in zip(SPLITS, args.ratios):
+        print(f"{name}: {counts[name]} frames ({counts[name] / max(len(df), 1):.1%}, requested {ratio:.1%}) "
+              f"-> {paths[name]}")
+    if args.by == "cluster":
+        print(pd.crosstab(df[args.cluster_col], split, normalize="columns").round(3))
+
+    if args.materialize:
+        if not args.images:
+            parser.error("--materialize needs --images")
+        reports = materialize(df["filename"], split, args.images, out_dir, args.materialize, args.workers,
+                              args.prune)
+        for name, report in reports.items():
+            print(f"{name}: {format_report(report, args.materialize)}")
+            if report["stale"] and not args.prune:
+                print(f"  {report['stale']} other files left in {os.path.join(out_dir, name)} (delete with --prune)")
+
+
+if __name__ == "__main__":
+    main()
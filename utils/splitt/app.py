@@ -5,19 +5,39 @@ import numpy as np
 import random
 from PIL import Image
 import os
-import matplotlib.pyplot as plt
+import sys
+import time
+from contextlib import contextmanager
+
+from cluster_data import cluster_index, load_table
+from pose_search import load_pose_index
+from render_cache import (MAX_CACHE_BYTES, cache_dir_for, cluster_colors, draw_overlay,
+                          get_thumbnails, render_dataset_scatters)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))   # utils/
+import instrument
 
 st.set_page_config(layout="wide", page_title="Cluster Browser")
 
 st.title("🎥 Pose Cluster Browser")
 
+# load/render cost of this rerun, shown in the sidebar at the end
+timings = {}
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    yield
+    timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
 # 1. Sidebar: controls for loading data, selecting cluster, etc.
 st.sidebar.header("Load & Settings")
 
 csv_path = st.sidebar.text_input(
     "Path to annotations CSV:",
     value="Rat/top/annotations_with_clusters.csv",
-    help="This CSV must have columns: 'filename', 'cluster', (optionally 'tsne1','tsne2')."
+    help="CSV, Parquet or Arrow file with columns: 'filename', 'cluster', (optionally 'tsne1','tsne2'). "
+         "A CSV is converted to a .browser.parquet sidecar on first load."
 )
 image_root = st.sidebar.text_input(
     "Image folder/root path:",
@@ -30,13 +50,26 @@ if not csv_path:
     st.sidebar.error("Please specify the CSV path.")
     st.stop()
 
-# 1a. Read CSV (once)
-@st.cache_data
-def load_df(path):
-    return pd.read_csv(path)
+# 1a. Read only the needed columns (once per file version: the mtime is part of the cache key);
+# with POSE_PROFILE=<file.jsonl> set, each (uncached) load is recorded by instrument.py.
+# cache_resource hands every rerun the same object (cache_data would pickle and copy the
+# whole table each time), so the table and the index below must be treated as read-only.
+@st.cache_resource
+def load_df(path, mtime):
+    with instrument.stage("app.load_table", path=path) as rec:
+        data = load_table(path)
+        rec.add(items=len(data))
+    return data
+
+# cluster -> row positions, so every per-cluster selection is O(cluster size)
+@st.cache_resource
+def load_cluster_index(path, mtime):
+    return cluster_index(load_df(path, mtime)["cluster"].to_numpy())
 
 try:
-    df = load_df(csv_path)
+    mtime = os.stat(csv_path).st_mtime_ns
+    with timed("load data"):
+        df = load_df(csv_path, mtime)
 except FileNotFoundError:
     st.sidebar.error(f"Could not find CSV at '{csv_path}'.")
     st.stop()
@@ -48,37 +81,35 @@ if not required_cols.issubset(set(df.columns)):
     st.sidebar.write("Columns found:", df.columns.tolist())
     st.stop()
 
+with timed("cluster index"):
+    rows_by_cluster = load_cluster_index(csv_path, mtime)
+cache_dir = cache_dir_for(csv_path)
+
+# scatter images are rendered once per dataset version (and kept on disk)
+@st.cache_data
+def load_scatters(path, mtime):
+    data = load_df(path, mtime)
+    return render_dataset_scatters(path, mtime, data["tsne1"].to_numpy(), data["tsne2"].to_numpy(),
+                                   data["cluster"].to_numpy(), cache_dir_for(path))
+
 # 2. Show overall stats
 n_samples = len(df)
-n_clusters = int(df["cluster"].nunique())
+n_clusters = len(rows_by_cluster)
 st.sidebar.markdown(f"**Total frames:** {n_samples}")
 st.sidebar.markdown(f"**Number of clusters:** {n_clusters}")
 
 # 3. If tsne columns exist, show a small 2D scatter colored by cluster
-if {"tsne1", "tsne2"}.issubset(set(df.columns)):
+has_tsne = {"tsne1", "tsne2"}.issubset(set(df.columns))
+if has_tsne:
+    with timed("render scatters"):
+        overview_png, base_png, extent = load_scatters(csv_path, mtime)
     st.sidebar.markdown("### t-SNE overview")
-    # We’ll draw a small thumbnail of the entire scatter 
+    # pre-rendered thumbnail of the entire scatter
     # so users get a sense of how clusters spread.
-    fig, ax = plt.subplots(figsize=(3, 3))
-    cmap = plt.cm.get_cmap("tab10", n_clusters)
-    for cl in range(n_clusters):
-        pts = df[df["cluster"] == cl]
-        ax.scatter(
-            pts["tsne1"],
-            pts["tsne2"],
-            s=5,
-            alpha=0.6,
-            color=cmap(cl),
-            label=f"{cl}"
-        )
-    ax.set_xticks([])
-    ax.set_yticks([])
-    ax.set_title("t-SNE clusters")
-    st.sidebar.pyplot(fig)
-    st.sidebar.caption("Colored by `cluster`")
+    st.sidebar.image(overview_png, caption="t-SNE clusters, colored by `cluster`")
 
 # 4. Let user pick a cluster ID
-cluster_ids = sorted(df["cluster"].unique())
+cluster_ids = sorted(rows_by_cluster)
 sel_cluster = st.sidebar.selectbox(
     "Select a cluster to inspect:",
     cluster_ids,
@@ -86,45 +117,20 @@ sel_cluster = st.sidebar.selectbox(
 )
 
 # Re-plot t-SNE here, greying out all clusters except the selected one
-if {"tsne1", "tsne2"}.issubset(df.columns):
+if has_tsne:
     st.write("### t-SNE: only the selected cluster is colored")
 
-    # 1. Create a matplotlib figure
-    fig2, ax2 = plt.subplots(figsize=(6, 5))
-
-    # 2. Plot all points in light gray
-    ax2.scatter(
-        df["tsne1"],
-        df["tsne2"],
-        s=5,
-        color="lightgray",
-        alpha=0.5,
-        label="_nolegend_",  # no legend entry for gray points
-    )
-
-    # 3. Overlay only the selected cluster in a distinct color
-    highlight = df[df["cluster"] == sel_cluster]
-    cmap = plt.cm.get_cmap("tab10", n_clusters)
-    color_sel = cmap(sel_cluster % 10)  # pick a color for your selected cluster
-
-    ax2.scatter(
-        highlight["tsne1"],
-        highlight["tsne2"],
-        s=15,
-        color=color_sel,
-        alpha=0.8,
-        label=f"Cluster {sel_cluster}",
-    )
-
-    ax2.set_xticks([])
-    ax2.set_yticks([])
-    ax2.set_title(f"t-SNE (highlighting Cluster {sel_cluster})")
-    ax2.legend(markerscale=2, bbox_to_anchor=(1.05, 1), loc="upper left")
-    st.pyplot(fig2)
+    # cached grey scatter of all points + only the selected cluster drawn on top
+    with timed("highlight overlay"):
+        highlight = df.iloc[rows_by_cluster[sel_cluster]]
+        color_sel = cluster_colors([sel_cluster])[0]
+        overlay = draw_overlay(base_png, extent, highlight["tsne1"].to_numpy(),
+                               highlight["tsne2"].to_numpy(), color_sel)
+    st.image(overlay, caption=f"t-SNE (highlighting Cluster {sel_cluster})")
 
 
 # 5. Filter df to that cluster
-cluster_df = df[df["cluster"] == sel_cluster]
+cluster_df = df.iloc[rows_by_cluster[sel_cluster]]
 n_in_cluster = len(cluster_df)
 st.sidebar.markdown(f"Frames in Cluster {sel_cluster}: **{n_in_cluster}**")
 
@@ -133,6 +139,7 @@ if n_in_cluster == 0:
     st.stop()
 
 # 6. Show a random subset of sample images (up to 9)
+cache_mb = st.sidebar.number_input("Thumbnail cache (MB):", min_value=16, value=MAX_CACHE_BYTES >> 20, step=64)
 n_display = st.sidebar.slider(
     "Number of samples to show:",
     min_value=1,
@@ -146,13 +153,16 @@ sample_paths = cluster_df["filename"].sample(n=n_display, random_state=42).tolis
 # 7. Create columns to display images side by side
 cols = st.columns(min(n_display, 5))  # up to 5 columns per row
 
-for idx, img_name in enumerate(sample_paths):
+abs_paths = [os.path.join(image_root, img_name) for img_name in sample_paths]
+with timed("thumbnails"):
+    thumbs = get_thumbnails(abs_paths, cache_dir, max_bytes=int(cache_mb) << 20)
+
+for idx, (img_name, abs_path, thumb) in enumerate(zip(sample_paths, abs_paths, thumbs)):
     col_idx = idx % len(cols)
     with cols[col_idx]:
-        abs_path = os.path.join(image_root, img_name)
-        if os.path.isfile(abs_path):
+        if thumb is not None:
             st.image(
-                abs_path,
+                thumb,
                 caption=os.path.basename(img_name),
                 use_container_width=True,
             )
@@ -160,12 +170,59 @@ for idx, img_name in enumerate(sample_paths):
             st.write(f"❌ Not found: {img_name}")
             st.write(f"Expected at: {abs_path}")
 
+# 7a. Find similar poses: top-k neighbours of one frame from the persisted pose index
+# (built once per file version from the keypoint columns, then only loaded)
+@st.cache_resource
+def get_pose_index(path, mtime):
+    with instrument.stage("app.load_pose_index", path=path) as rec:
+        index = load_pose_index(path)
+        rec.add(items=len(index))
+    return index
+
+if st.sidebar.checkbox("Find similar poses", value=False):
+    try:
+        with timed("pose index"):
+            pose_index = get_pose_index(csv_path, mtime)
+    except (KeyError, ValueError) as e:
+        st.sidebar.error(f"Cannot build a pose index from '{csv_path}' (needs keypoint columns): {e}")
+        st.stop()
+    query_name = st.sidebar.selectbox("Frame to search from:", sample_paths)
+    query_name = st.sidebar.text_input("…or any filename:", value=query_name).strip()
+    k = st.sidebar.slider("Similar poses to show:", min_value=1, max_value=25, value=10)
+    if pose_index.row_of(query_name) is None:
+        st.warning(f"'{query_name}' is not in the pose index.")
+    else:
+        with timed("pose search"):
+            neighbours = pose_index.query(query_name, k)
+        neighbours["cluster"] = df["cluster"].to_numpy()[neighbours["row"].to_numpy()]
+        st.write(f"### {k} poses most similar to {os.path.basename(query_name)}")
+        names = [query_name] + neighbours["filename"].tolist()
+        captions = [f"query: {os.path.basename(query_name)}"] + [
+            f"{os.path.basename(f)} (d={d:.2f}, cluster {c})"
+            for f, d, c in zip(neighbours["filename"], neighbours["distance"], neighbours["cluster"])]
+        with timed("thumbnails"):
+            nn_thumbs = get_thumbnails([os.path.join(image_root, f) for f in names], cache_dir,
+                                       max_bytes=int(cache_mb) << 20)
+        nn_cols = st.columns(min(len(names), 5))
+        for idx, (name, caption, thumb) in enumerate(zip(names, captions, nn_thumbs)):
+            with nn_cols[idx % len(nn_cols)]:
+                if thumb is not None:
+                    st.image(thumb, caption=caption, use_container_width=True)
+                else:
+                    st.write(f"❌ Not found: {caption}")
+        st.dataframe(neighbours[["filename", "distance", "cluster"]])
+
 # 8. (Optional) Show filenames & any additional metadata
 if st.sidebar.checkbox("Show filenames & metadata table", value=False):
     st.write(
         cluster_df[
             ["filename", "cluster", "tsne1", "tsne2"]
-            if {"tsne1", "tsne2"}.issubset(df.columns)
+            if has_tsne
             else ["filename", "cluster"]
         ].reset_index(drop=True)
     )
+
+# 9. Timing panel: where this rerun spent its time
+with st.sidebar.expander("Timings (this rerun)"):
+    for name, seconds in timings.items():
+        st.write(f"{name}: {seconds * 1000:.1f} ms")
@@ -0,0 +1,42 @@
+## Benchmark a full t-SNE fit against fitting a cluster-stratified subsample and
+## projecting the remaining frames, with trustworthiness as a quality check.
+##   python bench_embedding.py --frames 20000 --sample 4000
+
+import argparse
+import time
+
+import numpy as np
+
+from embedding import embed
+
+
+def synthetic_features(n_frames, n_features=64, n_clusters=10, seed=0):
+    from sklearn.datasets import make_blobs
+    X, labels = make_blobs(n_frames, n_features, centers=n_clusters, cluster_std=2.0, random_state=seed)
+    return X, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full vs subsample+project 2-D embeddings.")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--sample", type=int, default=4000)
+    parser.add_argument("--method", choices=["tsne", "umap"], default="tsne")
+    parser.add_argument("--check", type=int, default=2000, help="rows used for the trustworthiness score")
+    args = parser.parse_args()
+
+    from sklearn.manifold import trustworthiness
+    X, labels = synthetic_features(args.frames)
+    check = np.random.default_rng(0).choice(len(X), min(args.check, len(X)), replace=False)
+
+    print(f"{args.frames} frames, {X.shape[1]} features, {args.method}")
+    for label, sample_size, strata in [("full fit", None, None),
+                                       (f"fit {args.sample} + project", args.sample, labels)]:
+        start = time.perf_counter()
+        emb = embed(X, args.method, sample_size=sample_size, strata=strata, cache_dir=None)
+        seconds = time.perf_counter() - start
+        score = trustworthiness(X[check], emb[check], n_neighbors=10)
+        print(f"{label:>24}: {seconds:7.2f} s  trustworthiness {score:.3f}")
+
+
+if __name__ == "__main__":
+    main()
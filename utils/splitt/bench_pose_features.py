@@ -0,0 +1,100 @@
+## Benchmark pose_features against the column-loop normalisation of splitt_dataset.ipynb
+## (cell 1: centre, scale, rotate, anchor distances) and check both give the same features.
+##   python bench_pose_features.py --frames 200000
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from pose_features import ANCHOR_JOINTS, pose_feature_frame
+
+KEYPOINTS = ANCHOR_JOINTS + [
+    "nose", "left_ear_base", "right_ear_base", "left_ear_tip", "right_ear_tip",
+    "back_withers", "back_croup", "tail_upper_midpoint", "tail_midpoint", "tail_lower_midpoint",
+]
+
+
+def synthetic_annotations(n_frames, missing_rate=0.15, seed=0):
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0, 1280, size=(n_frames, len(KEYPOINTS), 2)).round(2)
+    coords[rng.random((n_frames, len(KEYPOINTS))) < missing_rate] = np.nan
+    data = {"filename": [f"frame_{i:07d}.png" for i in range(n_frames)]}
+    for k, kp in enumerate(KEYPOINTS):
+        data[f"{kp}-x"] = coords[:, k, 0]
+        data[f"{kp}-y"] = coords[:, k, 1]
+    for col in ("bbox_tl-x", "bbox_tl-y", "bbox_br-x", "bbox_br-y"):
+        data[col] = rng.uniform(0, 1280, n_frames)
+    return pd.DataFrame(data)
+
+
+def notebook_features(df):
+    """
+    Feature table exactly as built in the notebook (cell 1, steps 1-5).
+    """
+    drop_cols = ["filename"] + [c for c in df.columns if c.startswith("bbox_")]
+    pose_df = df.drop(columns=drop_cols)
+    root_x = pose_df["back_midpoint-x"]
+    root_y = pose_df["back_midpoint-y"]
+    centred = pose_df.copy()
+    for col in pose_df.columns:
+        if col.endswith("-x"):
+            centred[col] = pose_df[col] - root_x
+        elif col.endswith("-y"):
+            centred[col] = pose_df[col] - root_y
+    dx = pose_df["head_midpoint-x"] - pose_df["tail_base-x"]
+    dy = pose_df["head_midpoint-y"] - pose_df["tail_base-y"]
+    body_len = np.sqrt(dx**2 + dy**2).replace(0, 1.0)
+    scaled = centred.div(body_len, axis=0)
+
+    tx = pose_df["tail_base-x"] - root_x
+    ty = pose_df["tail_base-y"] - root_y
+    hx = pose_df["head_midpoint-x"] - root_x
+    hy = pose_df["head_midpoint-y"] - root_y
+    theta = -np.arctan2(hy - ty, hx - tx)
+    rotated = scaled.copy()
+    cos_t, sin_t = np.cos(theta), np.sin(theta)
+    for kp in [c[:-2] for c in scaled.columns if c.endswith("-x")]:
+        x, y = scaled[f"{kp}-x"], scaled[f"{kp}-y"]
+        rotated[f"{kp}-x"] = x * cos_t - y * sin_t
+        rotated[f"{kp}-y"] = x * sin_t + y * cos_t
+
+    dist_features = {}
+    for i, ji in enumerate(ANCHOR_JOINTS):
+        for jj in ANCHOR_JOINTS[i + 1:]:
+            dx = rotated[f"{ji}-x"] - rotated[f"{jj}-x"]
+            dy = rotated[f"{ji}-y"] - rotated[f"{jj}-y"]
+            dist_features[f"dist_{ji}_{jj}"] = np.sqrt(dx**2 + dy**2)
+    return pd.concat([rotated, pd.DataFrame(dist_features)], axis=1)
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized pose features against the notebook loops.")
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_annotations(args.frames)
+    t_old, old = timed(notebook_features, df, repeat=args.repeat)
+    t_new, new = timed(pose_feature_frame, df, repeat=args.repeat)
+
+    new = new[old.columns]
+    same = np.allclose(old.to_numpy(), new.to_numpy(), equal_nan=True)
+    print(f"{args.frames} frames, {len(KEYPOINTS)} keypoints, {old.shape[1]} features")
+    print(f"  notebook loops: {t_old:7.3f} s")
+    print(f"  pose_features : {t_new:7.3f} s  ({t_old / t_new:.1f}x)")
+    print(f"  identical features: {same}")
+
+
+if __name__ == "__main__":
+    main()
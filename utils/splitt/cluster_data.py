@@ -0,0 +1,73 @@
+## Data access for the cluster browser (app.py): reads only the columns it shows from
+## Parquet/Arrow (a CSV is converted once to a Parquet sidecar, redone when the CSV
+## changes) and builds a cluster -> row indices index, so selecting a cluster costs
+## O(cluster size) instead of a full-table filter.
+
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+BROWSER_COLUMNS = ["filename", "cluster", "tsne1", "tsne2"]
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+
+
+def sidecar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".browser.parquet"
+
+
+def csv_to_parquet(csv_path, parquet_path=None, columns=BROWSER_COLUMNS):
+    """
+    Write the `columns` present in csv_path (others are never parsed) to Parquet.
+    Returns the Parquet path.
+    """
+    parquet_path = parquet_path or sidecar_path(csv_path)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        header = f.readline().rstrip("\r\n").split(",")
+    include = [c for c in columns if c in header]
+    table = pacsv.read_csv(csv_path, convert_options=pacsv.ConvertOptions(include_columns=include))
+    tmp = parquet_path + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, parquet_path)
+    return parquet_path
+
+
+def load_table(path, columns=BROWSER_COLUMNS):
+    """
+    The `columns` (those that exist) of a Parquet, Arrow IPC/Feather (memory-mapped)
+    or CSV file as a DataFrame. A CSV is read through its Parquet sidecar, which is
+    rebuilt when older than the CSV.
+    """
+    if path.endswith(".csv"):
+        parquet_path = sidecar_path(path)
+        if not os.path.isfile(parquet_path) or os.stat(parquet_path).st_mtime_ns < os.stat(path).st_mtime_ns:
+            csv_to_parquet(path, parquet_path, columns)
+        path = parquet_path
+    if path.endswith(ARROW_EXTENSIONS):
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        table = table.select([c for c in columns if c in table.column_names])
+    else:
+        names = pq.read_schema(path).names
+        table = pq.read_table(path, columns=[c for c in columns if c in names])
+    return table.to_pandas()
+
+
+def write_arrow(df, path):
+    """
+    Save a DataFrame as an uncompressed Arrow IPC file, which load_table memory-maps.
+    """
+    feather.write_feather(df, path, compression="uncompressed")
+
+
+def cluster_index(clusters):
+    """
+    {cluster id: int64 array of row positions} from one stable argsort.
+    """
+    clusters = np.asarray(clusters)
+    order = np.argsort(clusters, kind="stable")
+    values, counts = np.unique(clusters[order], return_counts=True)
+    return {v.item(): rows for v, rows in zip(values, np.split(order, np.cumsum(counts)[:-1]))}
@@ -0,0 +1,182 @@
+## K-means for the split notebook: the elbow sweep over a K range runs in a process
+## pool (one single-threaded fit per K), results (inertias, labels, centroids) are cached
+## on disk keyed by a hash of the feature matrix, the final fit warm-starts from the
+## sweep's centroids, and a mini-batch model can be updated as new annotations arrive.
+
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CACHE_DIR = ".cluster_cache"
+MODES = ["full", "minibatch"]
+K_RANGE = range(1, 25)
+
+_X = None   # feature matrix of a sweep worker, set once per process
+
+
+def feature_hash(X):
+    """
+    Content hash of a feature matrix (shape, dtype and values).
+    """
+    X = np.ascontiguousarray(X)
+    h = hashlib.sha1(f"{X.shape}{X.dtype}".encode())
+    h.update(X.data)
+    return h.hexdigest()
+
+
+def make_model(k, mode="full", random_state=42, init="k-means++", n_init="auto", batch_size=4096):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    if mode == "full":
+        return KMeans(n_clusters=k, init=init, n_init=n_init, random_state=random_state)
+    if mode == "minibatch":
+        return MiniBatchKMeans(n_clusters=k, init=init, n_init=n_init, batch_size=batch_size,
+                               random_state=random_state)
+    raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+
+
+def _init_worker(X):
+    global _X
+    from threadpoolctl import threadpool_limits
+    # one BLAS/OpenMP thread per process; the pool provides the parallelism
+    threadpool_limits(1)
+    _X = X
+
+
+def _fit_one(args):
+    k, mode, random_state, batch_size = args
+    model = make_model(k, mode, random_state, batch_size=batch_size)
+    labels = model.fit_predict(_X)
+    inertia = model.inertia_ if mode == "full" else _inertia(_X, model.cluster_centers_, labels)
+    return k, inertia, labels.astype(np.int32), model.cluster_centers_
+
+
+def _inertia(X, centers, labels):
+    # MiniBatchKMeans.inertia_ is measured on the last batches only; use the full data
+    return float(((X - centers[labels]) ** 2).sum())
+
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f"sweep_{key}.npz")
+
+
+def _sweep_key(X, k_values, mode, random_state, batch_size):
+    params = f"{list(k_values)}|{mode}|{random_state}|{batch_size if mode == 'minibatch' else ''}"
+    return hashlib.sha1((feature_hash(X) + params).encode()).hexdigest()[:20]
+
+
+def load_sweep(path):
+    with np.load(path) as data:
+        k = data["k"]
+        return {
+            "k": k,
+            "inertia": data["inertia"],
+            "labels": {int(kk): data[f"labels_{kk}"] for kk in k},
+            "centers": {int(kk): data[f"centers_{kk}"] for kk in k},
+            "cached": True,
+        }
+
+
+def save_sweep(path, result):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    arrays = {"k": result["k"], "inertia": result["inertia"]}
+    for k in result["k"]:
+        arrays[f"labels_{k}"] = result["labels"][int(k)]
+        arrays[f"centers_{k}"] = result["centers"][int(k)]
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def sweep(X, k_range=K_RANGE, mode="full", workers=None, random_state=42, batch_size=4096,
+          cache_dir=CACHE_DIR):
+    """
+    Fit one model per K in `k_range` in a process pool and return
+    {'k', 'inertia', 'labels': {k: labels}, 'centers': {k: centroids}, 'cached'}.
+    The result is stored in `cache_dir` (None disables caching) under a key made from
+    the feature hash and the sweep parameters, and reused on the next call.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    k_values = sorted(int(k) for k in k_range)
+    path = None
+    if cache_dir is not None:
+        path = _cache_path(cache_dir, _sweep_key(X, k_values, mode, random_state, batch_size))
+        if os.path.isfile(path):
+            return load_sweep(path)
+
+    jobs = [(k, mode, random_state, batch_size) for k in k_values]
+    # largest K first: they take longest, so the pool stays busy until the end
+    jobs.sort(key=lambda job: -job[0])
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(X,)) as pool:
+        fits = {k: (inertia, labels, centers) for k, inertia, labels, centers in pool.map(_fit_one, jobs)}
+
+    result = {
+        "k": np.array(k_values),
+        "inertia": np.array([fits[k][0] for k in k_values]),
+        "labels": {k: fits[k][1] for k in k_values},
+        "centers": {k: fits[k][2] for k in k_values},
+        "cached": False,
+    }
+    if path is not None:
+        save_sweep(path, result)
+    return result
+
+
+def fit_final(X, k, sweep_result=None, mode="full", random_state=42, batch_size=4096):
+    """
+    Fit the chosen K. If the sweep has centroids for `k`, they initialise a single
+    run (n_init=1), which converges in a few iterations instead of refitting from scratch.
+    Returns the fitted model.
+    """
+    init, n_init = "k-means++", "auto"
+    if sweep_result is not None and int(k) in sweep_result["centers"]:
+        init, n_init = sweep_result["centers"][int(k)], 1
+    model = make_model(k, mode, random_state, init=init, n_init=n_init, batch_size=batch_size)
+    return model.fit(X)
+
+
+def streaming_model(k, init="k-means++", random_state=42, batch_size=4096):
+    """
+    MiniBatchKMeans to be fed with update_streaming; `init` may be centroids from a sweep.
+    """
+    n_init = 1 if not isinstance(init, str) else "auto"
+    return make_model(k, "minibatch", random_state, init=init, n_init=n_init, batch_size=batch_size)
+
+
+def update_streaming(model, X, batch_size=None):
+    """
+    partial_fit `model` on X in batches (e.g. a new annotation batch); returns the model.
+    The first partial_fit needs at least n_clusters rows: until that many have arrived,
+    rows are held on the model (pickled with it by save_model) and fitted with the next
+    update.
+    """
+    batch_size = batch_size or model.batch_size
+    X = np.asarray(X, dtype=np.float64)
+    start = 0
+    if not hasattr(model, "cluster_centers_"):
+        pending = getattr(model, "_pending_rows", None)
+        if pending is not None:
+            X = np.vstack([pending, X])
+        if len(X) < model.n_clusters:
+            model._pending_rows = X
+            return model
+        model._pending_rows = None
+        start = max(batch_size, model.n_clusters)
+        model.partial_fit(X[:start])
+    for start in range(start, len(X), batch_size):
+        model.partial_fit(X[start:start + batch_size])
+    return model
+
+
+def save_model(model, path):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(model, f)
+    os.replace(tmp, path)
+
+
+def load_model(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
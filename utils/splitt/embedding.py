@@ -0,0 +1,125 @@
+## 2-D embeddings (t-SNE/UMAP) for the split notebook and the cluster browser.
+## An embedding is fitted once on a (cluster-stratified) subsample, the remaining frames
+## are placed from their nearest fitted neighbours, and the result is cached on disk
+## keyed by the feature hash and all parameters.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from clustering import feature_hash
+
+CACHE_DIR = ".embedding_cache"
+METHODS = ["tsne", "umap"]
+DEFAULT_PARAMS = {
+    "tsne": {"n_components": 2, "random_state": 42},
+    "umap": {"n_neighbors": 50, "min_dist": 0.4, "random_state": 42},
+}
+
+
+def stratified_sample(n, size, strata=None, min_per_stratum=10, random_state=42):
+    """
+    Sorted indices of `size` of `n` rows, drawn proportionally from each stratum
+    (e.g. cluster labels; at least min_per_stratum each, or the whole stratum).
+    """
+    rng = np.random.default_rng(random_state)
+    if size >= n:
+        return np.arange(n)
+    if strata is None:
+        return np.sort(rng.choice(n, size, replace=False))
+    strata = np.asarray(strata)
+    values, inverse, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    quota = np.minimum(counts, np.maximum(min_per_stratum, np.round(counts * size / n).astype(int)))
+    # rank rows within their stratum in random order, keep those below the quota
+    order = rng.permutation(n)
+    order = order[np.argsort(inverse[order], kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, counts)
+    return np.flatnonzero(rank < quota[inverse])
+
+
+def fit_embedding(X, method="tsne", params=None):
+    """
+    Fit a 2-D embedding on all rows of X.
+    """
+    params = {**DEFAULT_PARAMS[method], **(params or {})}
+    if method == "tsne":
+        from sklearn.manifold import TSNE
+        return TSNE(**params).fit_transform(X)
+    if method == "umap":
+        try:
+            from umap import UMAP
+        except ImportError:
+            raise ImportError("method='umap' needs the umap-learn package "
+                              "(pip install 'pose-estimation[umap]'); use method='tsne' otherwise") from None
+        return UMAP(**params).fit_transform(X)
+    raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+
+
+def project(X_fit, emb_fit, X_rest, n_neighbors=10):
+    """
+    Place rows of X_rest at the inverse-distance weighted mean of the embedding
+    coordinates of their n_neighbors nearest rows in X_fit.
+    """
+    from sklearn.neighbors import NearestNeighbors
+    nn = NearestNeighbors(n_neighbors=min(n_neighbors, len(X_fit))).fit(X_fit)
+    dist, idx = nn.kneighbors(X_rest)
+    weights = 1.0 / np.maximum(dist, 1e-12)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum("nk,nkd->nd", weights, emb_fit[idx])
+
+
+def _cache_key(X, method, params, sample_size, strata, n_neighbors):
+    desc = json.dumps({"method": method, "params": params, "sample_size": sample_size,
+                       "n_neighbors": n_neighbors}, sort_keys=True, default=str)
+    h = hashlib.sha1((feature_hash(X) + desc).encode())
+    if strata is not None:
+        h.update(feature_hash(np.asarray(strata)).encode())
+    return h.hexdigest()[:20]
+
+
+def embed(X, method="tsne", params=None, sample_size=None, strata=None, n_neighbors=10,
+          cache_dir=CACHE_DIR):
+    """
+    2-D embedding of X (n_rows, 2). With `sample_size`, only a subsample (stratified by
+    `strata` if given) is fitted and the other rows are projected by nearest-neighbour
+    placement. Results are stored in `cache_dir` (None disables caching) and reused
+    when features, method, params and sampling are unchanged.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    params = {**DEFAULT_PARAMS[method], **(params or {})}
+    path = None
+    if cache_dir is not None:
+        key = _cache_key(X, method, params, sample_size, strata, n_neighbors)
+        path = os.path.join(cache_dir, f"{method}_{key}.npy")
+        if os.path.isfile(path):
+            return np.load(path)
+
+    if sample_size is None or sample_size >= len(X):
+        emb = fit_embedding(X, method, params)
+    else:
+        fit_idx = stratified_sample(len(X), sample_size, strata, random_state=params.get("random_state", 42))
+        rest = np.ones(len(X), dtype=bool)
+        rest[fit_idx] = False
+        emb = np.empty((len(X), 2))
+        emb[fit_idx] = fit_embedding(X[fit_idx], method, params)
+        emb[rest] = project(X[fit_idx], emb[fit_idx], X[rest], n_neighbors)
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + ".tmp.npy"
+        np.save(tmp, emb)
+        os.replace(tmp, path)
+    return emb
+
+
+def add_embedding_columns(df, emb, prefix="tsne"):
+    """
+    Write emb[:, 0] / emb[:, 1] to '<prefix>1' / '<prefix>2' (as read by app.py); returns df.
+    """
+    df[f"{prefix}1"] = emb[:, 0]
+    df[f"{prefix}2"] = emb[:, 1]
+    return df
@@ -0,0 +1,121 @@
+## Pose normalisation features for the split notebook, computed on a
+## (n_frames, n_keypoints, 2) array instead of DataFrame column loops:
+## centre on a root joint, divide by body length, rotate the tail->head axis
+## onto +X and add pairwise distances between anchor joints.
+
+import numpy as np
+import pandas as pd
+
+ROOT_JOINT = "back_midpoint"
+SCALE_JOINTS = ("head_midpoint", "tail_base")   # body length = distance between these
+AXIS_JOINTS = ("tail_base", "head_midpoint")    # rotated onto +X (from, to)
+ANCHOR_JOINTS = [
+    "head_midpoint", "back_midpoint", "tail_base", "tail_end",
+    "front_left_paw", "front_right_paw", "back_left_paw", "back_right_paw",
+]
+
+
+def keypoint_names(columns):
+    """
+    Keypoints in column order, from '<kp>-x' columns (bbox_* excluded).
+    """
+    names = []
+    seen = set()
+    for col in columns:
+        if col.endswith("-x") and not col.startswith("bbox_"):
+            kp = col[:-2]
+            if kp not in seen:
+                seen.add(kp)
+                names.append(kp)
+    return names
+
+
+def to_array(df, keypoints=None):
+    """
+    (keypoints, float64 array of shape (n_frames, n_keypoints, 2)) from a wide
+    annotations table. Missing columns are filled with NaN.
+    """
+    keypoints = keypoint_names(df.columns) if keypoints is None else list(keypoints)
+    cols = [f"{kp}-{axis}" for kp in keypoints for axis in ("x", "y")]
+    arr = df.reindex(columns=cols).to_numpy(dtype=np.float64)
+    return keypoints, arr.reshape(len(df), len(keypoints), 2)
+
+
+def normalize_poses(arr, keypoints, root=ROOT_JOINT, scale_joints=SCALE_JOINTS,
+                    axis_joints=AXIS_JOINTS, rotate=True):
+    """
+    Centre every frame on `root`, divide by the distance between `scale_joints`
+    (0 treated as 1) and, if `rotate`, rotate so that axis_joints[0] -> axis_joints[1]
+    points along +X. Works on the whole batch at once; returns a new array.
+    Set root/scale_joints/axis_joints to None to skip that step.
+    """
+    idx = {kp: i for i, kp in enumerate(keypoints)}
+    # joint-major (K, n_frames) planes: every step below is a contiguous row-wise op
+    x = np.array(arr[..., 0].T, dtype=np.float64, order="C")
+    y = np.array(arr[..., 1].T, dtype=np.float64, order="C")
+
+    if root is not None:
+        r = idx[root]
+        x -= x[r].copy()
+        y -= y[r].copy()
+
+    if scale_joints is not None:
+        a, b = idx[scale_joints[0]], idx[scale_joints[1]]
+        body_len = np.hypot(arr[:, a, 0] - arr[:, b, 0], arr[:, a, 1] - arr[:, b, 1])
+        body_len[body_len == 0] = 1.0   # avoid divide-by-0
+        inv = 1.0 / body_len
+        x *= inv
+        y *= inv
+
+    out = np.empty(arr.shape)
+    if rotate and axis_joints is not None:
+        a, b = idx[axis_joints[0]], idx[axis_joints[1]]
+        theta = -np.arctan2(arr[:, b, 1] - arr[:, a, 1], arr[:, b, 0] - arr[:, a, 0])   # negative to rotate into +X
+        cos_t, sin_t = np.cos(theta), np.sin(theta)
+        # x' = x*cos - y*sin,  y' = x*sin + y*cos
+        out[..., 0] = (x * cos_t - y * sin_t).T
+        out[..., 1] = (x * sin_t + y * cos_t).T
+    else:
+        out[..., 0] = x.T
+        out[..., 1] = y.T
+    return out
+
+
+def pairwise_distances(arr, keypoints, joints=ANCHOR_JOINTS):
+    """
+    Distances between every pair of `joints` (in list order, i < j) for all frames.
+    Returns (feature names 'dist_<a>_<b>', array of shape (n_frames, n_pairs)).
+    """
+    idx = [keypoints.index(j) for j in joints]
+    i, j = np.triu_indices(len(idx), k=1)
+    pts = np.ascontiguousarray(arr[:, idx].transpose(2, 1, 0))   # (2, n_joints, n_frames)
+    dist = np.hypot(pts[0, i] - pts[0, j], pts[1, i] - pts[1, j]).T
+    names = [f"dist_{joints[a]}_{joints[b]}" for a, b in zip(i, j)]
+    return names, dist
+
+
+def pose_features(df, root=ROOT_JOINT, scale_joints=SCALE_JOINTS, axis_joints=AXIS_JOINTS,
+                  rotate=True, anchor_joints=ANCHOR_JOINTS, keypoints=None):
+    """
+    Feature matrix of the split notebook: normalised coordinates ('<kp>-x', '<kp>-y'
+    per keypoint) followed by anchor-joint distances (skipped if anchor_joints is
+    empty/None). Returns (feature names, float64 array (n_frames, n_features)),
+    NaNs kept for imputation.
+    """
+    keypoints, arr = to_array(df, keypoints)
+    norm = normalize_poses(arr, keypoints, root, scale_joints, axis_joints, rotate)
+    names = [f"{kp}-{axis}" for kp in keypoints for axis in ("x", "y")]
+    feats = [norm.reshape(len(df), -1)]
+    if anchor_joints:
+        dist_names, dist = pairwise_distances(norm, keypoints, anchor_joints)
+        names += dist_names
+        feats.append(dist)
+    return names, np.hstack(feats)
+
+
+def pose_feature_frame(df, **kwargs):
+    """
+    pose_features as a DataFrame aligned with df's index.
+    """
+    names, X = pose_features(df, **kwargs)
+    return pd.DataFrame(X, index=df.index, columns=names)
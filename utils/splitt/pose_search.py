@@ -0,0 +1,168 @@
+## "Find similar poses": a nearest-neighbour index over the normalised pose features of an
+## annotations table (pose_features: rotated coordinates + anchor distances, mean-imputed,
+## standardised, reduced with PCA so the KD-tree stays effective). Built once and pickled
+## next to the annotations (<name>.pose_index.pkl, rebuilt when the file changes), so the
+## cluster browser only loads it and answers a top-k query in milliseconds.
+##   python pose_search.py Rat/top/annotations_with_clusters.csv R12_20240924_M60_2_V01_F0789.png -k 10
+
+import argparse
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from pose_features import keypoint_names, pose_features
+
+N_COMPONENTS = 16      # PCA dimensions the tree is built on (all features if fewer)
+LEAF_SIZE = 40
+
+
+def index_path_for(data_path):
+    return os.path.splitext(data_path)[0] + ".pose_index.pkl"
+
+
+def _signature(data_path, params):
+    st = os.stat(data_path)
+    return {"size": st.st_size, "mtime": st.st_mtime_ns, **params}
+
+
+def _read_table(data_path):
+    if data_path.endswith(".parquet"):
+        return pd.read_parquet(data_path)
+    if data_path.endswith((".arrow", ".feather", ".ipc")):
+        return pd.read_feather(data_path)
+    return pd.read_csv(data_path)
+
+
+class PoseIndex:
+    """
+    KD-tree over the projected pose features of a table's frames. The feature
+    transform (imputation means, scaling, PCA) is kept, so frames outside the table
+    can be queried too.
+    """
+
+    def __init__(self, filenames, mean, scale, components, tree, keypoints, feature_kwargs=None):
+        self.filenames = np.asarray(filenames, dtype=object)
+        self.mean = mean
+        self.scale = scale
+        self.components = components
+        self.tree = tree
+        self.keypoints = list(keypoints)
+        self.feature_kwargs = dict(feature_kwargs or {})
+        self._rows = None
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @classmethod
+    def build(cls, df, n_components=N_COMPONENTS, leaf_size=LEAF_SIZE, **feature_kwargs):
+        """
+        Index the frames of a wide annotations table (feature_kwargs go to pose_features).
+        """
+        from sklearn.neighbors import KDTree
+        keypoints = keypoint_names(df.columns)
+        _, X = pose_features(df, keypoints=keypoints, **feature_kwargs)
+        mean = np.nanmean(X, axis=0)
+        mean = np.where(np.isnan(mean), 0.0, mean)   # never-labeled features
+        X = np.where(np.isnan(X), mean, X)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        X = (X - mean) / scale
+        n_components = min(n_components or X.shape[1], X.shape[1], len(X))
+        # principal axes from the SVD of the standardised (zero-mean) features
+        _, _, vt = np.linalg.svd(X, full_matrices=False)
+        components = vt[:n_components]
+        tree = KDTree(X @ components.T, leaf_size=leaf_size)
+        return cls(df["filename"].to_numpy(), mean, scale, components, tree, keypoints, feature_kwargs)
+
+    def transform(self, df):
+        """
+        Projected features of the frames in a wide annotations table (keypoint columns
+        the index was built with; missing ones count as unlabeled).
+        """
+        _, X = pose_features(df, keypoints=self.keypoints, **self.feature_kwargs)
+        X = np.where(np.isnan(X), self.mean, X)
+        return ((X - self.mean) / self.scale) @ self.components.T
+
+    def row_of(self, filename):
+        if self._rows is None:
+            self._rows = {f: i for i, f in enumerate(self.filenames)}
+        return self._rows.get(filename)
+
+    def query_rows(self, rows, k=10, exclude_self=True):
+        """
+        (distances, row indices), each (len(rows), k), of the nearest indexed frames to
+        indexed rows; the frame itself is left out with exclude_self.
+        """
+        rows = np.atleast_1d(rows)
+        points = np.asarray(self.tree.data)[rows]
+        extra = 1 if exclude_self else 0
+        dist, idx = self.tree.query(points, k=min(k + extra, len(self)))
+        if exclude_self:
+            # drop the query row itself (usually first; not if exact duplicates exist)
+            keep = idx != rows[:, None]
+            keep[keep.sum(axis=1) > k, -1] = False
+            dist = dist[keep].reshape(len(rows), -1)
+            idx = idx[keep].reshape(len(rows), -1)
+        return dist, idx
+
+    def query(self, filename, k=10):
+        """
+        DataFrame (filename, distance, row) of the k poses most similar to an indexed
+        frame, nearest first.
+        """
+        row = self.row_of(filename)
+        if row is None:
+            raise KeyError(f"{filename!r} is not in the pose index")
+        dist, idx = self.query_rows([row], k)
+        return pd.DataFrame({"filename": self.filenames[idx[0]], "distance": dist[0], "row": idx[0]})
+
+    def save(self, path, signature=None):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"signature": signature, "index": self}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+
+def load_pose_index(data_path, n_components=N_COMPONENTS, rebuild=False):
+    """
+    The PoseIndex of an annotations table (CSV/Parquet/Arrow with keypoint columns),
+    read from its .pose_index.pkl sidecar; built and saved when the sidecar is
+    missing, stale (the table changed) or was built with other parameters.
+    """
+    path = index_path_for(data_path)
+    signature = _signature(data_path, {"n_components": n_components, "leaf_size": LEAF_SIZE})
+    if not rebuild and os.path.isfile(path):
+        with open(path, "rb") as f:
+            stored = pickle.load(f)
+        if stored.get("signature") == signature:
+            return stored["index"]
+    index = PoseIndex.build(_read_table(data_path), n_components)
+    index.save(path, signature)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the most similar poses to a frame.")
+    parser.add_argument("annotations", help="annotations table with keypoint columns")
+    parser.add_argument("filename", nargs="?", help="frame to search from (omit to only build the index)")
+    parser.add_argument("-k", type=int, default=10, help="number of neighbours")
+    parser.add_argument("--components", type=int, default=N_COMPONENTS, help="PCA dimensions of the index")
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    index = load_pose_index(args.annotations, args.components, args.rebuild)
+    print(f"Pose index of {len(index)} frames ready in {time.perf_counter() - start:.2f} s "
+          f"({index_path_for(args.annotations)})")
+    if args.filename:
+        start = time.perf_counter()
+        result = index.query(args.filename, args.k)
+        print(f"{args.k} nearest poses ({(time.perf_counter() - start) * 1000:.1f} ms):")
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
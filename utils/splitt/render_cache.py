@@ -0,0 +1,201 @@
+## Rendering cache for the cluster browser (app.py):
+##  - thumbnails on disk, generated in a thread pool, bounded in size with LRU eviction
+##    (hits refresh the file mtime, eviction removes the oldest first);
+##  - scatter plots rasterized once per dataset to PNG, with the selected cluster drawn
+##    on top of the cached base image per rerun.
+## Pre-generate all thumbnails of a dataset:
+##   python render_cache.py Rat/top/annotations_with_clusters.csv Rat/top/images
+
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+THUMB_SIZE = (320, 180)
+MAX_CACHE_BYTES = 512 << 20
+SCATTER_PX = (600, 500)
+
+
+def cache_dir_for(data_path):
+    return os.path.join(os.path.dirname(os.path.abspath(data_path)), ".browser_cache")
+
+
+def thumb_path(cache_dir, image_path, size=THUMB_SIZE):
+    """
+    Cache file of one thumbnail; the key includes the source mtime, so edited images
+    get a new thumbnail (the stale one ages out through eviction).
+    """
+    st = os.stat(image_path)
+    key = f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{size[0]}x{size[1]}"
+    return os.path.join(cache_dir, "thumbs", hashlib.sha1(key.encode()).hexdigest() + ".jpg")
+
+
+def make_thumbnail(image_path, out_path, size=THUMB_SIZE):
+    from PIL import Image
+    with Image.open(image_path) as img:
+        img.draft("RGB", size)   # JPEG: decode at reduced scale
+        img = img.convert("RGB")
+        img.thumbnail(size)
+        tmp = out_path + ".tmp.jpg"
+        img.save(tmp, quality=85)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def evict(cache_dir, max_bytes=MAX_CACHE_BYTES):
+    """
+    Delete least recently used thumbnails until the store is below max_bytes.
+    Returns the number of files removed.
+    """
+    folder = os.path.join(cache_dir, "thumbs")
+    if not os.path.isdir(folder):
+        return 0
+    entries = [(e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in os.scandir(folder) if e.is_file()]
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def get_thumbnails(image_paths, cache_dir, size=THUMB_SIZE, workers=8, max_bytes=MAX_CACHE_BYTES):
+    """
+    Thumbnail path for every image path (None if the image does not exist).
+    Cached thumbnails are touched (LRU), missing ones are generated in parallel,
+    then the store is trimmed to max_bytes.
+    """
+    os.makedirs(os.path.join(cache_dir, "thumbs"), exist_ok=True)
+    result = [None] * len(image_paths)
+    todo = []
+    for i, path in enumerate(image_paths):
+        if not os.path.isfile(path):
+            continue
+        thumb = thumb_path(cache_dir, path, size)
+        result[i] = thumb
+        if os.path.isfile(thumb):
+            os.utime(thumb)
+        else:
+            todo.append((i, path, thumb))
+
+    def work(job):
+        i, path, thumb = job
+        try:
+            return make_thumbnail(path, thumb, size)
+        except Exception:
+            return path   # unreadable: show the original
+
+    if todo:
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            for (i, _, _), out in zip(todo, pool.map(work, todo)):
+                result[i] = out
+        evict(cache_dir, max_bytes)
+    return result
+
+
+def _extent(x, y, pad=0.03):
+    x0, x1 = np.nanmin(x), np.nanmax(x)
+    y0, y1 = np.nanmin(y), np.nanmax(y)
+    dx, dy = (x1 - x0) or 1.0, (y1 - y0) or 1.0
+    return (x0 - pad * dx, x1 + pad * dx, y0 - pad * dy, y1 + pad * dy)
+
+
+def render_scatter(x, y, colors, out_path, size_px=SCATTER_PX, point_size=5, alpha=0.6):
+    """
+    Rasterize a scatter (one draw call, per-point colors) to a PNG that fills the
+    whole image, so data coordinates map linearly to pixels. Returns the extent
+    (xmin, xmax, ymin, ymax) needed to draw overlays with draw_overlay.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    extent = _extent(x, y)
+    dpi = 100
+    fig = plt.figure(figsize=(size_px[0] / dpi, size_px[1] / dpi), dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.scatter(x, y, s=point_size, c=colors, alpha=alpha, linewidths=0)
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    ax.set_axis_off()
+    tmp = out_path + ".tmp.png"
+    fig.savefig(tmp, dpi=dpi)
+    plt.close(fig)
+    os.replace(tmp, out_path)
+    return extent
+
+
+def draw_overlay(base_png, extent, x, y, color, radius=3):
+    """
+    Copy of the cached base image with the given points drawn on top (O(len(x))).
+    """
+    from PIL import Image, ImageDraw
+    img = Image.open(base_png).convert("RGB")
+    w, h = img.size
+    px = (np.asarray(x) - extent[0]) / (extent[1] - extent[0]) * (w - 1)
+    py = (extent[3] - np.asarray(y)) / (extent[3] - extent[2]) * (h - 1)
+    fill = tuple(int(round(c * 255)) for c in color[:3])
+    draw = ImageDraw.Draw(img)
+    for cx, cy in zip(px, py):
+        if np.isfinite(cx) and np.isfinite(cy):
+            draw.ellipse((cx - radius, cy - radius, cx + radius, cy + radius), fill=fill)
+    return img
+
+
+def cluster_colors(labels):
+    """
+    RGBA per label from tab10 (label % 10), matching the highlight colors.
+    """
+    from matplotlib import colormaps
+    return colormaps["tab10"](np.asarray(labels) % 10)
+
+
+def render_dataset_scatters(data_path, mtime, x, y, labels, cache_dir):
+    """
+    Overview (colored by cluster) and grey base scatter of one dataset version,
+    rendered only if not on disk yet. Returns (overview png, base png, extent).
+    """
+    key = hashlib.sha1(f"{os.path.abspath(data_path)}|{mtime}".encode()).hexdigest()[:16]
+    folder = os.path.join(cache_dir, "scatter")
+    os.makedirs(folder, exist_ok=True)
+    overview = os.path.join(folder, f"{key}_clusters.png")
+    base = os.path.join(folder, f"{key}_grey.png")
+    extent = _extent(x, y)
+    if not os.path.isfile(overview):
+        render_scatter(x, y, cluster_colors(labels), overview, size_px=(300, 300))
+    if not os.path.isfile(base):
+        render_scatter(x, y, "lightgray", base, alpha=0.5)
+    return overview, base, extent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate the cluster browser's thumbnail cache.")
+    parser.add_argument("data_path", help="annotations CSV/Parquet/Arrow with a 'filename' column")
+    parser.add_argument("image_root")
+    parser.add_argument("--cache", help="cache folder (default: .browser_cache next to data_path)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-mb", type=int, default=MAX_CACHE_BYTES >> 20)
+    args = parser.parse_args(argv)
+
+    from cluster_data import load_table
+    names = load_table(args.data_path, ["filename"])["filename"].tolist()
+    cache_dir = args.cache or cache_dir_for(args.data_path)
+    start = time.perf_counter()
+    thumbs = get_thumbnails([os.path.join(args.image_root, n) for n in names], cache_dir,
+                            workers=args.workers, max_bytes=args.max_mb << 20)
+    found = sum(t is not None for t in thumbs)
+    print(f"{found} thumbnails ready in {cache_dir} ({len(names) - found} images not found) "
+          f"in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
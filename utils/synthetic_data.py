@@ -0,0 +1,255 @@
+## Synthetic rat-skeleton datasets for benchmarks and tests: annotations.csv in the project's
+## wide layout (filename, <kp>-x/-y for the RatSkeleton keypoints of add_missing_keypoints.groups,
+## bbox_*), missing keypoints as empty cells, filenames that extract_id maps to subjects,
+## plus matching dummy frames in <out>/Images. Poses come from a top-view body template
+## (random position, heading, size, tail bend and jitter); rows are generated and written
+## in chunks, so 1M frames need no more memory than one chunk.
+##   python synthetic_data.py /tmp/synth --frames 100000 --subjects 40 --images link
+##   python synthetic_data.py /tmp/synth_small --frames 1000 --images render --image-size 1920x1080
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from add_missing_keypoints import groups
+from csv_to_xml import BBOX_COLUMNS
+from image_staging import stage_images
+
+RAT_SKELETON = [kp for group in groups for kp in group]
+IMAGE_SIZE = (1280, 720)
+CHUNK_ROWS = 100_000
+IMAGE_MODES = ["render", "link", "none"]
+
+# top-view body template in body lengths (head_midpoint <-> tail_base = 0.83):
+# x along the spine (tail -> head), y to the animal's left
+TEMPLATE = {
+    "nose": (0.62, 0.0), "left_eye": (0.50, 0.06), "left_ear_tip": (0.38, 0.14),
+    "left_ear_base": (0.40, 0.07), "head_midpoint": (0.45, 0.0),
+    "right_eye": (0.50, -0.06), "right_ear_base": (0.40, -0.07), "right_ear_tip": (0.38, -0.14),
+    "chest": (0.25, 0.0), "throat": (0.35, 0.0), "lower_jaw": (0.52, 0.0),
+    "back_withers": (0.22, 0.0), "back_midpoint": (0.0, 0.0), "back_croup": (-0.20, 0.0),
+    "tail_base": (-0.38, 0.0), "tail_upper_midpoint": (-0.55, 0.0), "tail_midpoint": (-0.72, 0.0),
+    "tail_lower_midpoint": (-0.88, 0.0), "tail_end": (-1.05, 0.0),
+    "back_right_hip": (-0.22, -0.12), "back_right_knee": (-0.15, -0.18),
+    "back_right_wrist": (-0.28, -0.20), "back_right_paw": (-0.25, -0.24),
+    "back_left_hip": (-0.22, 0.12), "back_left_knee": (-0.15, 0.18),
+    "back_left_wrist": (-0.28, 0.20), "back_left_paw": (-0.25, 0.24),
+    "front_left_shoulder": (0.20, 0.10), "front_left_elbow": (0.15, 0.15),
+    "front_left_paw": (0.30, 0.18), "front_left_wrist": (0.27, 0.16),
+    "front_right_shoulder": (0.20, -0.10), "front_right_elbow": (0.15, -0.15),
+    "front_right_paw": (0.30, -0.18), "front_right_wrist": (0.27, -0.16),
+}
+TAIL = ["tail_upper_midpoint", "tail_midpoint", "tail_lower_midpoint", "tail_end"]
+PAWS = ["front_left_paw", "front_right_paw", "back_left_paw", "back_right_paw"]
+
+
+def subject_names(n_subjects, seed=0):
+    """
+    Subject IDs in the recording layout extract_id returns (<date>_M<minute>_<camera>_V<video>).
+    """
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, 60, n_subjects)
+    return [f"{20240901 + int(d) % 30:08d}_M{int(m)}_{1 + i % 2}_V{1 + i // 2:02d}"
+            for i, (d, m) in enumerate(zip(days, rng.integers(1, 120, n_subjects)))]
+
+
+def synthetic_poses(n, keypoints=RAT_SKELETON, image_size=IMAGE_SIZE, body_length=(150, 260), seed=0):
+    """
+    (n, len(keypoints), 2) float64 pixel coordinates of random top-view rat poses that
+    stay inside the image.
+    """
+    rng = np.random.default_rng(seed)
+    template = np.array([TEMPLATE.get(kp, (0.0, 0.0)) for kp in keypoints])
+    pose = np.broadcast_to(template, (n, *template.shape)).copy()
+    # tail bend: lateral offset growing along the tail
+    tail = [keypoints.index(kp) for kp in TAIL if kp in keypoints]
+    bend = rng.normal(0, 0.15, n)
+    for step, k in enumerate(tail, start=1):
+        pose[:, k, 1] += bend * (step / len(TAIL)) ** 2
+    # stride: paws move forward/back in diagonal pairs
+    phase = rng.uniform(-1, 1, n)
+    for kp, sign in zip(PAWS, (1, -1, -1, 1)):
+        if kp in keypoints:
+            pose[:, keypoints.index(kp), 0] += 0.06 * sign * phase
+    pose += rng.normal(0, 0.015, pose.shape)
+
+    length = rng.uniform(*body_length, n)
+    theta = rng.uniform(-np.pi, np.pi, n)
+    cos_t, sin_t = np.cos(theta)[:, None], np.sin(theta)[:, None]
+    x = (pose[..., 0] * cos_t - pose[..., 1] * sin_t) * length[:, None]
+    y = (pose[..., 0] * sin_t + pose[..., 1] * cos_t) * length[:, None]
+    # place the body so that all keypoints fall inside the frame
+    w, h = image_size
+    lo_x, hi_x = -x.min(axis=1), w - x.max(axis=1)
+    lo_y, hi_y = -y.min(axis=1), h - y.max(axis=1)
+    cx = lo_x + rng.random(n) * np.maximum(hi_x - lo_x, 0)
+    cy = lo_y + rng.random(n) * np.maximum(hi_y - lo_y, 0)
+    out = np.stack([x + cx[:, None], y + cy[:, None]], axis=-1)
+    out[..., 0] = out[..., 0].clip(0, w - 1)
+    out[..., 1] = out[..., 1].clip(0, h - 1)
+    return out
+
+
+def synthetic_chunk(start, n, subjects, frames_per_subject, keypoints=RAT_SKELETON, image_size=IMAGE_SIZE,
+                    missing_rate=0.1, group_missing_rate=0.03, always_missing=(), prefix="R1",
+                    bbox_margin=10.0, seed=0):
+    """
+    Rows start..start+n of a synthetic annotations table (wide layout). Rows are
+    assigned to subjects in blocks of frames_per_subject, so each subject's frames
+    are contiguous like extracted videos.
+    """
+    rng = np.random.default_rng([seed, start])
+    coords = synthetic_poses(n, keypoints, image_size, seed=[seed, start, 1])
+    rows = np.arange(start, start + n)
+    subject = np.minimum(rows // frames_per_subject, len(subjects) - 1)
+    frame = (rows - subject * frames_per_subject) * 5
+    filenames = [f"{prefix}_{subjects[s]}_F{f:04d}.png" for s, f in zip(subject, frame)]
+
+    # bbox from all keypoints (before dropping the missing ones), clipped to the frame
+    w, h = image_size
+    lo = coords.min(axis=1) - bbox_margin
+    hi = coords.max(axis=1) + bbox_margin
+    bbox = np.column_stack([lo[:, 0].clip(0, w), lo[:, 1].clip(0, h), hi[:, 0].clip(0, w), hi[:, 1].clip(0, h)])
+
+    missing = rng.random((n, len(keypoints))) < missing_rate
+    kp_group = np.array([next(i for i, g in enumerate(groups) if kp in g) if any(kp in g for g in groups) else -1
+                         for kp in keypoints])
+    occluded = rng.random((n, len(groups))) < group_missing_rate
+    missing |= np.where(kp_group >= 0, occluded[:, kp_group.clip(0)], False)
+    missing[:, [keypoints.index(kp) for kp in always_missing if kp in keypoints]] = True
+    coords[missing] = np.nan
+
+    df = pd.DataFrame(coords.reshape(n, -1).round(2),
+                      columns=[f"{kp}-{axis}" for kp in keypoints for axis in ("x", "y")])
+    df.insert(0, "filename", filenames)
+    df[BBOX_COLUMNS] = bbox.round(2)
+    return df
+
+
+def write_annotations(path, n_frames, n_subjects=40, chunk_rows=CHUNK_ROWS, seed=0, **kwargs):
+    """
+    Write a synthetic annotations.csv of n_frames rows chunk by chunk (atomically).
+    kwargs go to synthetic_chunk. Returns the subject IDs.
+    """
+    subjects = subject_names(n_subjects, seed)
+    per_subject = -(-n_frames // n_subjects)
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        for start in range(0, max(n_frames, 1), chunk_rows):
+            n = min(chunk_rows, n_frames - start)
+            chunk = synthetic_chunk(start, n, subjects, per_subject, seed=seed, **kwargs)
+            chunk.to_csv(f, header=start == 0, index=False, lineterminator="\n")
+    os.replace(tmp, path)
+    return subjects
+
+
+def render_frame(job):
+    """
+    Draw one dummy frame (grey floor, keypoints as dots) and write it atomically.
+    """
+    import cv2
+    path, points, size, seed = job
+    rng = np.random.default_rng(seed)
+    w, h = size
+    img = np.full((h, w, 3), 90, dtype=np.uint8)
+    img += rng.integers(0, 20, (-(-h // 8), -(-w // 8), 1), dtype=np.uint8).repeat(8, 0).repeat(8, 1)[:h, :w]
+    for x, y in points:
+        if np.isfinite(x) and np.isfinite(y):
+            cv2.circle(img, (int(x), int(y)), max(2, w // 300), (230, 230, 230), -1)
+    base, ext = os.path.splitext(path)
+    tmp = f"{base}.tmp{ext}"
+    cv2.imwrite(tmp, img)
+    os.replace(tmp, path)
+    return path
+
+
+def write_images(csv_path, image_folder, mode="render", image_size=IMAGE_SIZE, workers=None, chunk_rows=CHUNK_ROWS):
+    """
+    Dummy frames for every row of an annotations CSV. 'render' draws each frame with
+    its keypoints (process pool), 'link' writes one frame and hardlinks it to every
+    filename (no extra disk, for file-handling benchmarks). Returns the number of images.
+    """
+    if mode == "none":
+        return 0
+    os.makedirs(image_folder, exist_ok=True)
+    count = 0
+    # next to (not in) the image folder, on the same file system for hardlinks
+    template = os.path.join(os.path.dirname(os.path.abspath(image_folder)), ".synthetic_template.png")
+    if mode == "link":
+        render_frame((template, [], image_size, 0))
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        names = chunk["filename"].tolist()
+        if mode == "link":
+            stage_images([(template, os.path.join(image_folder, name)) for name in names], "hardlink")
+        else:
+            x_cols = [c for c in chunk.columns if c.endswith("-x") and not c.startswith("bbox_")]
+            xy = np.stack([chunk[x_cols].to_numpy(), chunk[[c[:-2] + "-y" for c in x_cols]].to_numpy()], axis=-1)
+            jobs = [(os.path.join(image_folder, name), pts, image_size, count + i)
+                    for i, (name, pts) in enumerate(zip(names, xy))]
+            with ProcessPoolExecutor(workers) as pool:
+                for _ in pool.map(render_frame, jobs, chunksize=64):
+                    pass
+        count += len(names)
+    return count
+
+
+def make_dataset(out_dir, n_frames, n_subjects=40, images="link", image_size=IMAGE_SIZE, workers=None,
+                 seed=0, **kwargs):
+    """
+    <out_dir>/annotations.csv plus <out_dir>/Images (the layout create_dlc_structure
+    reads). Returns a report with paths, counts and seconds.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    csv_path = os.path.join(out_dir, "annotations.csv")
+    subjects = write_annotations(csv_path, n_frames, n_subjects, seed=seed, image_size=image_size, **kwargs)
+    t_csv = time.perf_counter() - start
+    image_folder = os.path.join(out_dir, "Images")
+    n_images = write_images(csv_path, image_folder, images, image_size, workers)
+    return {
+        "annotations": csv_path,
+        "images": image_folder,
+        "frames": n_frames,
+        "subjects": len(subjects),
+        "keypoints": len(kwargs.get("keypoints", RAT_SKELETON)),
+        "image_count": n_images,
+        "image_size": list(image_size),
+        "seconds": {"annotations": t_csv, "images": time.perf_counter() - start - t_csv},
+    }
+
+
+def _parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic rat-skeleton annotations set with dummy frames.")
+    parser.add_argument("out_dir", help="folder for annotations.csv and Images/")
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--subjects", type=int, default=40)
+    parser.add_argument("--missing-rate", type=float, default=0.1, help="chance of a keypoint being unlabeled")
+    parser.add_argument("--group-missing-rate", type=float, default=0.03, help="chance of a whole keypoint group being unlabeled")
+    parser.add_argument("--always-missing", nargs="*", default=[], help="keypoints that are never labeled")
+    parser.add_argument("--images", choices=IMAGE_MODES, default="link")
+    parser.add_argument("--image-size", type=_parse_size, default=IMAGE_SIZE, help="WIDTHxHEIGHT (default 1280x720)")
+    parser.add_argument("--prefix", default="R1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="processes for --images render")
+    args = parser.parse_args(argv)
+
+    report = make_dataset(args.out_dir, args.frames, args.subjects, args.images, args.image_size, args.workers,
+                          args.seed, missing_rate=args.missing_rate, group_missing_rate=args.group_missing_rate,
+                          always_missing=args.always_missing, prefix=args.prefix)
+    print(f"{report['frames']} frames of {report['subjects']} subjects ({report['keypoints']} keypoints) "
+          f"-> {report['annotations']} in {report['seconds']['annotations']:.1f} s")
+    if report["image_count"]:
+        print(f"{report['image_count']} {args.images} images -> {report['images']} in {report['seconds']['images']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
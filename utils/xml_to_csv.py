@@ -0,0 +1,321 @@
+## CVAT XML -> annotations.csv: streams a CVAT <annotations> export through the expat
+## parser (a target callback per start tag, no element tree) and fills preallocated
+## NumPy chunks (one row per <image>, one column pair per keypoint), so memory stays
+## constant however large the export is. Coordinates are copied as text, so CSV -> XML
+## (csv_to_xml.py) -> CSV gives back the same file. Without --like the columns grow with
+## every label seen (also outside="1" points); a label first seen after the CSV header
+## was written makes one extra pass over the output to fill in its columns. Points with
+## outside="1" become empty cells; the "Bounding Box" <box> fills bbox_*.
+##   python xml_to_csv.py Rat/top/annotations.xml Rat/top/annotations.csv
+##   python xml_to_csv.py corrected.xml Rat/top/annotations_corrected.csv --like Rat/top/annotations.csv
+
+import argparse
+import csv
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+from csv_to_xml import BBOX_COLUMNS
+
+BBOX_LABEL = "Bounding Box"
+BOX_ATTRS = ("xtl", "ytl", "xbr", "ybr")
+SIZE_COLUMNS = ["width", "height"]
+CHUNK_ROWS = 8192
+READ_BYTES = 1 << 20
+
+
+class _Layout:
+    """
+    Column positions of the wide table: filename, <kp>-x/-y pairs, bbox_* (and width/height
+    when the given columns have them). Without given columns (not fixed), unseen keypoint
+    labels and the bbox columns are appended on first use, at any point of the file.
+    """
+
+    def __init__(self, columns=None):
+        self.columns = ["filename"] if columns is None else list(columns)
+        if self.columns[:1] != ["filename"]:
+            raise ValueError("The first column must be 'filename'")
+        self.fixed = columns is not None
+        self.skipped = {}    # label -> points dropped because the layout has no column for them
+        index = {c: i for i, c in enumerate(self.columns)}
+        # label -> column of <label>-x (y is the next column)
+        self.points = {c[:-2]: i for i, c in enumerate(self.columns)
+                       if c.endswith("-x") and c not in BBOX_COLUMNS and index.get(c[:-2] + "-y") == i + 1}
+        self.box = index[BBOX_COLUMNS[0]] if all(c in index for c in BBOX_COLUMNS) else None
+        self.size = index["width"] if all(c in index for c in SIZE_COLUMNS) else None
+
+    def _add(self, names):
+        start = len(self.columns)
+        self.columns.extend(names)
+        return start
+
+    def point_column(self, label):
+        col = self.points.get(label)
+        if col is None:
+            if self.fixed:
+                self.skipped[label] = self.skipped.get(label, 0) + 1
+                return None
+            col = self.points[label] = self._add([f"{label}-x", f"{label}-y"])
+        return col
+
+    def box_column(self):
+        if self.box is None:
+            if self.fixed:
+                self.skipped[BBOX_LABEL] = self.skipped.get(BBOX_LABEL, 0) + 1
+                return None
+            self.box = self._add(BBOX_COLUMNS)
+        return self.box
+
+    def output_order(self):
+        """
+        Column permutation for output: given columns as they are, a derived layout as
+        filename, keypoints (in order of appearance), bbox_* like annotations.csv.
+        """
+        if self.fixed:
+            return np.arange(len(self.columns))
+        order = [0] + [c for col in self.points.values() for c in (col, col + 1)]
+        if self.box is not None:
+            order += range(self.box, self.box + len(BBOX_COLUMNS))
+        return np.array(order)
+
+
+def _new_chunk(rows, n_cols):
+    return np.full((rows, n_cols), "", dtype=object)
+
+
+def _widen(chunk, n_cols):
+    if chunk.shape[1] < n_cols:
+        chunk = np.hstack([chunk, _new_chunk(len(chunk), n_cols - chunk.shape[1])])
+    return chunk
+
+
+class _ChunkTarget:
+    """
+    Parser target filling preallocated chunks straight from start tags: expat hands
+    over each tag's attributes, no Element objects or tree are created. An <image>
+    starts a row; the points/box that follow belong to it.
+    """
+
+    def __init__(self, layout, chunk_rows):
+        self.layout = layout
+        self.chunk_rows = chunk_rows
+        self.ready = []
+        self._new()
+
+    def _new(self):
+        self.chunk = _new_chunk(self.chunk_rows, len(self.layout.columns))
+        self.sizes = _new_chunk(self.chunk_rows, 2)
+        self.row = -1
+
+    def _flush(self):
+        n = self.row + 1
+        if n:
+            self.ready.append(_output(self.chunk[:n], self.sizes[:n], self.layout))
+        self._new()
+
+    def start(self, tag, attrib):
+        if tag == "points":
+            if self.row < 0:
+                return
+            # register the label even for outside points, so all-outside keypoints keep their columns
+            col = self.layout.point_column(attrib.get("label"))
+            if col is None or attrib.get("outside", "0") == "1":
+                return
+            if col + 1 >= self.chunk.shape[1]:
+                self.chunk = _widen(self.chunk, len(self.layout.columns))
+            # a points shape holds "x1,y1;x2,y2;..."; a skeleton point has exactly one pair
+            x, _, y = attrib.get("points", "").partition(";")[0].partition(",")
+            self.chunk[self.row, col] = x.strip()
+            self.chunk[self.row, col + 1] = y.strip()
+        elif tag == "box":
+            if self.row < 0 or attrib.get("label") != BBOX_LABEL:
+                return
+            col = self.layout.box_column()
+            if col is None:
+                return
+            self.chunk = _widen(self.chunk, len(self.layout.columns))
+            for i, name in enumerate(BOX_ATTRS):
+                self.chunk[self.row, col + i] = attrib.get(name, "")
+        elif tag == "image":
+            if self.row + 1 == self.chunk_rows:
+                self._flush()
+            self.row += 1
+            self.chunk[self.row, 0] = attrib.get("name", "")
+            self.sizes[self.row, 0] = attrib.get("width", "")
+            self.sizes[self.row, 1] = attrib.get("height", "")
+
+    def close(self):
+        self._flush()
+
+    def take(self):
+        ready, self.ready = self.ready, []
+        return ready
+
+
+def iter_cvat_chunks(xml_path, columns=None, chunk_rows=CHUNK_ROWS, layout=None, read_bytes=READ_BYTES):
+    """
+    Stream the <image> elements of a CVAT export as (columns, text, sizes) chunks:
+    `text` is a (rows, len(columns)) object array of attribute strings ("" where
+    missing), `sizes` a (rows, 2) object array of the width/height attributes.
+
+    With `columns` (e.g. the header of the CSV the export was made from) the layout is
+    fixed; points of other labels and boxes without bbox_* columns are dropped and
+    counted in layout.skipped. Otherwise every label seen so far has columns
+    (keypoints in order of appearance, then bbox_*), so a later chunk can have more
+    columns than an earlier one; consumers align chunks by column name.
+    The file is fed to the parser in blocks of `read_bytes`, so memory is bounded by
+    one block plus one chunk.
+    """
+    layout = layout or _Layout(columns)
+    target = _ChunkTarget(layout, chunk_rows)
+    parser = ET.XMLParser(target=target)
+    with open(xml_path, "rb") as f:
+        for block in iter(lambda: f.read(read_bytes), b""):
+            parser.feed(block)
+            yield from target.take()
+    parser.close()
+    yield from target.take()
+
+
+def _output(chunk, sizes, layout):
+    chunk = _widen(chunk, len(layout.columns))
+    if layout.size is not None:
+        chunk[:, layout.size:layout.size + 2] = sizes
+    order = layout.output_order()
+    return [layout.columns[i] for i in order], chunk[:, order], sizes
+
+
+def xml_to_csv(xml_path, csv_path, columns=None, with_sizes=False, chunk_rows=CHUNK_ROWS):
+    """
+    Write the wide annotations CSV of a CVAT export chunk by chunk. Cells are the
+    attribute texts, so for an export made by csv_to_xml from a pandas-written CSV
+    (pass its header as `columns` to keep its keypoint order) the result is the
+    original file. `with_sizes` appends width/height columns if `columns` has none.
+    If labels first appear after the header was written, the file is rewritten once
+    with the final columns (empty cells for the earlier rows).
+    Returns a report with images, columns and skipped labels.
+    """
+    layout = _Layout(columns)
+    append_sizes = with_sizes and layout.size is None
+    n_images = 0
+    header = None
+    segments = []    # (columns, rows) per run of chunks written with the same columns
+    tmp = csv_path + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        for cols, text, sizes in iter_cvat_chunks(xml_path, columns, chunk_rows, layout):
+            cols = cols + SIZE_COLUMNS if append_sizes else list(cols)
+            if header is None:
+                header = cols
+                writer.writerow(header)
+            if not segments or segments[-1][0] != cols:
+                segments.append((cols, 0))
+            segments[-1] = (cols, segments[-1][1] + len(text))
+            if append_sizes:
+                text = np.hstack([text, sizes])
+            writer.writerows(text.tolist())
+            n_images += len(text)
+        if header is None:
+            cols = [layout.columns[i] for i in layout.output_order()]
+            header = cols + SIZE_COLUMNS if append_sizes else cols
+            writer.writerow(header)
+    if len(segments) > 1:
+        header = segments[-1][0]
+        _realign(tmp, segments, header)
+    os.replace(tmp, csv_path)
+    return {"images": n_images, "columns": header, "skipped": dict(layout.skipped)}
+
+
+def _realign(path, segments, header, block_rows=CHUNK_ROWS):
+    """
+    Rewrite a CSV whose rows were written in several column layouts (segments of
+    (columns, rows)) with `header`, a superset of every segment's columns.
+    """
+    out_path = path + ".realign"
+    with open(path, newline="", encoding="utf-8") as src, \
+            open(out_path, "w", newline="", encoding="utf-8") as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst, lineterminator="\n")
+        next(reader)
+        writer.writerow(header)
+        for cols, n_rows in segments:
+            pos = {c: i for i, c in enumerate(cols)}
+            # output column -> column of this segment (the extra last column is always "")
+            take = np.array([pos.get(c, len(cols)) for c in header])
+            for start in range(0, n_rows, block_rows):
+                rows = [next(reader) + [""] for _ in range(min(block_rows, n_rows - start))]
+                writer.writerows(np.array(rows, dtype=object)[:, take].tolist())
+    os.replace(out_path, path)
+
+
+def _to_float(text):
+    """
+    Object array of numeric strings -> float64, NaN for "" (one vectorized conversion).
+    """
+    text = np.asarray(text, dtype=str)
+    return np.where(text == "", "nan", text).astype(np.float64)
+
+
+def read_cvat_xml(xml_path, columns=None, chunk_rows=CHUNK_ROWS):
+    """
+    The wide table of a CVAT export as a DataFrame (coordinates float64, NaN where
+    missing) and the image sizes as a DataFrame (filename, width, height; the
+    image_sizes argument of csv_to_xml). Each chunk is converted to numbers as soon
+    as it is parsed, so only the numeric table is kept; columns of labels first seen
+    in a later chunk are NaN for the earlier rows.
+    With `columns`, points or boxes that have no column raise a ValueError instead of
+    being dropped.
+    """
+    layout = _Layout(columns)
+    filenames, blocks, sizes = [], [], []
+    for cols, text, wh in iter_cvat_chunks(xml_path, columns, chunk_rows, layout):
+        numeric = [i for i, c in enumerate(cols) if c != "filename" and c not in SIZE_COLUMNS]
+        filenames.append(text[:, 0])
+        blocks.append(([cols[i] for i in numeric], _to_float(text[:, numeric])))
+        sizes.append(_to_float(wh))
+    if layout.skipped:
+        found = ", ".join(f"{label} ({count})" for label, count in sorted(layout.skipped.items()))
+        raise ValueError(f"{xml_path} has labels without a column in the given layout: {found}")
+    numeric_cols = [layout.columns[i] for i in layout.output_order()
+                    if layout.columns[i] != "filename" and layout.columns[i] not in SIZE_COLUMNS]
+    filenames = np.concatenate(filenames) if filenames else np.array([], dtype=object)
+    aligned = []
+    for cols, block in blocks:
+        if cols != numeric_cols:
+            pos = {c: i for i, c in enumerate(cols)}
+            block = np.column_stack([block, np.full(len(block), np.nan)])[
+                :, [pos.get(c, len(cols)) for c in numeric_cols]]
+        aligned.append(block)
+    values = np.vstack(aligned) if aligned else np.empty((0, len(numeric_cols)))
+    df = pd.DataFrame(values, columns=numeric_cols)
+    df.insert(0, "filename", filenames)
+    wh = np.vstack(sizes) if sizes else np.empty((0, 2))
+    image_sizes = pd.DataFrame({"filename": filenames, "width": wh[:, 0], "height": wh[:, 1]})
+    image_sizes = image_sizes.dropna().astype({"width": "int64", "height": "int64"})
+    return df, image_sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a CVAT XML export back to the wide annotations.csv.")
+    parser.add_argument("xml_path", help="CVAT <annotations> export")
+    parser.add_argument("csv_path", help="annotations CSV to write")
+    parser.add_argument("--like", help="CSV whose header (column order, keypoints) the output should use")
+    parser.add_argument("--sizes", action="store_true", help="also write width/height columns")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    columns = None
+    if args.like:
+        with open(args.like, newline="", encoding="utf-8") as f:
+            columns = next(csv.reader(f))
+    report = xml_to_csv(args.xml_path, args.csv_path, columns, args.sizes, args.chunk_rows)
+    n_kp = sum(c.endswith("-x") and c not in BBOX_COLUMNS for c in report["columns"])
+    print(f"Annotations CSV written to: {args.csv_path} ({report['images']} images, {n_kp} keypoints)")
+    for label, count in sorted(report["skipped"].items()):
+        print(f"  skipped {count} shapes of label '{label}' (not in the column layout)")
+
+
+if __name__ == "__main__":
+    main()